@@ -1,50 +1,68 @@
 #!/usr/bin/env /workspace/tmp_windsurf/venv/bin/python3
 
-import google.generativeai as genai
-from openai import OpenAI, AzureOpenAI
-from anthropic import Anthropic
+# Provider SDKs (openai, anthropic, google.generativeai) are imported on first use of that
+# provider, so importing this module or using one provider doesn't pay for the others.
 import argparse
 import os
-from dotenv import load_dotenv
 from pathlib import Path
 import sys
 import base64
-from typing import Optional, Union, List
+import threading
+from typing import Iterator, Optional, Union, List
 import mimetypes
+import json
+import time
 
-def load_environment():
-    """Load environment variables from .env files in order of precedence"""
+try:
+    from .llm_cache import ResponseCache, request_key
+except ImportError:  # run as a script: python tools/llm_api.py
+    from llm_cache import ResponseCache, request_key
+
+PROVIDERS = ['openai', 'anthropic', 'gemini', 'local', 'deepseek', 'azure']
+
+# Idle connections kept open by the shared clients (see get_llm_client)
+KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 30.0  # seconds
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+def load_environment(verbose: Optional[bool] = None):
+    """
+    Load environment variables from .env files in order of precedence.
+    
+    Runs once per process; later calls return immediately. Quiet unless verbose is set
+    (or LLM_API_VERBOSE=1), in which case it reports which files and keys were loaded.
+    """
     # Order of precedence:
     # 1. System environment variables (already loaded)
     # 2. .env.local (user-specific overrides)
     # 3. .env (project defaults)
     # 4. .env.example (example configuration)
-    
-    env_files = ['.env.local', '.env', '.env.example']
-    env_loaded = False
-    
-    print("Current working directory:", Path('.').absolute(), file=sys.stderr)
-    print("Looking for environment files:", env_files, file=sys.stderr)
-    
-    for env_file in env_files:
-        env_path = Path('.') / env_file
-        print(f"Checking {env_path.absolute()}", file=sys.stderr)
-        if env_path.exists():
-            print(f"Found {env_file}, loading variables...", file=sys.stderr)
-            load_dotenv(dotenv_path=env_path)
-            env_loaded = True
-            print(f"Loaded environment variables from {env_file}", file=sys.stderr)
-            # Print loaded keys (but not values for security)
-            with open(env_path) as f:
-                keys = [line.split('=')[0].strip() for line in f if '=' in line and not line.startswith('#')]
-                print(f"Keys loaded from {env_file}: {keys}", file=sys.stderr)
-    
-    if not env_loaded:
-        print("Warning: No .env files found. Using system environment variables only.", file=sys.stderr)
-        print("Available system environment variables:", list(os.environ.keys()), file=sys.stderr)
-
-# Load environment variables at module import
-load_environment()
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if _env_loaded:
+            return
+        if verbose is None:
+            verbose = os.getenv('LLM_API_VERBOSE', '').lower() in ('1', 'true', 'yes', 'on')
+        
+        env_files = ['.env.local', '.env', '.env.example']
+        found = [env_file for env_file in env_files if (Path('.') / env_file).exists()]
+        if found:
+            from dotenv import dotenv_values
+            for env_file in found:
+                values = dotenv_values(Path('.') / env_file)
+                for key, value in values.items():
+                    if value is not None:
+                        os.environ.setdefault(key, value)
+                if verbose:
+                    # Print loaded keys (but not values for security)
+                    print(f"Loaded environment variables from {Path(env_file).absolute()}: {list(values)}", file=sys.stderr)
+        elif verbose:
+            print(f"No .env files found in {Path('.').absolute()}. Using system environment variables only.", file=sys.stderr)
+        _env_loaded = True
 
 def encode_image_file(image_path: str) -> tuple[str, str]:
     """
@@ -65,162 +83,451 @@ def encode_image_file(image_path: str) -> tuple[str, str]:
         
     return encoded_string, mime_type
 
-def create_llm_client(provider="openai"):
+def _require_env(name: str) -> str:
+    load_environment()
+    value = os.getenv(name)
+    if not value:
+        raise ValueError(f"{name} not found in environment variables")
+    return value
+
+def create_llm_client(provider="openai", http_client=None):
+    """
+    Create a new client for a provider. Prefer get_llm_client(), which reuses one.
+    
+    Args:
+        provider (str): The API provider to use
+        http_client (httpx.Client, optional): Connection pool for the openai/anthropic SDKs
+    """
     if provider == "openai":
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment variables")
+        from openai import OpenAI
         return OpenAI(
-            api_key=api_key
+            api_key=_require_env('OPENAI_API_KEY'),
+            http_client=http_client
         )
     elif provider == "azure":
-        api_key = os.getenv('AZURE_OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("AZURE_OPENAI_API_KEY not found in environment variables")
+        from openai import AzureOpenAI
         return AzureOpenAI(
-            api_key=api_key,
+            api_key=_require_env('AZURE_OPENAI_API_KEY'),
             api_version="2024-08-01-preview",
-            azure_endpoint="https://msopenai.openai.azure.com"
+            azure_endpoint="https://msopenai.openai.azure.com",
+            http_client=http_client
         )
     elif provider == "deepseek":
-        api_key = os.getenv('DEEPSEEK_API_KEY')
-        if not api_key:
-            raise ValueError("DEEPSEEK_API_KEY not found in environment variables")
+        from openai import OpenAI
         return OpenAI(
-            api_key=api_key,
+            api_key=_require_env('DEEPSEEK_API_KEY'),
             base_url="https://api.deepseek.com/v1",
+            http_client=http_client
         )
     elif provider == "anthropic":
-        api_key = os.getenv('ANTHROPIC_API_KEY')
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
+        from anthropic import Anthropic
         return Anthropic(
-            api_key=api_key
+            api_key=_require_env('ANTHROPIC_API_KEY'),
+            http_client=http_client
         )
     elif provider == "gemini":
-        api_key = os.getenv('GOOGLE_API_KEY')
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        api_key = _require_env('GOOGLE_API_KEY')
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
         return genai
     elif provider == "local":
+        from openai import OpenAI
         return OpenAI(
             base_url="http://192.168.180.137:8006/v1",
-            api_key="not-needed"
+            api_key="not-needed",
+            http_client=http_client
         )
     else:
         raise ValueError(f"Unsupported provider: {provider}")
 
-def query_llm(prompt: str, client=None, model=None, provider="openai", image_path: Optional[str] = None) -> Optional[str]:
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _keepalive_http_client(provider: str):
+    import httpx
+    limits = httpx.Limits(max_keepalive_connections=KEEPALIVE_CONNECTIONS, keepalive_expiry=KEEPALIVE_EXPIRY)
+    if provider == "anthropic":
+        from anthropic import DefaultHttpxClient
+    else:
+        from openai import DefaultHttpxClient
+    return DefaultHttpxClient(limits=limits)
+
+def get_llm_client(provider="openai"):
     """
-    Query an LLM with a prompt and optional image attachment.
+    Return the process-wide client for a provider, creating it on first use.
+    
+    The client is shared by every query_llm/stream_llm call that doesn't pass its own, so
+    its pooled HTTPS connections are reused instead of reconnecting on each call. The
+    SDK clients are thread-safe.
+    """
+    client = _clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                http_client = _keepalive_http_client(provider) if provider in PROVIDERS and provider != "gemini" else None
+                client = _clients[provider] = create_llm_client(provider, http_client=http_client)
+    return client
+
+def create_async_llm_client(provider="openai", base_url: Optional[str] = None):
+    """
+    Create an asyncio client for concurrent requests (see llm_batch.py).
+    
+    SDK-level retries are disabled because the batch runner retries itself, with jitter
+    and its own rate limits.
+    
+    Args:
+        provider (str): The API provider to use
+        base_url (str, optional): Override the API endpoint, e.g. a local stub server
+        
+    Returns:
+        The async client (the genai module for gemini)
+    """
+    if provider == "openai":
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=_require_env('OPENAI_API_KEY'), base_url=base_url, max_retries=0)
+    elif provider == "azure":
+        from openai import AsyncAzureOpenAI
+        return AsyncAzureOpenAI(
+            api_key=_require_env('AZURE_OPENAI_API_KEY'),
+            api_version="2024-08-01-preview",
+            azure_endpoint=base_url or "https://msopenai.openai.azure.com",
+            max_retries=0
+        )
+    elif provider == "deepseek":
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=_require_env('DEEPSEEK_API_KEY'), base_url=base_url or "https://api.deepseek.com/v1", max_retries=0)
+    elif provider == "anthropic":
+        from anthropic import AsyncAnthropic
+        return AsyncAnthropic(api_key=_require_env('ANTHROPIC_API_KEY'), base_url=base_url, max_retries=0)
+    elif provider == "gemini":
+        api_key = _require_env('GOOGLE_API_KEY')
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        return genai
+    elif provider == "local":
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(base_url=base_url or "http://192.168.180.137:8006/v1", api_key="not-needed", max_retries=0)
+    else:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+_default_cache = None
+
+def get_cache() -> ResponseCache:
+    """Return the shared on-disk response cache, opening it on first use."""
+    global _default_cache
+    if _default_cache is None:
+        load_environment()
+        _default_cache = ResponseCache()
+    return _default_cache
+
+def cache_enabled() -> bool:
+    """The cache is opt-in: set LLM_CACHE=1 (or pass cache=True to query_llm)."""
+    load_environment()
+    return os.getenv('LLM_CACHE', '').lower() in ('1', 'true', 'yes', 'on')
+
+def default_model(provider: str) -> Optional[str]:
+    if provider == "openai":
+        return "gpt-4o"
+    elif provider == "azure":
+        load_environment()
+        return os.getenv('AZURE_OPENAI_MODEL_DEPLOYMENT', 'gpt-4o-ms')  # Get from env with fallback
+    elif provider == "deepseek":
+        return "deepseek-chat"
+    elif provider == "anthropic":
+        return "claude-3-sonnet-20240229"
+    elif provider == "gemini":
+        return "gemini-pro"
+    elif provider == "local":
+        return "Qwen/Qwen2.5-32B-Instruct-AWQ"
+    return None
+
+def build_request(prompt: str, model: str, provider: str, image_path: Optional[str] = None) -> dict:
+    """
+    Build the provider-specific request payload.
     
     Args:
         prompt (str): The text prompt to send
+        model (str): The model to use
+        provider (str): The API provider to use
+        image_path (str, optional): Path to an image file to attach
+        
+    Returns:
+        dict: Keyword arguments for the provider's completion call
+    """
+    if provider in ["openai", "local", "deepseek", "azure"]:
+        messages = [{"role": "user", "content": []}]
+        
+        # Add text content
+        messages[0]["content"].append({
+            "type": "text",
+            "text": prompt
+        })
+        
+        # Add image content if provided
+        if image_path:
+            if provider == "openai":
+                encoded_image, mime_type = encode_image_file(image_path)
+                messages[0]["content"] = [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{encoded_image}"}}
+                ]
+        
+        kwargs = {
+            "model": model,
+            "messages": messages,
+            "temperature": 0.7,
+        }
+        
+        # Add o1-specific parameters
+        if model == "o1":
+            kwargs["response_format"] = {"type": "text"}
+            kwargs["reasoning_effort"] = "low"
+            del kwargs["temperature"]
+        
+        return kwargs
+        
+    elif provider == "anthropic":
+        messages = [{"role": "user", "content": []}]
+        
+        # Add text content
+        messages[0]["content"].append({
+            "type": "text",
+            "text": prompt
+        })
+        
+        # Add image content if provided
+        if image_path:
+            encoded_image, mime_type = encode_image_file(image_path)
+            messages[0]["content"].append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": mime_type,
+                    "data": encoded_image
+                }
+            })
+        
+        return {
+            "model": model,
+            "max_tokens": 1000,
+            "messages": messages
+        }
+        
+    elif provider == "gemini":
+        return {"model": model, "contents": prompt}
+        
+    raise ValueError(f"Unsupported provider: {provider}")
+
+def send_request(client, provider: str, request: dict) -> str:
+    """Send a payload from build_request() and return the response text."""
+    if provider in ["openai", "local", "deepseek", "azure"]:
+        response = client.chat.completions.create(**request)
+        return response.choices[0].message.content
+        
+    elif provider == "anthropic":
+        response = client.messages.create(**request)
+        return response.content[0].text
+        
+    elif provider == "gemini":
+        model = client.GenerativeModel(request["model"])
+        response = model.generate_content(request["contents"])
+        return response.text
+        
+    raise ValueError(f"Unsupported provider: {provider}")
+
+def stream_request(client, provider: str, request: dict, usage: Optional[dict] = None) -> Iterator[str]:
+    """
+    Send a payload from build_request() and yield the response text as it is generated.
+    
+    Args:
         client: The LLM client instance
+        provider (str): The API provider to use
+        request (dict): Keyword arguments from build_request()
+        usage (dict, optional): Receives "output_tokens" when the provider reports it
+        
+    Yields:
+        str: Text deltas
+    """
+    if provider in ["openai", "local", "deepseek", "azure"]:
+        stream = client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True})
+        for chunk in stream:
+            if chunk.usage is not None and usage is not None:
+                usage["output_tokens"] = chunk.usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        
+    elif provider == "anthropic":
+        with client.messages.stream(**request) as stream:
+            yield from stream.text_stream
+            if usage is not None:
+                usage["output_tokens"] = stream.get_final_message().usage.output_tokens
+        
+    elif provider == "gemini":
+        model = client.GenerativeModel(request["model"])
+        for chunk in model.generate_content(request["contents"], stream=True):
+            if chunk.usage_metadata and chunk.usage_metadata.candidates_token_count and usage is not None:
+                usage["output_tokens"] = chunk.usage_metadata.candidates_token_count
+            if chunk.parts:
+                yield chunk.text
+        
+    else:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+def _prepare_query(prompt: str, model, provider: str, image_path: Optional[str], cache, refresh: bool):
+    """Resolve the model, cache and request; returns (model, request, cache, key, cached response)."""
+    if cache is None:
+        cache = cache_enabled()
+    if cache is True:
+        cache = get_cache()
+    
+    # Set default model
+    if model is None:
+        model = default_model(provider)
+    
+    request = build_request(prompt, model, provider, image_path)
+    
+    key = None
+    cached = None
+    if cache:
+        key = request_key(provider, request)
+        if not refresh:
+            cached = cache.get(key)
+    return model, request, cache, key, cached
+
+def _store_response(cache, key: Optional[str], response: Optional[str], provider: str, model: str) -> None:
+    if key is not None and response is not None:
+        try:
+            cache.set(key, json.dumps(response), provider, model)
+        except Exception as e:
+            print(f"Error writing LLM cache: {e}", file=sys.stderr)
+
+def stream_llm(prompt: str, client=None, model=None, provider="openai", image_path: Optional[str] = None,
+               cache: Union[bool, ResponseCache, None] = None, refresh: bool = False,
+               stats: Optional[dict] = None) -> Iterator[str]:
+    """
+    Query an LLM and yield the response text as it is generated.
+    
+    Arguments are the same as query_llm. A cached response is yielded as a single chunk, and
+    a completed stream is cached like a regular response. Errors are printed to stderr and
+    end the stream.
+    
+    Args:
+        stats (dict, optional): Filled in once the stream ends with "time_to_first_token"
+            and "elapsed" (seconds), "output_tokens" and "tokens_estimated" (True when
+            the provider did not report usage and it was estimated from the text)
+        
+    Yields:
+        str: Text deltas
+    """
+    started = time.perf_counter()
+    first_token = None
+    usage = {}
+    chunks = []
+    try:
+        model, request, cache, key, cached = _prepare_query(prompt, model, provider, image_path, cache, refresh)
+        if cached is not None:
+            deltas = iter([json.loads(cached)])
+        else:
+            if client is None:
+                client = get_llm_client(provider)
+            deltas = stream_request(client, provider, request, usage)
+        
+        for delta in deltas:
+            if first_token is None:
+                first_token = time.perf_counter()
+            chunks.append(delta)
+            yield delta
+        
+        if cached is None:
+            _store_response(cache, key, "".join(chunks), provider, model)
+    except Exception as e:
+        print(f"Error querying LLM: {e}", file=sys.stderr)
+    finally:
+        if stats is not None:
+            ended = time.perf_counter()
+            text = "".join(chunks)
+            stats["time_to_first_token"] = first_token - started if first_token is not None else None
+            stats["elapsed"] = ended - started
+            stats["tokens_estimated"] = "output_tokens" not in usage
+            stats["output_tokens"] = usage.get("output_tokens", len(text) // 4)
+
+def query_llm(prompt: str, client=None, model=None, provider="openai", image_path: Optional[str] = None,
+              cache: Union[bool, ResponseCache, None] = None, refresh: bool = False,
+              stream: bool = False) -> Union[Optional[str], Iterator[str]]:
+    """
+    Query an LLM with a prompt and optional image attachment.
+    
+    Args:
+        prompt (str): The text prompt to send
+        client: The LLM client instance (default: the shared one from get_llm_client)
         model (str, optional): The model to use
         provider (str): The API provider to use
         image_path (str, optional): Path to an image file to attach
+        cache (bool or ResponseCache, optional): Serve identical requests from the on-disk cache.
+            True uses the shared cache, None follows the LLM_CACHE environment variable
+        refresh (bool): Skip the cache lookup but store the new response
+        stream (bool): Return a generator of text deltas instead (see stream_llm)
         
     Returns:
         Optional[str]: The LLM's response or None if there was an error
     """
+    if stream:
+        return stream_llm(prompt, client, model=model, provider=provider, image_path=image_path,
+                          cache=cache, refresh=refresh)
+    
+    try:
+        model, request, cache, key, cached = _prepare_query(prompt, model, provider, image_path, cache, refresh)
+        if cached is not None:
+            return json.loads(cached)
+    except Exception as e:
+        print(f"Error querying LLM: {e}", file=sys.stderr)
+        return None
+    
     if client is None:
-        client = create_llm_client(provider)
+        client = get_llm_client(provider)
     
     try:
-        # Set default model
-        if model is None:
-            if provider == "openai":
-                model = "gpt-4o"
-            elif provider == "azure":
-                model = os.getenv('AZURE_OPENAI_MODEL_DEPLOYMENT', 'gpt-4o-ms')  # Get from env with fallback
-            elif provider == "deepseek":
-                model = "deepseek-chat"
-            elif provider == "anthropic":
-                model = "claude-3-sonnet-20240229"
-            elif provider == "gemini":
-                model = "gemini-pro"
-            elif provider == "local":
-                model = "Qwen/Qwen2.5-32B-Instruct-AWQ"
-        
-        if provider in ["openai", "local", "deepseek", "azure"]:
-            messages = [{"role": "user", "content": []}]
-            
-            # Add text content
-            messages[0]["content"].append({
-                "type": "text",
-                "text": prompt
-            })
-            
-            # Add image content if provided
-            if image_path:
-                if provider == "openai":
-                    encoded_image, mime_type = encode_image_file(image_path)
-                    messages[0]["content"] = [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{encoded_image}"}}
-                    ]
-            
-            kwargs = {
-                "model": model,
-                "messages": messages,
-                "temperature": 0.7,
-            }
-            
-            # Add o1-specific parameters
-            if model == "o1":
-                kwargs["response_format"] = {"type": "text"}
-                kwargs["reasoning_effort"] = "low"
-                del kwargs["temperature"]
-            
-            response = client.chat.completions.create(**kwargs)
-            return response.choices[0].message.content
-            
-        elif provider == "anthropic":
-            messages = [{"role": "user", "content": []}]
-            
-            # Add text content
-            messages[0]["content"].append({
-                "type": "text",
-                "text": prompt
-            })
-            
-            # Add image content if provided
-            if image_path:
-                encoded_image, mime_type = encode_image_file(image_path)
-                messages[0]["content"].append({
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": mime_type,
-                        "data": encoded_image
-                    }
-                })
-            
-            response = client.messages.create(
-                model=model,
-                max_tokens=1000,
-                messages=messages
-            )
-            return response.content[0].text
-            
-        elif provider == "gemini":
-            model = client.GenerativeModel(model)
-            response = model.generate_content(prompt)
-            return response.text
-            
+        response = send_request(client, provider, request)
     except Exception as e:
         print(f"Error querying LLM: {e}", file=sys.stderr)
         return None
+    
+    _store_response(cache, key, response, provider, model)
+    return response
+
+def print_stream_stats(stats: dict) -> None:
+    """Report time to first token and generation speed of a stream_llm() call on stderr."""
+    generating = stats["elapsed"] - (stats["time_to_first_token"] or 0)
+    rate = f"{stats['output_tokens'] / generating:.1f} tokens/s" if generating > 0 else "n/a tokens/s"
+    estimated = " (estimated)" if stats["tokens_estimated"] else ""
+    print(f"Time to first token: {stats['time_to_first_token']:.2f}s, "
+          f"{stats['output_tokens']} tokens{estimated} in {stats['elapsed']:.2f}s, {rate}", file=sys.stderr)
 
 def main():
     parser = argparse.ArgumentParser(description='Query an LLM with a prompt')
-    parser.add_argument('--prompt', type=str, help='The prompt to send to the LLM', required=True)
-    parser.add_argument('--provider', choices=['openai','anthropic','gemini','local','deepseek','azure'], default='openai', help='The API provider to use')
+    parser.add_argument('--prompt', type=str, help='The prompt to send to the LLM')
+    parser.add_argument('--provider', choices=PROVIDERS, default='openai', help='The API provider to use')
     parser.add_argument('--model', type=str, help='The model to use (default depends on provider)')
     parser.add_argument('--image', type=str, help='Path to an image file to attach to the prompt')
+    parser.add_argument('--cache', action=argparse.BooleanOptionalAction, default=None,
+                        help='Serve identical requests from the on-disk cache (default: LLM_CACHE environment variable)')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached responses and store the new one (implies --cache)')
+    parser.add_argument('--cache-stats', action='store_true', help='Print cache hit rate and size to stderr')
+    parser.add_argument('--stream', action=argparse.BooleanOptionalAction, default=True,
+                        help='Print the response as it is generated, with time to first token and tokens/sec on stderr')
+    parser.add_argument('--verbose', action='store_true', help='Report which .env files and keys were loaded')
     args = parser.parse_args()
+    load_environment(verbose=args.verbose)
+
+    if args.prompt is None:
+        if args.cache_stats:
+            print(json.dumps(get_cache().stats(), indent=2), file=sys.stderr)
+            return
+        parser.error('the following arguments are required: --prompt')
+    if args.refresh and args.cache is False:
+        parser.error('--refresh cannot be combined with --no-cache')
+    use_cache = True if args.refresh else args.cache
 
     if not args.model:
         if args.provider == 'openai':
@@ -234,12 +541,27 @@ def main():
         elif args.provider == 'azure':
             args.model = os.getenv('AZURE_OPENAI_MODEL_DEPLOYMENT', 'gpt-4o-ms')  # Get from env with fallback
 
-    client = create_llm_client(args.provider)
-    response = query_llm(args.prompt, client, model=args.model, provider=args.provider, image_path=args.image)
-    if response:
-        print(response)
+    if args.stream:
+        stats = {}
+        received = False
+        for delta in stream_llm(args.prompt, model=args.model, provider=args.provider, image_path=args.image,
+                                cache=use_cache, refresh=args.refresh, stats=stats):
+            print(delta, end="", flush=True)
+            received = received or bool(delta)
+        if received:
+            print()
+            print_stream_stats(stats)
+        else:
+            print("Failed to get response from LLM")
     else:
-        print("Failed to get response from LLM")
+        response = query_llm(args.prompt, model=args.model, provider=args.provider, image_path=args.image,
+                             cache=use_cache, refresh=args.refresh)
+        if response:
+            print(response)
+        else:
+            print("Failed to get response from LLM")
+    if args.cache_stats:
+        print(json.dumps(get_cache().stats(), indent=2), file=sys.stderr)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,440 @@
+#!/usr/bin/env /workspace/tmp_windsurf/venv/bin/python3
+
+"""
+Run many LLM prompts concurrently: JSONL in, JSONL out.
+
+Each input line is a JSON object with a "prompt" (plus optional "id", "provider", "model"
+and "image") or a bare JSON string. Output lines are written in input order as soon as
+the head of the queue is done, so the output file is always a complete prefix of the
+input and an interrupted run resumes from the last line written.
+
+    python tools/llm_batch.py prompts.jsonl -o responses.jsonl --provider anthropic
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import AsyncIterator, Iterable, List, Optional
+
+try:
+    from .llm_api import PROVIDERS, build_request, cache_enabled, create_async_llm_client, default_model, get_cache, load_environment
+    from .llm_cache import request_key
+except ImportError:  # run as a script: python tools/llm_batch.py
+    from llm_api import PROVIDERS, build_request, cache_enabled, create_async_llm_client, default_model, get_cache, load_environment
+    from llm_cache import request_key
+
+# provider -> (concurrent requests, tokens per minute; 0 = no limit)
+# Conservative defaults; raise them to match your account tier with --concurrency/--tpm
+# or LLM_BATCH_LIMITS="openai=32:450000,anthropic=8:80000"
+PROVIDER_LIMITS = {
+    "openai": (8, 90000),
+    "azure": (8, 90000),
+    "deepseek": (8, 0),
+    "anthropic": (4, 40000),
+    "gemini": (4, 0),
+    "local": (4, 0),
+}
+
+MAX_RETRIES = 6
+RETRY_BASE_DELAY = 1.0  # seconds, doubled on every attempt
+RETRY_MAX_DELAY = 60.0
+RETRYABLE_STATUS = {408, 409, 429}
+
+# Output tokens assumed for the TPM budget when the request sets no max_tokens;
+# the estimate is corrected with the real usage once the response arrives
+OUTPUT_TOKENS_ESTIMATE = 500
+IMAGE_TOKENS_ESTIMATE = 1000
+
+
+def parse_limits(text: Optional[str], limits: dict = PROVIDER_LIMITS) -> dict:
+    """Parse "provider=concurrency:tpm,..." overrides on top of the defaults."""
+    result = dict(limits)
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        concurrency, _, tpm = value.partition(":")
+        default_concurrency, default_tpm = result.get(name.strip(), (4, 0))
+        result[name.strip()] = (int(concurrency or default_concurrency), int(tpm or default_tpm))
+    return result
+
+
+class TokenRateLimiter:
+    """
+    Tokens-per-minute budget shared by all requests to one provider.
+
+    Requests reserve their estimated tokens before being sent and settle the difference
+    with the real usage afterwards, so an underestimate only delays later requests.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: int) -> None:
+        tokens = min(tokens, self.capacity)  # a single huge request still goes through on a full bucket
+        async with self._lock:  # first come, first served
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        if actual is None:
+            return
+        self._refill()
+        self.tokens -= actual - min(estimated, self.capacity)
+
+
+class ProviderPool:
+    """Async client, concurrency limit and TPM budget for one provider."""
+
+    def __init__(self, provider: str, concurrency: int, tokens_per_minute: int, base_url: Optional[str] = None):
+        self.provider = provider
+        self.client = create_async_llm_client(provider, base_url=base_url)
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.tpm = TokenRateLimiter(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    async def close(self) -> None:
+        close = getattr(self.client, 'close', None)
+        if close is not None:
+            await close()
+
+
+def estimate_tokens(prompt: str, request: dict, has_image: bool) -> int:
+    """Rough token count of a request (~4 characters per token) plus its output allowance."""
+    tokens = len(prompt) // 4 + 1
+    if has_image:
+        tokens += IMAGE_TOKENS_ESTIMATE
+    return tokens + request.get("max_tokens", OUTPUT_TOKENS_ESTIMATE)
+
+
+async def send_request_async(client, provider: str, request: dict) -> tuple[str, Optional[int]]:
+    """Async counterpart of llm_api.send_request; also returns the tokens used if reported."""
+    if provider in ["openai", "local", "deepseek", "azure"]:
+        response = await client.chat.completions.create(**request)
+        usage = getattr(response, 'usage', None)
+        return response.choices[0].message.content, getattr(usage, 'total_tokens', None)
+
+    elif provider == "anthropic":
+        response = await client.messages.create(**request)
+        usage = getattr(response, 'usage', None)
+        tokens = usage.input_tokens + usage.output_tokens if usage is not None else None
+        return response.content[0].text, tokens
+
+    elif provider == "gemini":
+        model = client.GenerativeModel(request["model"])
+        response = await model.generate_content_async(request["contents"])
+        usage = getattr(response, 'usage_metadata', None)
+        return response.text, getattr(usage, 'total_token_count', None)
+
+    raise ValueError(f"Unsupported provider: {provider}")
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, 'status_code', None)  # openai, anthropic
+    if status is None:
+        code = getattr(error, 'code', None)  # google.api_core
+        if isinstance(code, int):
+            status = code
+    return status
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    # APIConnectionError / APITimeoutError in both the openai and anthropic SDKs
+    return any(cls.__name__ in ('APIConnectionError', 'APITimeoutError') for cls in type(error).__mro__)
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is not None:
+        try:
+            delay = max(delay, float(headers.get('retry-after')))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+def parse_item(line: str, provider: str, model: Optional[str]) -> dict:
+    item = json.loads(line)
+    if isinstance(item, str):
+        item = {"prompt": item}
+    if not isinstance(item, dict) or not isinstance(item.get("prompt"), str):
+        raise ValueError('expected a JSON string or an object with a "prompt" string')
+    item.setdefault("provider", provider)
+    item["model"] = item.get("model") or model or default_model(item["provider"])
+    return item
+
+
+async def _process(index: int, line: str, pools: dict, options: dict) -> dict:
+    record = {"index": index}
+    try:
+        item = parse_item(line, options["provider"], options["model"])
+    except ValueError as e:  # json.JSONDecodeError is a ValueError too
+        record.update({"response": None, "error": f"Invalid input line: {e}"})
+        return record
+
+    provider, model = item["provider"], item["model"]
+    record.update({"id": item.get("id"), "provider": provider, "model": model})
+    try:
+        request = build_request(item["prompt"], model, provider, item.get("image"))
+        pool = pools.get(provider)
+        if pool is None:
+            concurrency, tpm = options["limits"].get(provider, (4, 0))
+            pool = pools[provider] = ProviderPool(provider, concurrency, tpm, options["base_url"])
+    except Exception as e:
+        record.update({"response": None, "error": str(e)})
+        return record
+
+    cache = options["cache"]
+    key = None
+    if cache:
+        key = request_key(provider, request)
+        if not options["refresh"]:
+            cached = cache.get(key)
+            if cached is not None:
+                record.update({"response": json.loads(cached), "error": None, "cached": True})
+                return record
+
+    estimated = estimate_tokens(item["prompt"], request, bool(item.get("image")))
+    attempt = 0
+    while True:
+        try:
+            if pool.tpm is not None:
+                await pool.tpm.acquire(estimated)
+            async with pool.semaphore:
+                response, used = await send_request_async(pool.client, provider, request)
+            if pool.tpm is not None:
+                pool.tpm.settle(estimated, used)
+            break
+        except Exception as e:
+            if attempt >= options["max_retries"] or not is_retryable(e):
+                record.update({"response": None, "error": f"{type(e).__name__}: {e}", "attempts": attempt + 1})
+                return record
+            delay = retry_delay(e, attempt)
+            attempt += 1
+            print(f"Retrying line {index} in {delay:.1f}s after {type(e).__name__} "
+                  f"(attempt {attempt}/{options['max_retries']})", file=sys.stderr)
+            await asyncio.sleep(delay)
+
+    if key is not None and response is not None:
+        try:
+            cache.set(key, json.dumps(response), provider, model)
+        except Exception as e:
+            print(f"Error writing LLM cache: {e}", file=sys.stderr)
+    record.update({"response": response, "error": None, "attempts": attempt + 1})
+    return record
+
+
+async def run_batch(lines: Iterable[str], provider: str = "openai", model: Optional[str] = None,
+                    limits: Optional[dict] = None, base_url: Optional[str] = None, window: int = 256,
+                    max_retries: int = MAX_RETRIES, cache=None, refresh: bool = False,
+                    start: int = 0) -> AsyncIterator[dict]:
+    """
+    Query the LLM for every JSONL line, concurrently, yielding results in input order.
+
+    Args:
+        lines (Iterable[str]): JSONL input lines; blank lines are skipped
+        provider (str): Provider for lines that don't name one
+        model (str, optional): Model for lines that don't name one
+        limits (dict, optional): provider -> (concurrency, tokens per minute), see PROVIDER_LIMITS
+        base_url (str, optional): Override the API endpoint, e.g. a local stub server
+        window (int): Maximum lines in flight or waiting to be yielded in order
+        max_retries (int): Retries per request on 429, 5xx and connection errors
+        cache (bool or ResponseCache, optional): As in query_llm
+        refresh (bool): Skip cache lookups but store new responses
+        start (int): Index of the first line, for resumed runs
+
+    Yields:
+        dict: {"index", "id", "provider", "model", "response", "error", "attempts"}
+    """
+    load_environment()
+    if cache is None:
+        cache = cache_enabled()
+    if cache is True:
+        cache = get_cache()
+    options = {
+        "provider": provider,
+        "model": model,
+        "limits": limits if limits is not None else parse_limits(os.getenv('LLM_BATCH_LIMITS')),
+        "base_url": base_url,
+        "max_retries": max_retries,
+        "cache": cache,
+        "refresh": refresh,
+    }
+    pools = {}
+    pending = {}
+    next_index = start
+    index = start
+    try:
+        for line in lines:
+            if not line.strip():
+                continue
+            pending[index] = asyncio.ensure_future(_process(index, line, pools, options))
+            index += 1
+            # Keep the reorder buffer bounded: drain finished results from the head
+            while len(pending) >= window or (pending.get(next_index) and pending[next_index].done()):
+                yield await pending.pop(next_index)
+                next_index += 1
+        while pending:
+            yield await pending.pop(next_index)
+            next_index += 1
+    finally:
+        for task in pending.values():
+            task.cancel()
+        for pool in pools.values():
+            await pool.close()
+
+
+def query_llm_batch(prompts: List[str], provider: str = "openai", model: Optional[str] = None,
+                    **options) -> List[Optional[str]]:
+    """
+    Query the LLM concurrently for a list of prompts.
+
+    Args:
+        prompts (List[str]): The text prompts to send
+        provider (str): The API provider to use
+        model (str, optional): The model to use
+        **options: Passed to run_batch (limits, base_url, max_retries, cache, ...)
+
+    Returns:
+        List[Optional[str]]: Responses in prompt order, None where the request failed
+    """
+    async def collect():
+        lines = (json.dumps({"prompt": prompt}) for prompt in prompts)
+        return [record["response"] async for record in run_batch(lines, provider, model, **options)]
+    return asyncio.run(collect())
+
+
+def completed_lines(output_path: Path) -> int:
+    """
+    Count the records of a previous run and drop a partially written last line.
+
+    Returns:
+        int: Number of input lines already answered
+    """
+    if not output_path.exists():
+        return 0
+    count = 0
+    good_bytes = 0
+    with open(output_path, 'rb') as f:
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                break
+            if record.get("index") != count:
+                raise ValueError(f"{output_path} is not the output of this input (line {count + 1} has index {record.get('index')})")
+            count += 1
+            good_bytes += len(raw)
+    if good_bytes != output_path.stat().st_size:
+        with open(output_path, 'r+b') as f:
+            f.truncate(good_bytes)
+    return count
+
+
+async def process_file(input_path: str, output_path: Optional[str] = None, resume: bool = True, **options) -> dict:
+    """
+    Stream a JSONL file of prompts to a JSONL file of responses.
+
+    Args:
+        input_path (str): Input JSONL, "-" for stdin
+        output_path (str, optional): Output JSONL, stdout if omitted
+        resume (bool): Continue after the last record of an existing output file
+        **options: Passed to run_batch
+
+    Returns:
+        dict: Counts of skipped (resumed), succeeded and failed lines
+    """
+    skip = 0
+    if output_path and resume:
+        skip = completed_lines(Path(output_path))
+        if skip:
+            print(f"Resuming after {skip} completed lines", file=sys.stderr)
+
+    source = sys.stdin if input_path == "-" else open(input_path, encoding='utf-8')
+    out = open(output_path, 'a' if resume else 'w', encoding='utf-8') if output_path else sys.stdout
+    summary = {"skipped": skip, "succeeded": 0, "failed": 0}
+    try:
+        lines = (line for line in source if line.strip())
+        for _ in range(skip):
+            next(lines, None)
+        async for record in run_batch(lines, start=skip, **options):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()  # every written line survives a crash
+            summary["failed" if record["error"] else "succeeded"] += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query an LLM for every prompt in a JSONL file')
+    parser.add_argument('input', help='JSONL file of prompts ("-" for stdin)')
+    parser.add_argument('-o', '--output', type=str, help='JSONL file for responses (default: stdout)')
+    parser.add_argument('--provider', choices=PROVIDERS, default='openai', help='Provider for lines that do not set one')
+    parser.add_argument('--model', type=str, help='Model for lines that do not set one (default depends on provider)')
+    parser.add_argument('--concurrency', type=int, help='Concurrent requests per provider (overrides the defaults)')
+    parser.add_argument('--tpm', type=int, help='Tokens per minute per provider, 0 for no limit (overrides the defaults)')
+    parser.add_argument('--base-url', type=str, help='Override the API endpoint, e.g. a local stub server')
+    parser.add_argument('--max-retries', type=int, default=MAX_RETRIES, help='Retries on 429, 5xx and connection errors')
+    parser.add_argument('--window', type=int, default=256, help='Maximum lines in flight or waiting to be written in order')
+    parser.add_argument('--restart', action='store_true', help='Overwrite the output file instead of resuming it')
+    parser.add_argument('--cache', action=argparse.BooleanOptionalAction, default=None,
+                        help='Serve identical requests from the on-disk cache (default: LLM_CACHE environment variable)')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached responses and store the new ones (implies --cache)')
+    args = parser.parse_args()
+    load_environment()
+
+    limits = parse_limits(os.getenv('LLM_BATCH_LIMITS'))
+    if args.concurrency is not None or args.tpm is not None:
+        limits = {
+            name: (args.concurrency if args.concurrency is not None else concurrency,
+                   args.tpm if args.tpm is not None else tpm)
+            for name, (concurrency, tpm) in limits.items()
+        }
+
+    started = time.perf_counter()
+    summary = asyncio.run(process_file(
+        args.input, args.output, resume=not args.restart,
+        provider=args.provider, model=args.model, limits=limits, base_url=args.base_url,
+        window=args.window, max_retries=args.max_retries,
+        cache=True if args.refresh else args.cache, refresh=args.refresh,
+    ))
+    elapsed = time.perf_counter() - started
+    print(f"Done in {elapsed:.1f}s: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+          f"{summary['skipped']} already completed", file=sys.stderr)
+    if summary['failed']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
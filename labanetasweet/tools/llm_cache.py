@@ -0,0 +1,184 @@
+#!/usr/bin/env /workspace/tmp_windsurf/venv/bin/python3
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# Bump when the key or stored format changes so old entries are never served
+CACHE_VERSION = 1
+
+DEFAULT_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+EVICT_BATCH = 100  # least recently used rows fetched per eviction query
+
+
+def default_cache_path() -> Path:
+    """Location of the cache database: $LLM_CACHE_PATH or ~/.cache/labanetasweet/llm_cache.sqlite3"""
+    if os.getenv('LLM_CACHE_PATH'):
+        return Path(os.environ['LLM_CACHE_PATH'])
+    base = os.getenv('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'labanetasweet' / 'llm_cache.sqlite3'
+
+
+def request_key(provider: str, request: dict) -> str:
+    """
+    Content-addressed key for an LLM request.
+
+    The request is the exact payload sent to the provider (model, messages including
+    the base64-encoded image, temperature, max_tokens, ...), so any change to it is a miss.
+    """
+    canonical = json.dumps(
+        {"version": CACHE_VERSION, "provider": provider, "request": request},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str,
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk LLM response cache backed by SQLite.
+
+    Entries expire after `ttl` seconds, and the least recently used entries are evicted
+    once the stored responses exceed `max_bytes`. Hit/miss counters are persisted so
+    hit rates can be compared across runs. Safe to share between threads and processes.
+    """
+
+    def __init__(self, path=None, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.path = Path(path) if path else default_cache_path()
+        self.ttl = float(ttl if ttl is not None else os.getenv('LLM_CACHE_TTL', DEFAULT_TTL))
+        self.max_bytes = int(max_bytes if max_bytes is not None else os.getenv('LLM_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+        # Running total of stored bytes, kept in the stats table so every process sharing the
+        # file sees the same value. Summed once for caches created before it was tracked.
+        self._conn.execute(
+            "INSERT OR IGNORE INTO stats (name, value) SELECT 'bytes', coalesce(sum(size), 0) FROM responses"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for `key`, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at, size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count('misses')
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # created_at guards against another process having replaced the entry meanwhile
+                    deleted = self._conn.execute(
+                        "DELETE FROM responses WHERE key = ? AND created_at = ?", (key, row[1])
+                    ).rowcount
+                    if deleted:
+                        self._count('bytes', -row[2])
+                    self._count('misses')
+                    self._count('expired')
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count('hits')
+            return row[0]
+
+    def set(self, key: str, response: str, provider: str, model: Optional[str] = None) -> None:
+        """Store a response and evict least recently used entries if over the size limit."""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, provider, model, response, size, created_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, provider, model, response, size, now, now),
+                )
+                self._count('stores')
+                self._count('bytes', size - (old[0] if old else 0))
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self) -> None:
+        """Delete least recently used entries, a batch at a time, until under max_bytes."""
+        total = self._conn.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+        initial = total
+        evicted = 0
+        while total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            victims = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                victims.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            evicted += len(victims)
+        if evicted:
+            self._count('evictions', evicted)
+            self._count('bytes', total - initial)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        self._conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def stats(self) -> dict:
+        """Counters since the cache was created, plus current size and hit rate."""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries = self._conn.execute("SELECT count(*) FROM responses").fetchone()[0]
+        result = {name: counters.get(name, 0) for name in ('hits', 'misses', 'stores', 'evictions', 'expired')}
+        lookups = result['hits'] + result['misses']
+        result['hit_rate'] = round(result['hits'] / lookups, 4) if lookups else None
+        result.update({'entries': entries, 'bytes': counters.get('bytes', 0), 'max_bytes': self.max_bytes, 'path': str(self.path)})
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.execute("DELETE FROM stats")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,91 @@
+#!/usr/bin/env /workspace/tmp_windsurf/venv/bin/python3
+
+"""
+Measure what importing llm_api costs, in fresh interpreters.
+
+Compares importing the module (SDKs load lazily) with eagerly importing every provider
+SDK, which is what the module used to do at import time, and times creating a new client
+per call against reusing the shared one from get_llm_client.
+
+    python tools/llm_import_benchmark.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+TOOLS_DIR = Path(__file__).resolve().parent
+
+# name -> code timed in a fresh interpreter (seconds printed on stdout)
+SCENARIOS = {
+    "import llm_api": "import llm_api",
+    "eager SDK imports (previous llm_api)": "import google.generativeai, openai, anthropic, dotenv",
+    "import llm_api + openai client": "import llm_api; llm_api.get_llm_client('openai')",
+    "import llm_api + anthropic client": "import llm_api; llm_api.get_llm_client('anthropic')",
+}
+
+CLIENT_CALLS = 20
+CLIENT_REUSE = f"""
+import time, llm_api
+llm_api.get_llm_client('openai')
+start = time.perf_counter()
+for _ in range({CLIENT_CALLS}):
+    llm_api.create_llm_client('openai')
+new = time.perf_counter() - start
+start = time.perf_counter()
+for _ in range({CLIENT_CALLS}):
+    llm_api.get_llm_client('openai')
+shared = time.perf_counter() - start
+print(new, shared)
+"""
+
+
+def run_timed(code: str, env: dict, wrap: bool = True) -> list[float]:
+    """Run code in a fresh interpreter and return the timings it prints (its total time if wrap)."""
+    if wrap:
+        code = f"import time\n_start = time.perf_counter()\n{code}\nprint(time.perf_counter() - _start)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=TOOLS_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    return [float(value) for value in result.stdout.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark llm_api import and client creation time')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per scenario')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # Dummy keys: clients are created but never used
+    env.setdefault('OPENAI_API_KEY', 'benchmark')
+    env.setdefault('ANTHROPIC_API_KEY', 'benchmark')
+    env['PYTHONWARNINGS'] = 'ignore'
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+
+    results = {}
+    for name, code in SCENARIOS.items():
+        timings = [run_timed(code, env)[0] for _ in range(args.runs)]
+        results[name] = {"median_ms": round(statistics.median(timings) * 1000, 1),
+                         "min_ms": round(min(timings) * 1000, 1)}
+        print(f"{name}: {results[name]['median_ms']} ms", file=sys.stderr)
+
+    new, shared = run_timed(CLIENT_REUSE, env, wrap=False)
+    results[f"{CLIENT_CALLS} x create_llm_client('openai')"] = {"median_ms": round(new * 1000, 1)}
+    results[f"{CLIENT_CALLS} x get_llm_client('openai')"] = {"median_ms": round(shared * 1000, 3)}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    width = max(len(name) for name in results)
+    print(f"{'scenario':<{width}}  median (ms)")
+    for name, timing in results.items():
+        print(f"{name:<{width}}  {timing['median_ms']:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,62 @@
-from flask import Flask, jsonify, request
+import logging
+
+from flask import Flask, Response, jsonify, redirect, request, send_file
 
 import psycopg2
+import psycopg2.errors
+
+import compression
+import db
+import images
+import invalidation
+import metrics
+import migrate
+import orders
+import ratelimit
+import repository
+import workers
+from bulk_import import BULK_MAX_ROWS, import_products, parse_csv_rows
+from cache import MISSING, catalogue_cache
+from conditional import (
+    add_validators,
+    combine_versions,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+    row_validators,
+    table_version,
+)
+from db import get_db_connection, get_read_connection
+from orders import OrderError
+from repository import (
+    PRODUCTS_DEFAULT_LIMIT,
+    PRODUCTS_MAX_LIMIT,
+    parse_product_fields,
+    parse_product_filters,
+    row_mapper,
+)
+from serialization import FastJSONProvider
+from streaming import stream_query, wants_ndjson, wants_stream
+
+metrics.configure_logging()
+log = logging.getLogger(__name__)
+migrate.check_schema()  # مش هنشتغل على قاعدة بيانات ناقصها migrations (python migrate.py)
 
 app = Flask(__name__)
-
-
-# الاتصال بقاعدة البيانات
-def get_db_connection():
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            host="localhost",  # السيرفر بتاع قاعدة البيانات (جهازك)
-            database="labanita_db",  # اسم قاعدة البيانات اللي أنشأناها
-            user="postgres",  # اسم المستخدم بتاع قاعدة البيانات (افتراضي في PostgreSQL)
-            password="123456",  # كلمة سر المستخدم (لو حطيت كلمة سر للمستخدم postgres وقت التثبيت، دخلها هنا، لو مفيش كلمة سر، سيبها فاضية)
-        )
-    except (Exception, psycopg2.Error) as error:
-        print("Error while connecting to PostgreSQL", error)
-    return conn
+app.json = FastJSONProvider(app)  # jsonify أسرع وبيحول الـ Decimal والتواريخ بنفسه (serialization.py)
+db.init_app(app)  # الاتصال بيرجع للـ Pool أوتوماتيك في آخر كل request
+workers.init_app(app)  # عدادات الطلبات لكل worker (GET /worker/stats)
+metrics.init_app(app)  # وقت كل طلب وحجم الرد ووقت قاعدة البيانات (GET /metrics)
+compression.init_app(app)  # gzip/brotli للردود الكبيرة (بعد metrics عشان الحجم المتقاس يبقى المضغوط)
+invalidation.init_app(app)  # LISTEN على تعديلات الكتالوج عشان كاش كل الـ workers يتمسح مش بتاع الـ worker ده بس
+ratelimit.init_app(app)  # 429 للـ client اللي بيضرب الـ API و 503 وقت الزحمة (بعد workers و metrics عشان يتعد)
 
 
 # للتحقق من الاتصال بقاعدة البيانات
 @app.route("/")
 def hello_world():
     conn = get_db_connection()
-    if conn:
-        conn.close()  # مهم تقفل الاتصال بعد ما تخلصه
+    if conn:  # الاتصال هيرجع للـ Pool لوحده في آخر الـ request
         return "Hello, World! - Connected to PostgreSQL!"
     else:
         return "Hello, World! - Not connected to PostgreSQL!"
@@ -50,24 +81,23 @@ def create_product():
         category_id = int(category_id)  # هنا بنعمل التحويل
 
         # التحقق من أن category_id موجود في جدول categories
-        cur.execute("SELECT id FROM categories WHERE id = %s;", (category_id,))
-        category = cur.fetchone()
-        if not category:  # لو التصنيف مش موجود (يعني الـ query مرجعش صف)
+        if not repository.category_exists(cur, category_id):
             cur.close()
-            conn.close()
             return (
                 jsonify({"message": "Invalid category_id. Category does not exist."}),
                 400,
             )  # رد خطأ "Bad Request"
 
-        # أمر SQL لإضافة منتج جديد في جدول products
-        query = "INSERT INTO products (name, description, price, image_url, category_id) VALUES (%s, %s, %s, %s, %s) RETURNING id;"
-        cur.execute(query, (name, description, price, image_url, category_id))
-        product_id = cur.fetchone()[0]  # جلب الـ ID بتاع المنتج الجديد اللي تم إضافته
+        # إضافة منتج جديد في جدول products وجلب الـ ID بتاعه
+        product_id = repository.insert_product(
+            cur, name, description, price, image_url, category_id
+        )
 
         conn.commit()  # حفظ التغييرات في قاعدة البيانات
+        catalogue_cache.invalidate(("product", product_id))
+        catalogue_cache.invalidate_kind("categories")  # product_count و top_products
         cur.close()
-        conn.close()
+        images.schedule("products", product_id, image_url)  # النسخ المصغرة من الصورة في الخلفية
 
         return (
             jsonify(
@@ -77,91 +107,288 @@ def create_product():
         )  # رد ناجح مع رسالة و ID المنتج الجديد
 
     except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to create product.")
         if conn:
             conn.rollback()  # تراجع عن التغييرات في حالة الخطأ
-            conn.close()
         return (
             jsonify({"message": "Failed to create product.", "error": str(error)}),
             500,
         )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ
 
 
-# جلب قائمة المنتجات
+# إضافة/تعديل منتجات كتير في طلب واحد (Bulk Import - POST /products/bulk)
+# الـ body يا إما JSON array من المنتجات، يا إما ملف CSV (Content-Type: text/csv أو multipart في حقل اسمه file)
+# المنتج اللي معاه id بيتعدل لو موجود، والصفوف الغلط بترجع في errors من غير ما توقف الباقي
+@app.route("/products/bulk", methods=["POST"])
+def bulk_import_products():
+    try:
+        if "file" in request.files:
+            rows = parse_csv_rows(request.files["file"].read())
+        elif request.mimetype == "text/csv":
+            rows = parse_csv_rows(request.get_data())
+        else:
+            rows = request.get_json()
+            if not isinstance(rows, list):
+                raise ValueError("Expected a JSON array of products.")
+        if not rows:
+            raise ValueError("No products to import.")
+        if len(rows) > BULK_MAX_ROWS:
+            raise ValueError("Too many rows (max %d)." % BULK_MAX_ROWS)
+    except (ValueError, UnicodeDecodeError) as error:
+        return (
+            jsonify({"message": "Invalid import data.", "error": str(error)}),
+            400,
+        )  # رد خطأ "Bad Request"
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        result = import_products(conn, rows)
+        conn.commit()  # كل الصفوف السليمة بتتحفظ مع بعض في transaction واحدة
+        catalogue_cache.invalidate_kind("product")
+        catalogue_cache.invalidate_kind("categories")  # product_count و top_products
+
+        if result["inserted"] + result["updated"] == 0:
+            result["message"] = "No products were imported."
+            return jsonify(result), 400
+        result["message"] = "Products imported successfully!"
+        return jsonify(result), 200
+
+    except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to import products.")
+        if conn:
+            conn.rollback()  # تراجع عن كل الدفعة في حالة الخطأ
+        return (
+            jsonify({"message": "Failed to import products.", "error": str(error)}),
+            500,
+        )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ
+
+
+# منتجات كتير بالـ ids بتاعتها في رد واحد (السلة وتفاصيل الطلب)
+# اللي في الكاش بناخده من الكاش، والباقي بـ query واحدة (WHERE id = ANY(...)) بدل طلب لكل منتج
+# الرد: {"products": [...بنفس ترتيب الـ ids], "missing": [الـ ids اللي مش موجودة]}
+def products_by_ids_response(raw_ids, max_ids):
+    try:
+        ids = repository.parse_product_ids(raw_ids, max_ids)
+        columns = parse_product_fields(request.args)
+    except (ValueError, TypeError) as error:
+        return (
+            jsonify({"message": "Invalid product ids.", "error": str(error)}),
+            400,
+        )  # رد خطأ "Bad Request"
+
+    full_rows = len(columns) == len(repository.PRODUCT_COLUMNS)  # الكاش فيه المنتج كامل بس
+    found = {}
+    if full_rows:
+        for id in ids:
+            cached = catalogue_cache.get(("product", id))
+            if cached is not MISSING:
+                found[id] = cached
+
+    remaining = [id for id in ids if id not in found]
+    if remaining:
+        try:
+            generation = catalogue_cache.generation
+            conn = get_read_connection()
+            cur = conn.cursor()
+            fetched = repository.get_products_by_ids(cur, remaining, columns)
+            cur.close()
+        except (Exception, psycopg2.Error) as error:
+            log.exception("Failed to get products.")
+            return (
+                jsonify({"message": "Failed to get products.", "error": str(error)}),
+                500,
+            )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ
+        if full_rows:
+            for id, product_dict in fetched.items():
+                catalogue_cache.set(("product", id), product_dict, generation)
+        images.schedule_missing("products", fetched.values())
+        found.update(fetched)
+
+    return (
+        jsonify(
+            {
+                "products": [found[id] for id in ids if id in found],
+                "missing": [id for id in ids if id not in found],
+            }
+        ),
+        200,
+    )
+
+
+# جلب منتجات كتير بالـ ids في الـ body للقوايم الطويلة (POST /products/batch)
+# الـ body يا إما {"ids": [1, 2, 3]} يا إما [1, 2, 3]، و ?fields= شغالة زي GET /products
+@app.route("/products/batch", methods=["POST"])
+@db.read_only
+def get_products_batch():
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("ids")
+    return products_by_ids_response(data, repository.PRODUCTS_MAX_IDS)
+
+
+# جلب قائمة المنتجات (صفحة صفحة)
+# GET /products?limit=50&cursor=<آخر id في الصفحة اللي فاتت>&category_id=1&min_price=10&max_price=50&fields=id,name,price,image_url
+# الصفحة الجاية بنجيبها بالـ keyset (id > cursor) مش بالـ OFFSET، عشان السرعة متقلش كل ما نروح لصفحة أبعد
+# الـ cursor بتاع الصفحة الجاية بيرجع في الـ header اسمه X-Next-Cursor (مش موجود لو دي آخر صفحة)
+# مع ?stream=1 (أو Accept: application/x-ndjson) بيرجع كل المنتجات اللي مطابقة للفلاتر على دفعات
+# والـ limit بيبقى اختياري ومن غير حد أقصى، لأن الذاكرة مش بتكبر مع عدد الصفوف
+# GET /products?ids=3,1,2 بيرجع المنتجات دي بس بنفس الترتيب (شوف products_by_ids_response)
 @app.route("/products", methods=["GET"])
 def get_products():
+    if "ids" in request.args:
+        return products_by_ids_response(request.args.get("ids"), PRODUCTS_MAX_LIMIT)
+
+    stream = wants_stream(request)
+    try:
+        conditions, params = parse_product_filters(request.args)
+        columns = parse_product_fields(request.args)
+        if stream and "limit" not in request.args:
+            limit = None
+        else:
+            limit = int(request.args.get("limit", PRODUCTS_DEFAULT_LIMIT))
+            if limit < 1:
+                raise ValueError("limit must be a positive integer.")
+            if not stream:
+                limit = min(limit, PRODUCTS_MAX_LIMIT)
+        cursor = request.args.get("cursor")
+        if cursor is not None:
+            conditions.append("id > %s")
+            params.append(int(cursor))
+    except ValueError as error:
+        return (
+            jsonify({"message": "Invalid query parameters.", "error": str(error)}),
+            400,
+        )  # رد خطأ "Bad Request"
+
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
 
-        # أمر SQL لجلب كل المنتجات من جدول products
-        query = "SELECT * FROM products;"
-        cur.execute(query)
-        products = cur.fetchall()  # جلب كل الصفوف اللي رجعت من قاعدة البيانات
+        # فحص سريع لنسخة البيانات قبل الـ SELECT الكبير: لو الـ client عنده نفس النسخة نرد بـ 304 على طول
+        count, max_id, last_modified = table_version(cur, "products", conditions, params)
+        etag = make_etag(
+            "products",
+            count,
+            max_id,
+            last_modified,
+            request.query_string.decode(),
+            wants_ndjson(request),
+        )
+        if is_not_modified(request, etag, last_modified):
+            cur.close()
+            return not_modified_response(etag, last_modified)
+
+        if stream:
+            cur.close()
+            if limit is not None:
+                params.append(limit)
+            response = stream_query(
+                conn,
+                "products_stream",
+                repository.products_query(columns, conditions, limit=limit is not None),
+                params,
+                row_mapper(tuple(columns)),
+                ndjson=wants_ndjson(request),
+            )
+            return add_validators(response, etag, last_modified)
+
+        products_list, next_cursor = repository.list_products(
+            cur, columns, conditions, params, limit
+        )
 
         cur.close()
-        conn.close()
-
-        products_list = []  # قائمة فاضية هنحط فيها المنتجات بصيغة ديكشنري
-        for product in products:
-            product_dict = {
-                "id": product[0],
-                "name": product[1],
-                "description": product[2],
-                "price": float(
-                    product[3]
-                ),  # تحويل السعر لـ float عشان JSON يعرف يتعامل معاه
-                "image_url": product[4],
-                "category_id": product[5],
-                "created_at": product[
-                    6
-                ].isoformat(),  # تحويل التاريخ والوقت لـ String بصيغة ISO
-                "updated_at": (
-                    product[7].isoformat() if product[7] else None
-                ),  # نفس الكلام بس لو updated_at مش موجود (None)
-            }
-            products_list.append(product_dict)  # إضافة الديكشنري للقائمة
+        images.schedule_missing("products", products_list)
 
-        return jsonify(products_list), 200  # رد ناجح مع قائمة المنتجات
+        response = jsonify(products_list)  # رد ناجح مع قائمة المنتجات
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = str(next_cursor)
+        return add_validators(response, etag, last_modified), 200
 
     except (Exception, psycopg2.Error) as error:
-        if conn:
-            conn.close()
+        log.exception("Failed to get products.")
         return (
             jsonify({"message": "Failed to get products.", "error": str(error)}),
             500,
         )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ
 
 
+# البحث في المنتجات بالاسم والوصف (عربي وإنجليزي)، ولو pg_trgm موجود بيلاقي الاسم حتى لو فيه غلطة إملائية
+# GET /products/search?q=كنافة&limit=20&cursor=<X-Next-Cursor>&category_id=1&min_price=10&max_price=50&fields=id,name,price
+# النتايج مترتبة بالأقرب للبحث، والترتيب والتقسيم لصفحات بيتعملوا في قاعدة البيانات (GIN indexes من migrations/0003_product_search.sql)
+@app.route("/products/search", methods=["GET"])
+def search_products():
+    try:
+        text, offset = repository.parse_search_args(request.args)
+        conditions, params = parse_product_filters(request.args)
+        columns = parse_product_fields(request.args)
+        limit = int(request.args.get("limit", PRODUCTS_DEFAULT_LIMIT))
+        if limit < 1:
+            raise ValueError("limit must be a positive integer.")
+        limit = min(limit, PRODUCTS_MAX_LIMIT)
+    except ValueError as error:
+        return (
+            jsonify({"message": "Invalid query parameters.", "error": str(error)}),
+            400,
+        )  # رد خطأ "Bad Request"
+
+    conn = None
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor()
+
+        products_list, next_cursor = repository.search_products(
+            cur, text, columns, conditions, params, limit, offset
+        )
+
+        cur.close()
+        images.schedule_missing("products", products_list)
+
+        response = jsonify(products_list)  # رد ناجح مع نتايج البحث
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = str(next_cursor)
+        return response, 200
+
+    except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to search products.")
+        return (
+            jsonify({"message": "Failed to search products.", "error": str(error)}),
+            500,
+        )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ
+
+
 # جلب منتج بناءً على الـ ID
 @app.route("/products/<int:id>", methods=["GET"])
 def get_product(id):
+    cached = catalogue_cache.get(("product", id))
+    if cached is not MISSING:  # المنتج موجود في الكاش، مش محتاجين قاعدة البيانات
+        etag, last_modified = row_validators("product", cached)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        return add_validators(jsonify(cached), etag, last_modified), 200
+
     conn = None
     try:
-        conn = get_db_connection()
+        generation = catalogue_cache.generation
+        conn = get_read_connection()
         cur = conn.cursor()
 
-        # أمر SQL لجلب منتج واحد من جدول products بناءً على الـ ID
-        query = "SELECT * FROM products WHERE id = %s;"
-        cur.execute(query, (id,))  # تمرير الـ ID كـ parameter في الأمر
-
-        product = cur.fetchone()  # جلب صف واحد بس (المنتج اللي ليه الـ ID ده)
+        # جلب منتج واحد من جدول products بناءً على الـ ID (ديكشنري أو None)
+        product_dict = repository.get_product(cur, id)
 
         cur.close()
-        conn.close()
-
-        if product:  # لو المنتج موجود (يعني الـ query رجع صف)
-            product_dict = {
-                "id": product[0],
-                "name": product[1],
-                "description": product[2],
-                "price": float(product[3]),
-                "image_url": product[4],
-                "category_id": product[5],
-                "created_at": product[6].isoformat(),
-                "updated_at": product[7].isoformat() if product[7] else None,
-            }
-            return jsonify(product_dict), 200  # رد ناجح مع تفاصيل المنتج
+
+        if product_dict:  # لو المنتج موجود (يعني الـ query رجع صف)
+            catalogue_cache.set(("product", id), product_dict, generation)
+            images.schedule_missing("products", [product_dict])
+            etag, last_modified = row_validators("product", product_dict)
+            if is_not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+            return (
+                add_validators(jsonify(product_dict), etag, last_modified),
+                200,
+            )  # رد ناجح مع تفاصيل المنتج
 
         else:  # لو المنتج مش موجود (يعني الـ query مرجعش صف)
             return (
@@ -170,8 +397,7 @@ def get_product(id):
             )  # رد خطأ "غير موجود" (Not Found)
 
     except (Exception, psycopg2.Error) as error:
-        if conn:
-            conn.close()
+        log.exception("Failed to get product.")
         return (
             jsonify({"message": "Failed to get product.", "error": str(error)}),
             500,
@@ -194,26 +420,24 @@ def update_product(id):
         category_id = data["category_id"]
 
         # التحقق من أن category_id موجود في جدول categories
-        cur.execute("SELECT id FROM categories WHERE id = %s;", (category_id,))
-        category = cur.fetchone()
-        if not category:  # لو التصنيف مش موجود (يعني الـ query مرجعش صف)
+        if not repository.category_exists(cur, category_id):
             cur.close()
-            conn.close()
             return (
                 jsonify({"message": "Invalid category_id. Category does not exist."}),
                 400,
             )  # رد خطأ "Bad Request"
 
-        # أمر SQL لتعديل منتج موجود في جدول products بناءً على الـ ID
-        query = "UPDATE products SET name = %s, description = %s, price = %s, image_url = %s, category_id = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s;"
-        cur.execute(
-            query, (name, description, price, image_url, category_id, id)
-        )  # تمرير البيانات والـ ID كـ parameters في الأمر
+        # تعديل منتج موجود في جدول products بناءً على الـ ID
+        updated = repository.update_product(
+            cur, id, name, description, price, image_url, category_id
+        )
 
-        if cur.rowcount > 0:  # لو تم تعديل صف واحد على الأقل (يعني المنتج موجود)
+        if updated > 0:  # لو تم تعديل صف واحد على الأقل (يعني المنتج موجود)
             conn.commit()  # حفظ التغييرات في قاعدة البيانات
+            catalogue_cache.invalidate(("product", id))  # مسح النسخة القديمة من الكاش
+            catalogue_cache.invalidate_kind("categories")  # product_count و top_products
             cur.close()
-            conn.close()
+            images.schedule("products", id, image_url)  # لو الصورة اتغيرت النسخ القديمة اتمسحت (migrations/0005)
             return (
                 jsonify({"message": "Product updated successfully!"}),
                 200,
@@ -221,16 +445,15 @@ def update_product(id):
 
         else:  # لو متمش تعديل أي صف (يعني المنتج مش موجود)
             cur.close()
-            conn.close()
             return (
                 jsonify({"message": "Product not found."}),
                 404,
             )  # رد خطأ "غير موجود" (Not Found)
 
     except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to update product.")
         if conn:
             conn.rollback()  # تراجع عن التغييرات في حالة الخطأ
-            conn.close()
         return (
             jsonify({"message": "Failed to update product.", "error": str(error)}),
             500,
@@ -245,14 +468,14 @@ def delete_product(id):
         conn = get_db_connection()
         cur = conn.cursor()
 
-        # أمر SQL لحذف منتج من جدول products بناءً على الـ ID
-        query = "DELETE FROM products WHERE id = %s;"
-        cur.execute(query, (id,))  # تمرير الـ ID كـ parameter في الأمر
+        # حذف منتج من جدول products بناءً على الـ ID
+        deleted = repository.delete_product(cur, id)
 
-        if cur.rowcount > 0:  # لو تم حذف صف واحد على الأقل (يعني المنتج موجود)
+        if deleted > 0:  # لو تم حذف صف واحد على الأقل (يعني المنتج موجود)
             conn.commit()  # حفظ التغييرات في قاعدة البيانات
+            catalogue_cache.invalidate(("product", id))
+            catalogue_cache.invalidate_kind("categories")  # product_count و top_products
             cur.close()
-            conn.close()
             return (
                 jsonify({"message": "Product deleted successfully!"}),
                 200,
@@ -260,16 +483,15 @@ def delete_product(id):
 
         else:  # لو متمش حذف أي صف (يعني المنتج مش موجود)
             cur.close()
-            conn.close()
             return (
                 jsonify({"message": "Product not found."}),
                 404,
             )  # رد خطأ "غير موجود" (Not Found)
 
     except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to delete product.")
         if conn:
             conn.rollback()  # تراجع عن التغييرات في حالة الخطأ
-            conn.close()
         return (
             jsonify({"message": "Failed to delete product.", "error": str(error)}),
             500,
@@ -292,14 +514,13 @@ def create_category():
         description = data["description"]
         image_url = data["image_url"]
 
-        # أمر SQL لإضافة تصنيف جديد في جدول categories
-        query = "INSERT INTO categories (name, description, image_url) VALUES (%s, %s, %s) RETURNING id;"
-        cur.execute(query, (name, description, image_url))
-        category_id = cur.fetchone()[0]  # جلب الـ ID بتاع التصنيف الجديد اللي تم إضافته
+        # إضافة تصنيف جديد في جدول categories وجلب الـ ID بتاعه
+        category_id = repository.insert_category(cur, name, description, image_url)
 
         conn.commit()  # حفظ التغييرات في قاعدة البيانات
+        catalogue_cache.invalidate_kind("categories")  # قايمة التصنيفات اتغيرت
         cur.close()
-        conn.close()
+        images.schedule("categories", category_id, image_url)
 
         return (
             jsonify(
@@ -312,9 +533,9 @@ def create_category():
         )  # رد ناجح مع رسالة و ID التصنيف الجديد
 
     except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to create category.")
         if conn:
             conn.rollback()  # تراجع عن التغييرات في حالة الخطأ
-            conn.close()
         return (
             jsonify({"message": "Failed to create category.", "error": str(error)}),
             500,
@@ -322,42 +543,81 @@ def create_category():
 
 
 # API لجلب قائمة التصنيفات كلها (Get All Categories - GET /categories)
+# مع ?stream=1 (أو Accept: application/x-ndjson) بترجع على دفعات زي GET /products
+# ?include=counts,top=3 بيضيف لكل تصنيف product_count و top_products (أحدث 3 منتجات) في نفس الـ query
+# عشان شاشة التصنيفات متحتاجش طلب لكل تصنيف
 @app.route("/categories", methods=["GET"])
 def get_categories():
+    stream = wants_stream(request)
+    try:
+        counts, top = repository.parse_category_include(request.args)
+    except ValueError as error:
+        return (
+            jsonify({"message": "Invalid query parameters.", "error": str(error)}),
+            400,
+        )  # رد خطأ "Bad Request"
+    cache_key = ("categories", request.query_string.decode())  # كل query string ليها مكانها في الكاش
+    if not stream:
+        cached = catalogue_cache.get(cache_key)
+        if cached is not MISSING:
+            categories_list, etag, last_modified = cached
+            if is_not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+            return add_validators(jsonify(categories_list), etag, last_modified), 200
+
     conn = None
     try:
-        conn = get_db_connection()
+        generation = catalogue_cache.generation
+        conn = get_read_connection()
         cur = conn.cursor()
 
-        # أمر SQL لجلب كل التصنيفات من جدول categories
-        query = "SELECT * FROM categories;"
-        cur.execute(query)
-        categories = cur.fetchall()  # جلب كل الصفوف اللي رجعت من قاعدة البيانات
+        # فحص سريع لنسخة البيانات قبل ما نجيب الصفوف
+        # (مع include الرد بيعتمد على المنتجات كمان، فنسختها بتدخل في الـ ETag)
+        versions = [table_version(cur, "categories")]
+        if counts or top:
+            versions.append(table_version(cur, "products"))
+        version, last_modified = combine_versions(*versions)
+        etag = make_etag(
+            "categories",
+            *version,
+            request.query_string.decode(),
+            wants_ndjson(request),
+        )
+        if is_not_modified(request, etag, last_modified):
+            cur.close()
+            return not_modified_response(etag, last_modified)
+
+        if stream:
+            cur.close()
+            query, params = repository.categories_query(counts, top)
+            response = stream_query(
+                conn,
+                "categories_stream",
+                query,
+                params,
+                row_mapper(repository.category_columns(counts, top)),
+                ndjson=wants_ndjson(request),
+            )
+            return add_validators(response, etag, last_modified)
+
+        # جلب كل التصنيفات من جدول categories كقائمة ديكشنريز
+        categories_list = repository.list_categories(cur, counts, top)
 
         cur.close()
-        conn.close()
-
-        categories_list = []  # قائمة فاضية هنحط فيها التصنيفات بصيغة ديكشنري
-        for category in categories:
-            category_dict = {
-                "id": category[0],
-                "name": category[1],
-                "description": category[2],
-                "image_url": category[3],
-                "created_at": category[
-                    4
-                ].isoformat(),  # تحويل التاريخ والوقت لـ String بصيغة ISO
-                "updated_at": (
-                    category[5].isoformat() if category[5] else None
-                ),  # نفس الكلام بس لو updated_at مش موجود (None)
-            }
-            categories_list.append(category_dict)  # إضافة الديكشنري للقائمة
+        images.schedule_missing("categories", categories_list)
+        for category in categories_list:
+            images.schedule_missing("products", category.get("top_products", ()))
 
-        return jsonify(categories_list), 200  # رد ناجح مع قائمة التصنيفات
+        catalogue_cache.set(
+            cache_key, (categories_list, etag, last_modified), generation
+        )
+        return (
+            add_validators(jsonify(categories_list), etag, last_modified),
+            200,
+        )  # رد ناجح مع قائمة التصنيفات
 
     except (Exception, psycopg2.Error) as error:
-        if conn:
-            conn.close()
+        log.exception("Failed to get categories.")
         return (
             jsonify({"message": "Failed to get categories.", "error": str(error)}),
             500,
@@ -367,30 +627,34 @@ def get_categories():
 # API لجلب تصنيف واحد معين بمعرف الـ ID (Get Category by ID - GET /categories/{id})
 @app.route("/categories/<int:id>", methods=["GET"])
 def get_category(id):
+    cached = catalogue_cache.get(("category", id))
+    if cached is not MISSING:  # التصنيف موجود في الكاش
+        etag, last_modified = row_validators("category", cached)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        return add_validators(jsonify(cached), etag, last_modified), 200
+
     conn = None
     try:
-        conn = get_db_connection()
+        generation = catalogue_cache.generation
+        conn = get_read_connection()
         cur = conn.cursor()
 
-        # أمر SQL لجلب تصنيف واحد من جدول categories بناءً على الـ ID
-        query = "SELECT * FROM categories WHERE id = %s;"
-        cur.execute(query, (id,))  # تمرير الـ ID كـ parameter في الأمر
-
-        category = cur.fetchone()  # جلب صف واحد بس (التصنيف اللي ليه الـ ID ده)
+        # جلب تصنيف واحد من جدول categories بناءً على الـ ID (ديكشنري أو None)
+        category_dict = repository.get_category(cur, id)
 
         cur.close()
-        conn.close()
-
-        if category:  # لو التصنيف موجود (يعني الـ query رجع صف)
-            category_dict = {
-                "id": category[0],
-                "name": category[1],
-                "description": category[2],
-                "image_url": category[3],
-                "created_at": category[4].isoformat(),
-                "updated_at": category[5].isoformat() if category[5] else None,
-            }
-            return jsonify(category_dict), 200  # رد ناجح مع تفاصيل التصنيف
+
+        if category_dict:  # لو التصنيف موجود (يعني الـ query رجع صف)
+            catalogue_cache.set(("category", id), category_dict, generation)
+            images.schedule_missing("categories", [category_dict])
+            etag, last_modified = row_validators("category", category_dict)
+            if is_not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+            return (
+                add_validators(jsonify(category_dict), etag, last_modified),
+                200,
+            )  # رد ناجح مع تفاصيل التصنيف
 
         else:  # لو التصنيف مش موجود (يعني الـ query مرجعش صف)
             return (
@@ -399,8 +663,7 @@ def get_category(id):
             )  # رد خطأ "غير موجود" (Not Found)
 
     except (Exception, psycopg2.Error) as error:
-        if conn:
-            conn.close()
+        log.exception("Failed to get category.")
         return (
             jsonify({"message": "Failed to get category.", "error": str(error)}),
             500,
@@ -420,16 +683,15 @@ def update_category(id):
         description = data["description"]
         image_url = data["image_url"]
 
-        # أمر SQL لتعديل تصنيف موجود في جدول categories بناءً على الـ ID
-        query = "UPDATE categories SET name = %s, description = %s, image_url = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s;"
-        cur.execute(
-            query, (name, description, image_url, id)
-        )  # تمرير البيانات والـ ID كـ parameters في الأمر
+        # تعديل تصنيف موجود في جدول categories بناءً على الـ ID
+        updated = repository.update_category(cur, id, name, description, image_url)
 
-        if cur.rowcount > 0:  # لو تم تعديل صف واحد على الأقل (يعني التصنيف موجود)
+        if updated > 0:  # لو تم تعديل صف واحد على الأقل (يعني التصنيف موجود)
             conn.commit()  # حفظ التغييرات في قاعدة البيانات
+            catalogue_cache.invalidate(("category", id))
+            catalogue_cache.invalidate_kind("categories")
             cur.close()
-            conn.close()
+            images.schedule("categories", id, image_url)
             return (
                 jsonify({"message": "Category updated successfully!"}),
                 200,
@@ -437,16 +699,15 @@ def update_category(id):
 
         else:  # لو متمش تعديل أي صف (يعني التصنيف مش موجود)
             cur.close()
-            conn.close()
             return (
                 jsonify({"message": "Category not found."}),
                 404,
             )  # رد خطأ "غير موجود" (Not Found)
 
     except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to update category.")
         if conn:
             conn.rollback()  # تراجع عن التغييرات في حالة الخطأ
-            conn.close()
         return (
             jsonify({"message": "Failed to update category.", "error": str(error)}),
             500,
@@ -461,14 +722,14 @@ def delete_category(id):
         conn = get_db_connection()
         cur = conn.cursor()
 
-        # أمر SQL لحذف تصنيف من جدول categories بناءً على الـ ID
-        query = "DELETE FROM categories WHERE id = %s;"
-        cur.execute(query, (id,))  # تمرير الـ ID كـ parameter في الأمر
+        # حذف تصنيف من جدول categories بناءً على الـ ID
+        deleted = repository.delete_category(cur, id)
 
-        if cur.rowcount > 0:  # لو تم حذف صف واحد على الأقل (يعني التصنيف موجود)
+        if deleted > 0:  # لو تم حذف صف واحد على الأقل (يعني التصنيف موجود)
             conn.commit()  # حفظ التغييرات في قاعدة البيانات
+            catalogue_cache.invalidate(("category", id))
+            catalogue_cache.invalidate_kind("categories")
             cur.close()
-            conn.close()
             return (
                 jsonify({"message": "Category deleted successfully!"}),
                 200,
@@ -476,21 +737,231 @@ def delete_category(id):
 
         else:  # لو متمش حذف أي صف (يعني التصنيف مش موجود)
             cur.close()
-            conn.close()
             return (
                 jsonify({"message": "Category not found."}),
                 404,
             )  # رد خطأ "غير موجود" (Not Found)
 
+    except psycopg2.errors.ForeignKeyViolation:
+        if conn:
+            conn.rollback()
+        return (
+            jsonify({"message": "Category still has products."}),
+            409,
+        )  # رد خطأ "Conflict": لازم المنتجات تتنقل أو تتمسح الأول
+
     except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to delete category.")
         if conn:
             conn.rollback()  # تراجع عن التغييرات في حالة الخطأ
-            conn.close()
         return (
             jsonify({"message": "Failed to delete category.", "error": str(error)}),
             500,
         )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ
 
 
+# ---------------------------------------------------------------------------------------------------------------------------------
+# الصور المصغرة (images.py)
+
+
+# ملف نسخة مصغرة. الاسم هو الـ hash بتاع المحتوى فالرد عمره ما بيتغير (immutable)
+# في الإنتاج الأحسن nginx أو الـ CDN يخدم IMAGE_DIR على طول بنفس الـ Cache-Control
+@app.route("/images/<name>", methods=["GET"])
+def get_image(name):
+    path = images.image_path(name)
+    if path is None:
+        return jsonify({"message": "Image not found."}), 404
+    response = send_file(path, mimetype="image/webp", conditional=True)
+    response.headers["Cache-Control"] = images.IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+# تحويل لنسخة معينة من صورة منتج أو تصنيف
+# GET /products/1/images/thumb -> 302 لـ /images/<hash>.webp
+# لو النسخ لسه متعملتش بتتحط في طابور الخلفية والطلب ده بيتحول للـ image_url الأصلي
+# (تنزيل الصورة وتحويلها على الـ request thread كان بيمسك اتصال من الـ pool طول الوقت ده)
+def rendition_redirect(table, id, rendition):
+    if rendition not in dict(images.RENDITIONS):
+        return jsonify({"message": "Unknown rendition."}), 404
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        repository.execute(cur, images.GET_SOURCE[table], (id,))
+        row = cur.fetchone()
+        cur.close()
+        conn.rollback()
+        if row is None or not row[0]:
+            return jsonify({"message": "Image not found."}), 404
+        image_url, renditions = row
+        if renditions is None:
+            images.queue(table, id, image_url)
+
+    except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to get image.")
+        return (
+            jsonify({"message": "Failed to get image.", "error": str(error)}),
+            500,
+        )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ
+
+    response = redirect((renditions or {}).get(rendition) or image_url, 302)
+    response.headers["Cache-Control"] = "no-cache"  # النسخة بتتغير لو الصورة الأصلية اتغيرت
+    return response
+
+
+@app.route("/products/<int:id>/images/<rendition>", methods=["GET"])
+def get_product_image(id, rendition):
+    return rendition_redirect("products", id, rendition)
+
+
+@app.route("/categories/<int:id>/images/<rendition>", methods=["GET"])
+def get_category_image(id, rendition):
+    return rendition_redirect("categories", id, rendition)
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# الطلبات
+
+
+# عمل أوردر جديد من السلة (POST /orders)
+# الـ body: {"items": [{"product_id": 1, "quantity": 2}], "delivery_address": "...", "payment_method": "cash"}
+# الأسعار بتتحسب من قاعدة البيانات (مش من الموبايل) والمخزون بيتحجز والأوردر بيتكتب في transaction واحدة
+# Idempotency-Key header: لو الموبايل عاد نفس الطلب بنفس المفتاح بيرجعله نفس الأوردر (Idempotent-Replayed: true)
+@app.route("/orders", methods=["POST"])
+def create_order():
+    idempotency_key = request.headers.get("Idempotency-Key")
+    try:
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
+            raise OrderError(400, "Idempotency-Key must be 1 to 255 characters.")
+        order = orders.parse_order(request.get_json(silent=True))
+
+        conn = get_db_connection()
+        order_dict, created = orders.place_order(conn, order, idempotency_key)
+
+    except OrderError as error:
+        response = jsonify(error.to_dict())
+        if "retry_after" in error.details:
+            response.headers["Retry-After"] = str(error.details["retry_after"])
+        return response, error.status  # 400 / 409 / 422 حسب الخطأ
+
+    except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to create order.")
+        return (
+            jsonify({"message": "Failed to create order.", "error": str(error)}),
+            500,
+        )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ (place_order عملت rollback)
+
+    response = jsonify(order_dict)
+    if created:
+        for product_id, _ in order["items"]:  # المخزون اتغير
+            catalogue_cache.invalidate(("product", product_id))
+    else:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response, 201  # نفس الرد في الإعادة عشان الموبايل يكمل عادي
+
+
+# جلب أوردر بالـ ID (شاشة تفاصيل الطلب)
+@app.route("/orders/<int:id>", methods=["GET"])
+def get_order(id):
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        order_dict = orders.get_order(cur, id)
+        cur.close()
+
+        if order_dict:
+            return jsonify(order_dict), 200
+        else:
+            return (
+                jsonify({"message": "Order not found."}),
+                404,
+            )  # رد خطأ "غير موجود" (Not Found)
+
+    except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to get order.")
+        return (
+            jsonify({"message": "Failed to get order.", "error": str(error)}),
+            500,
+        )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+
+
+# التغييرات في الكتالوج من آخر sync (بدل ما الموبايل يحمل /products و /categories كلهم كل مرة)
+# GET /changes?since=<cursor>&fields=id,name,price
+# {"cursor": "...", "products": {"columns": [...], "rows": [[...]], "deleted": [ids]}, "categories": {...}}
+# أول مرة (من غير since) أو لو التغييرات كتير: {"reset": true} للجدول، فالـ client يحمله كله وبعدين يكمل بالـ cursor
+@app.route("/changes", methods=["GET"])
+def get_changes():
+    try:
+        since = repository.parse_changes_since(request.args)
+        product_columns = repository.changes_product_columns(request.args)
+    except ValueError as error:
+        return (
+            jsonify({"message": "Invalid query parameters.", "error": str(error)}),
+            400,
+        )  # رد خطأ "Bad Request"
+
+    conn = None
+    try:
+        # من الـ primary مش الـ replica: الـ cursor لازم يتحسب على نفس البيانات اللي بنرجعها
+        conn = get_db_connection()
+        cur = conn.cursor()
+        changes = repository.get_changes(cur, since, product_columns)
+        cur.close()
+        conn.rollback()
+        return jsonify(changes), 200
+
+    except (Exception, psycopg2.Error) as error:
+        log.exception("Failed to get changes.")
+        if conn:
+            conn.rollback()
+        return (
+            jsonify({"message": "Failed to get changes.", "error": str(error)}),
+            500,
+        )  # رد خطأ مع رسالة خطأ وتفاصيل الخطأ
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+
+
+# عدادات الكاش (hits/misses/evictions) عشان نعرف نظبط حجمه
+@app.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    return jsonify({**catalogue_cache.stats(), "sync": invalidation.stats()}), 200
+
+
+# مقاييس الأداء بصيغة Prometheus (histograms للطلبات وقاعدة البيانات + حالة الـ Pool والكاش)
+# ?format=json بيرجع p50/p95/p99 محسوبة لكل route
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    pool = db.get_pool().stats()
+    cache_stats = catalogue_cache.stats()
+    gauges = [
+        ("db_pool_in_use", "Connections currently checked out.", pool["in_use"]),
+        ("db_pool_idle", "Idle connections in the pool.", pool["idle"]),
+        ("db_pool_max", "Maximum pool size.", pool["max"]),
+        ("cache_entries", "Entries in the catalogue cache.", cache_stats["size"]),
+        ("cache_hit_ratio", "Catalogue cache hit ratio.", cache_stats["hit_rate"]),
+        ("http_requests_in_flight", "Requests being handled.", workers.counters.stats()["in_flight"]),
+    ] + ratelimit.gauges() + invalidation.gauges()
+    monitor = db.get_replica_monitor()
+    if monitor is not None:
+        replica = db.get_replica_pool().stats()
+        gauges += [
+            # -1 لو الـ replica مش شغالة
+            ("db_replica_lag_seconds", "Replication lag of the read replica.", -1 if monitor.lag is None else monitor.lag),
+            ("db_replica_usable", "1 if catalogue reads go to the replica.", int(monitor.usable())),
+            ("db_replica_pool_in_use", "Replica connections currently checked out.", replica["in_use"]),
+            ("db_replica_pool_idle", "Idle connections in the replica pool.", replica["idle"]),
+        ]
+    if request.args.get("format") == "json":
+        return jsonify(metrics.summary(gauges)), 200
+    return Response(metrics.render(gauges), content_type=metrics.PROMETHEUS_MIMETYPE)
+
+
+# سيرفر التطوير بس، في الـ production استخدم gunicorn -c gunicorn.conf.py app:app
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,757 @@
+# نسخة ASGI من الـ API بنفس الـ routes بتاعة المنتجات والتصنيفات، بس async بالكامل (Starlette + asyncpg)
+# الـ worker الواحد بيقدر يمسك مئات الاتصالات البطيئة في نفس الوقت لأن مفيش thread واقف مستني قاعدة البيانات
+# التشغيل: uvicorn asgi:app --host 0.0.0.0 --port 8000
+# (app.py لسه زي ما هو للـ WSGI، والاتنين بيستخدموا نفس الكاش والإعدادات ونفس شكل الردود)
+
+import asyncio
+import contextlib
+import json
+import logging
+import time
+
+import asyncpg
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import compression
+import db
+import images
+import invalidation
+import metrics
+import migrate
+import ratelimit
+import repository
+import serialization
+from cache import MISSING, catalogue_cache
+from conditional import (
+    combine_versions,
+    headers_not_modified,
+    make_etag,
+    row_validators,
+    table_version_query,
+    validator_headers,
+)
+from db import (
+    DB_CONFIG,
+    POOL_MAX_SIZE,
+    POOL_MIN_SIZE,
+    POOL_TIMEOUT,
+    REPLICA_CONFIG,
+    REPLICA_CONNECT_TIMEOUT,
+)
+from repository import (
+    CATEGORY_COLUMNS,
+    PRODUCT_COLUMNS,
+    PRODUCTS_DEFAULT_LIMIT,
+    PRODUCTS_MAX_LIMIT,
+    numbered,
+    parse_product_fields,
+    parse_product_filters,
+    row_mapper,
+)
+from streaming import (
+    JSON_MIMETYPE,
+    NDJSON_MIMETYPE,
+    STREAM_BATCH_SIZE,
+    accepts_ndjson,
+)
+from serialization import dumps
+
+metrics.configure_logging()
+log = logging.getLogger(__name__)
+
+pool = None  # الـ asyncpg pool، بيتعمل لما السيرفر يبدأ
+replica_pool = None  # pool الـ replica لو DB_REPLICA_HOST متحدد (db.py)
+trigram = None  # هل pg_trgm متسطب (بنسأل مرة واحدة بس)
+
+
+def json_response(data, status=200, headers=None):
+    # نفس شكل jsonify بتاع Flask (الـ keys مترتبة ومن غير مسافات)
+    return Response(dumps(data), status, headers, media_type=JSON_MIMETYPE)
+
+
+def error_response(message, error, status=500):
+    if status >= 500:
+        log.exception(message)
+    return json_response({"message": message, "error": str(error)}, status)
+
+
+# اتصال من الـ pool مع قياس وقت الانتظار (زي ConnectionPool.getconn في db.py)
+# request: لقراية الكتالوج بس، بتروح للـ replica بنفس قواعد db.get_read_connection
+@contextlib.asynccontextmanager
+async def acquire(request=None):
+    start = time.perf_counter()
+    source = conn = None
+    if (
+        request is not None
+        and replica_pool is not None
+        and db.prefer_replica(request.cookies.get(db.STICKY_COOKIE))
+    ):
+        try:
+            conn = await replica_pool.acquire(timeout=POOL_TIMEOUT)
+            source = replica_pool
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as error:
+            log.warning("Replica connection failed, reading from primary: %s", error)
+    if conn is None:
+        conn = await pool.acquire(timeout=POOL_TIMEOUT)
+        source = pool
+    metrics.observe_pool_wait(time.perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        await source.release(conn)
+
+
+# بعد أي تعديل ناجح: نفس الـ cookie بتاع db.init_app عشان الـ client يقرا اللي كتبه من الـ primary
+class StickyWritesMiddleware:
+    READ_ONLY_PATHS = {"/products/batch"}  # POST بس مش بيعدل حاجة
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in db.WRITE_METHODS
+            or scope["path"] in self.READ_ONLY_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                db.mark_write()
+                if REPLICA_CONFIG is not None:
+                    cookie = "%s=%.3f; Max-Age=%d; Path=/; HttpOnly; SameSite=Lax" % (
+                        db.STICKY_COOKIE,
+                        time.time() + db.STICKY_SECONDS,
+                        int(db.STICKY_SECONDS) + 1,
+                    )
+                    headers = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# asyncpg بيبلغ عن كل query بعد ما تخلص (الوقت شامل الـ execute وقراية الصفوف)
+# الـ plan مش بنجيبه هنا لأن الاتصال ممكن يكون مشغول بـ query تانية في نفس اللحظة
+def log_query(record):
+    metrics.observe_query("execute", record.elapsed)
+    if record.exception is None and metrics.is_slow(record.elapsed):
+        metrics.log_slow_query(record.query, record.elapsed)
+
+
+async def init_connection(conn):
+    conn.add_query_logger(log_query)
+    # asyncpg بيرجع json و jsonb كـ string، psycopg2 بيحولهم لـ list/dict (top_products و images)
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(
+            type_name, encoder=json.dumps, decoder=serialization.loads, schema="pg_catalog"
+        )
+
+
+def not_modified(request, etag, last_modified):
+    return headers_not_modified(
+        request.headers.get("if-none-match"),
+        request.headers.get("if-modified-since"),
+        etag,
+        last_modified,
+    )
+
+
+def wants_ndjson(request):
+    return accepts_ndjson(request.headers.get("accept"))
+
+
+def wants_stream(request):
+    return request.query_params.get("stream") in ("1", "true") or wants_ndjson(request)
+
+
+# عدد الصفوف اللي اتأثرت من status بتاع asyncpg (زي "UPDATE 1")
+def rowcount(status):
+    return int(status.split()[-1])
+
+
+# نفس الـ SQL بتاع repository.py بس بـ $1, $2 (asyncpg بيعمل prepare وبيخزن الـ statements لوحده)
+CATEGORY_EXISTS = numbered(repository.CATEGORY_EXISTS)
+INSERT_PRODUCT = numbered(repository.INSERT_PRODUCT)
+GET_PRODUCT = numbered(repository.GET_PRODUCT)
+UPDATE_PRODUCT = numbered(repository.UPDATE_PRODUCT)
+DELETE_PRODUCT = numbered(repository.DELETE_PRODUCT)
+GET_CATEGORY = numbered(repository.GET_CATEGORY)
+INSERT_CATEGORY = numbered(repository.INSERT_CATEGORY)
+UPDATE_CATEGORY = numbered(repository.UPDATE_CATEGORY)
+DELETE_CATEGORY = numbered(repository.DELETE_CATEGORY)
+CHANGES_CURSOR = numbered(repository.CHANGES_CURSOR)
+DELETED_ROWS = {table: numbered(query) for table, query in repository.DELETED_ROWS.items()}
+
+
+# للتحقق من الاتصال بقاعدة البيانات
+async def hello_world(request):
+    try:
+        async with acquire():
+            return PlainTextResponse("Hello, World! - Connected to PostgreSQL!")
+    except Exception:
+        return PlainTextResponse("Hello, World! - Not connected to PostgreSQL!")
+
+
+# إضافة منتج جديد
+async def create_product(request):
+    try:
+        data = await request.json()
+        name = data["name"]
+        description = data["description"]
+        price = data["price"]
+        image_url = data["image_url"]
+        category_id = int(data["category_id"])
+
+        async with acquire() as conn:
+            async with conn.transaction():
+                category = await conn.fetchval(CATEGORY_EXISTS, category_id)
+                if category is None:
+                    return json_response(
+                        {"message": "Invalid category_id. Category does not exist."},
+                        400,
+                    )
+                product_id = await conn.fetchval(
+                    INSERT_PRODUCT,
+                    name,
+                    description,
+                    price,
+                    image_url,
+                    category_id,
+                )
+        catalogue_cache.invalidate(("product", product_id))
+        catalogue_cache.invalidate_kind("categories")  # product_count و top_products
+        return json_response(
+            {"message": "Product created successfully!", "product_id": product_id}, 201
+        )
+    except Exception as error:
+        return error_response("Failed to create product.", error)
+
+
+# منتجات كتير بالـ ids في رد واحد (زي products_by_ids_response في app.py)
+async def products_by_ids_response(request, raw_ids, max_ids):
+    try:
+        ids = repository.parse_product_ids(raw_ids, max_ids)
+        columns = parse_product_fields(request.query_params)
+    except (ValueError, TypeError) as error:
+        return error_response("Invalid product ids.", error, 400)
+
+    full_rows = len(columns) == len(PRODUCT_COLUMNS)  # الكاش فيه المنتج كامل بس
+    found = {}
+    if full_rows:
+        for id in ids:
+            cached = catalogue_cache.get(("product", id))
+            if cached is not MISSING:
+                found[id] = cached
+
+    remaining = [id for id in ids if id not in found]
+    if remaining:
+        select_columns = tuple(columns) if "id" in columns else ("id",) + tuple(columns)
+        query = numbered(repository.products_by_ids_query(select_columns))
+        try:
+            generation = catalogue_cache.generation
+            async with acquire(request) as conn:
+                products = await conn.fetch(query, remaining)
+        except Exception as error:
+            return error_response("Failed to get products.", error)
+        to_dict = row_mapper(select_columns, tuple(columns))
+        for product in products:
+            product_dict = to_dict(product)
+            if full_rows:
+                catalogue_cache.set(("product", product["id"]), product_dict, generation)
+            found[product["id"]] = product_dict
+
+    return json_response(
+        {
+            "products": [found[id] for id in ids if id in found],
+            "missing": [id for id in ids if id not in found],
+        }
+    )
+
+
+# POST /products/batch (زي app.py)
+async def get_products_batch(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        data = data.get("ids")
+    return await products_by_ids_response(request, data, repository.PRODUCTS_MAX_IDS)
+
+
+# جلب قائمة المنتجات (نفس الـ parameters بتاعة GET /products في app.py)
+async def get_products(request):
+    args = request.query_params
+    if "ids" in args:
+        return await products_by_ids_response(request, args.get("ids"), PRODUCTS_MAX_LIMIT)
+    stream = wants_stream(request)
+    ndjson = wants_ndjson(request)
+    try:
+        conditions, params = parse_product_filters(args)
+        columns = parse_product_fields(args)
+        if stream and "limit" not in args:
+            limit = None
+        else:
+            limit = int(args.get("limit", PRODUCTS_DEFAULT_LIMIT))
+            if limit < 1:
+                raise ValueError("limit must be a positive integer.")
+            if not stream:
+                limit = min(limit, PRODUCTS_MAX_LIMIT)
+        cursor = args.get("cursor")
+        if cursor is not None:
+            conditions.append("id > %s")
+            params.append(int(cursor))
+    except ValueError as error:
+        return error_response("Invalid query parameters.", error, 400)
+
+    try:
+        async with acquire(request) as conn:
+            count, max_id, last_modified = await conn.fetchrow(
+                numbered(table_version_query("products", conditions)), *params
+            )
+            etag = make_etag(
+                "products",
+                count,
+                max_id,
+                last_modified,
+                request.url.query,
+                ndjson,
+            )
+            headers = validator_headers(etag, last_modified)
+            if not_modified(request, etag, last_modified):
+                return Response(status_code=304, headers=headers)
+
+            if not stream:
+                select_columns = (
+                    tuple(columns) if "id" in columns else ("id",) + tuple(columns)
+                )
+                query = repository.products_query(select_columns, conditions, limit=True)
+                products = await conn.fetch(numbered(query), *params, limit + 1)
+
+                if len(products) > limit:
+                    products = products[:limit]
+                    headers["X-Next-Cursor"] = str(products[-1]["id"])
+                to_dict = row_mapper(select_columns, tuple(columns))
+                return json_response(
+                    [to_dict(product) for product in products], headers=headers
+                )
+    except Exception as error:
+        return error_response("Failed to get products.", error)
+
+    query = repository.products_query(columns, conditions, limit=limit is not None)
+    if limit is not None:
+        params.append(limit)
+    return StreamingResponse(
+        stream_rows(request, numbered(query), params, columns, ndjson),
+        media_type=NDJSON_MIMETYPE if ndjson else JSON_MIMETYPE,
+        headers=headers,
+    )
+
+
+# البحث في المنتجات (نفس GET /products/search في app.py)
+async def search_products(request):
+    global trigram
+    args = request.query_params
+    try:
+        text, offset = repository.parse_search_args(args)
+        conditions, params = parse_product_filters(args)
+        columns = parse_product_fields(args)
+        limit = int(args.get("limit", PRODUCTS_DEFAULT_LIMIT))
+        if limit < 1:
+            raise ValueError("limit must be a positive integer.")
+        limit = min(limit, PRODUCTS_MAX_LIMIT)
+    except ValueError as error:
+        return error_response("Invalid query parameters.", error, 400)
+
+    try:
+        async with acquire(request) as conn:
+            if trigram is None:
+                trigram = await conn.fetchval(repository.HAS_TRIGRAM)
+            query = repository.search_query(columns, conditions, trigram)
+            products = await conn.fetch(
+                numbered(query),
+                *repository.search_params(text, params, trigram, limit + 1, offset),
+            )
+    except Exception as error:
+        return error_response("Failed to search products.", error)
+
+    headers = {}
+    if len(products) > limit:
+        products = products[:limit]
+        headers["X-Next-Cursor"] = str(offset + limit)
+    to_dict = row_mapper(tuple(columns))
+    return json_response([to_dict(product) for product in products], headers=headers)
+
+
+# بيبعت الصفوف على دفعات من server-side cursor (asyncpg cursor لازم يكون جوه transaction)
+async def stream_rows(request, query, params, columns, ndjson):
+    async with acquire(request) as conn:
+        async with conn.transaction():
+            if not ndjson:
+                yield b"["
+            batch = []
+            first = True
+            to_dict = row_mapper(tuple(columns))
+            async for record in conn.cursor(query, *params, prefetch=STREAM_BATCH_SIZE):
+                batch.append(dumps(to_dict(record)))
+                if len(batch) >= STREAM_BATCH_SIZE:
+                    yield stream_chunk(batch, first, ndjson)
+                    batch = []
+                    first = False
+            if batch:
+                yield stream_chunk(batch, first, ndjson)
+            if not ndjson:
+                yield b"]"
+
+
+def stream_chunk(batch, first, ndjson):
+    if ndjson:
+        return b"".join(item + b"\n" for item in batch)
+    chunk = b",".join(batch)
+    return chunk if first else b"," + chunk
+
+
+# جلب منتج بناءً على الـ ID
+async def get_product(request):
+    id = request.path_params["id"]
+    product_dict = catalogue_cache.get(("product", id))
+    if product_dict is MISSING:
+        try:
+            generation = catalogue_cache.generation
+            async with acquire(request) as conn:
+                product = await conn.fetchrow(GET_PRODUCT, id)
+        except Exception as error:
+            return error_response("Failed to get product.", error)
+        if product is None:
+            return json_response({"message": "Product not found."}, 404)
+        product_dict = row_mapper(PRODUCT_COLUMNS)(product)
+        catalogue_cache.set(("product", id), product_dict, generation)
+
+    etag, last_modified = row_validators("product", product_dict)
+    headers = validator_headers(etag, last_modified)
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return json_response(product_dict, headers=headers)
+
+
+# تعديل منتج بناءً على الـ ID
+async def update_product(request):
+    id = request.path_params["id"]
+    try:
+        data = await request.json()
+        name = data["name"]
+        description = data["description"]
+        price = data["price"]
+        image_url = data["image_url"]
+        category_id = int(data["category_id"])
+
+        async with acquire() as conn:
+            async with conn.transaction():
+                category = await conn.fetchval(CATEGORY_EXISTS, category_id)
+                if category is None:
+                    return json_response(
+                        {"message": "Invalid category_id. Category does not exist."},
+                        400,
+                    )
+                status = await conn.execute(
+                    UPDATE_PRODUCT,
+                    name,
+                    description,
+                    price,
+                    image_url,
+                    category_id,
+                    id,
+                )
+        if rowcount(status) > 0:
+            catalogue_cache.invalidate(("product", id))
+            catalogue_cache.invalidate_kind("categories")  # product_count و top_products
+            return json_response({"message": "Product updated successfully!"})
+        return json_response({"message": "Product not found."}, 404)
+    except Exception as error:
+        return error_response("Failed to update product.", error)
+
+
+# حذف منتج بناءً على الـ ID
+async def delete_product(request):
+    id = request.path_params["id"]
+    try:
+        async with acquire() as conn:
+            status = await conn.execute(DELETE_PRODUCT, id)
+        if rowcount(status) > 0:
+            catalogue_cache.invalidate(("product", id))
+            catalogue_cache.invalidate_kind("categories")  # product_count و top_products
+            return json_response({"message": "Product deleted successfully!"})
+        return json_response({"message": "Product not found."}, 404)
+    except Exception as error:
+        return error_response("Failed to delete product.", error)
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+
+
+# إنشاء تصنيف جديد
+async def create_category(request):
+    try:
+        data = await request.json()
+        async with acquire() as conn:
+            category_id = await conn.fetchval(
+                INSERT_CATEGORY,
+                data["name"],
+                data["description"],
+                data["image_url"],
+            )
+        catalogue_cache.invalidate_kind("categories")
+        return json_response(
+            {"message": "Category created successfully!", "category_id": category_id},
+            201,
+        )
+    except Exception as error:
+        return error_response("Failed to create category.", error)
+
+
+# جلب قائمة التصنيفات كلها
+# ?include=counts,top=3 زي app.py
+async def get_categories(request):
+    stream = wants_stream(request)
+    ndjson = wants_ndjson(request)
+    try:
+        counts, top = repository.parse_category_include(request.query_params)
+    except ValueError as error:
+        return error_response("Invalid query parameters.", error, 400)
+    columns = repository.category_columns(counts, top)
+    cache_key = ("categories", request.url.query)
+    if not stream:
+        cached = catalogue_cache.get(cache_key)
+        if cached is not MISSING:
+            categories_list, etag, last_modified = cached
+            headers = validator_headers(etag, last_modified)
+            if not_modified(request, etag, last_modified):
+                return Response(status_code=304, headers=headers)
+            return json_response(categories_list, headers=headers)
+
+    query, params = repository.categories_query(counts, top)
+    query = numbered(query)
+    try:
+        generation = catalogue_cache.generation
+        async with acquire(request) as conn:
+            versions = [await conn.fetchrow(table_version_query("categories"))]
+            if counts or top:
+                versions.append(await conn.fetchrow(table_version_query("products")))
+            version, last_modified = combine_versions(*versions)
+            etag = make_etag("categories", *version, request.url.query, ndjson)
+            headers = validator_headers(etag, last_modified)
+            if not_modified(request, etag, last_modified):
+                return Response(status_code=304, headers=headers)
+            if not stream:
+                categories = await conn.fetch(query, *params)
+                to_dict = row_mapper(columns)
+                categories_list = [to_dict(category) for category in categories]
+                catalogue_cache.set(
+                    cache_key, (categories_list, etag, last_modified), generation
+                )
+                return json_response(categories_list, headers=headers)
+    except Exception as error:
+        return error_response("Failed to get categories.", error)
+
+    return StreamingResponse(
+        stream_rows(request, query, list(params), columns, ndjson),
+        media_type=NDJSON_MIMETYPE if ndjson else JSON_MIMETYPE,
+        headers=headers,
+    )
+
+
+# جلب تصنيف واحد بالـ ID
+async def get_category(request):
+    id = request.path_params["id"]
+    category_dict = catalogue_cache.get(("category", id))
+    if category_dict is MISSING:
+        try:
+            generation = catalogue_cache.generation
+            async with acquire(request) as conn:
+                category = await conn.fetchrow(GET_CATEGORY, id)
+        except Exception as error:
+            return error_response("Failed to get category.", error)
+        if category is None:
+            return json_response({"message": "Category not found."}, 404)
+        category_dict = row_mapper(CATEGORY_COLUMNS)(category)
+        catalogue_cache.set(("category", id), category_dict, generation)
+
+    etag, last_modified = row_validators("category", category_dict)
+    headers = validator_headers(etag, last_modified)
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return json_response(category_dict, headers=headers)
+
+
+# تعديل تصنيف بالـ ID
+async def update_category(request):
+    id = request.path_params["id"]
+    try:
+        data = await request.json()
+        async with acquire() as conn:
+            status = await conn.execute(
+                UPDATE_CATEGORY,
+                data["name"],
+                data["description"],
+                data["image_url"],
+                id,
+            )
+        if rowcount(status) > 0:
+            catalogue_cache.invalidate(("category", id))
+            catalogue_cache.invalidate_kind("categories")
+            return json_response({"message": "Category updated successfully!"})
+        return json_response({"message": "Category not found."}, 404)
+    except Exception as error:
+        return error_response("Failed to update category.", error)
+
+
+# حذف تصنيف بالـ ID
+async def delete_category(request):
+    id = request.path_params["id"]
+    try:
+        async with acquire() as conn:
+            status = await conn.execute(DELETE_CATEGORY, id)
+        if rowcount(status) > 0:
+            catalogue_cache.invalidate(("category", id))
+            catalogue_cache.invalidate_kind("categories")
+            return json_response({"message": "Category deleted successfully!"})
+        return json_response({"message": "Category not found."}, 404)
+    except asyncpg.ForeignKeyViolationError:
+        return json_response({"message": "Category still has products."}, 409)
+    except Exception as error:
+        return error_response("Failed to delete category.", error)
+
+
+# ملف نسخة مصغرة من صورة (زي GET /images/<name> في app.py). النسخ نفسها بيعملها app.py أو python images.py --backfill
+async def get_image(request):
+    path = images.image_path(request.path_params["name"])
+    if path is None:
+        return json_response({"message": "Image not found."}, 404)
+    return FileResponse(
+        path,
+        media_type="image/webp",
+        headers={"Cache-Control": images.IMMUTABLE_CACHE_CONTROL},
+    )
+
+
+# نفس GET /changes بتاع app.py (من الـ primary برضه)
+async def get_changes(request):
+    try:
+        since = repository.parse_changes_since(request.query_params)
+        product_columns = repository.changes_product_columns(request.query_params)
+    except ValueError as error:
+        return error_response("Invalid query parameters.", error, 400)
+
+    try:
+        async with acquire() as conn:
+            cursor, now = await conn.fetchrow(
+                CHANGES_CURSOR, repository.CHANGES_OVERLAP, repository.CHANGES_MAX_TRANSACTION
+            )
+            changes = {"cursor": cursor.isoformat()}
+            expired = repository.changes_expired(since, now)
+            for table, columns in (("products", product_columns), ("categories", CATEGORY_COLUMNS)):
+                if expired:
+                    changes[table] = {"reset": True}
+                    continue
+                limit = repository.CHANGES_MAX_ROWS + 1
+                rows = await conn.fetch(
+                    numbered(repository.changed_rows_query(table, columns)), since, limit
+                )
+                deleted = await conn.fetch(DELETED_ROWS[table], since, limit)
+                changes[table] = repository.changes_section(
+                    columns, rows, [row[0] for row in deleted]
+                )
+    except Exception as error:
+        return error_response("Failed to get changes.", error)
+    return json_response(changes)
+
+
+async def get_cache_stats(request):
+    return json_response({**catalogue_cache.stats(), "sync": invalidation.stats()})
+
+
+# نفس GET /metrics بتاع app.py بس بحالة الـ asyncpg pool
+async def get_metrics(request):
+    cache_stats = catalogue_cache.stats()
+    gauges = [
+        ("db_pool_in_use", "Connections currently checked out.", pool.get_size() - pool.get_idle_size()),
+        ("db_pool_idle", "Idle connections in the pool.", pool.get_idle_size()),
+        ("db_pool_max", "Maximum pool size.", pool.get_max_size()),
+        ("cache_entries", "Entries in the catalogue cache.", cache_stats["size"]),
+        ("cache_hit_ratio", "Catalogue cache hit ratio.", cache_stats["hit_rate"]),
+    ] + ratelimit.gauges() + invalidation.gauges()
+    monitor = db.get_replica_monitor()
+    if monitor is not None and replica_pool is not None:
+        gauges += [
+            ("db_replica_lag_seconds", "Replication lag of the read replica.", -1 if monitor.lag is None else monitor.lag),
+            ("db_replica_usable", "1 if catalogue reads go to the replica.", int(monitor.usable())),
+            ("db_replica_pool_in_use", "Replica connections currently checked out.", replica_pool.get_size() - replica_pool.get_idle_size()),
+            ("db_replica_pool_idle", "Idle connections in the replica pool.", replica_pool.get_idle_size()),
+        ]
+    if request.query_params.get("format") == "json":
+        return json_response(metrics.summary(gauges))
+    return Response(metrics.render(gauges), media_type=metrics.PROMETHEUS_MIMETYPE)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global pool, replica_pool
+    migrate.check_schema()  # مش هنشتغل على قاعدة بيانات ناقصها migrations (python migrate.py)
+    # نفس إعدادات الاتصال والـ Pool بتاعة db.py
+    pool = await asyncpg.create_pool(
+        min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, init=init_connection, **DB_CONFIG
+    )
+    if REPLICA_CONFIG is not None:
+        # من غير اتصالات من الأول عشان لو الـ replica واقعة السيرفر يشتغل عادي على الـ primary
+        replica_pool = await asyncpg.create_pool(
+            min_size=0,
+            max_size=POOL_MAX_SIZE,
+            init=init_connection,
+            timeout=REPLICA_CONNECT_TIMEOUT,
+            **REPLICA_CONFIG,
+        )
+    invalidation.start()  # بعد الـ fork لو فيه أكتر من worker
+    try:
+        yield
+    finally:
+        if replica_pool is not None:
+            await replica_pool.close()
+            replica_pool = None
+        await pool.close()
+        pool = None
+
+
+app = Starlette(
+    routes=[
+        Route("/", hello_world),
+        Route("/products", get_products, methods=["GET"]),
+        Route("/products", create_product, methods=["POST"]),
+        Route("/products/search", search_products, methods=["GET"]),
+        Route("/products/batch", get_products_batch, methods=["POST"]),
+        Route("/products/{id:int}", get_product, methods=["GET"]),
+        Route("/products/{id:int}", update_product, methods=["PUT"]),
+        Route("/products/{id:int}", delete_product, methods=["DELETE"]),
+        Route("/categories", get_categories, methods=["GET"]),
+        Route("/categories", create_category, methods=["POST"]),
+        Route("/categories/{id:int}", get_category, methods=["GET"]),
+        Route("/categories/{id:int}", update_category, methods=["PUT"]),
+        Route("/categories/{id:int}", delete_category, methods=["DELETE"]),
+        Route("/images/{name}", get_image, methods=["GET"]),
+        Route("/changes", get_changes, methods=["GET"]),
+        Route("/cache/stats", get_cache_stats, methods=["GET"]),
+        Route("/metrics", get_metrics, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(metrics.ASGIMetricsMiddleware),
+        Middleware(ratelimit.ASGIRateLimitMiddleware),  # قبل أي شغل (والطلب المرفوض بيتقاس برضه)
+        Middleware(StickyWritesMiddleware),
+        Middleware(compression.ASGICompressionMiddleware),  # جوه الـ metrics عشان تتقاس البايتات المضغوطة
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,197 @@
+# مقارنة حجم الردود (البايتات اللي بتتبعت) ووقت الـ CPU بتاع تحويلها لـ JSON قبل وبعد serialization.py و compression.py
+#
+#   python bench_payloads.py                                   -> صفوف منتجات متولدة (من غير قاعدة بيانات)
+#   python bench_payloads.py --rows 20 --rows 100 --rows 1000 --json payloads.json
+#   python bench_payloads.py --url http://127.0.0.1:5000       -> الحجم الحقيقي من سيرفر شغال لكل Accept-Encoding
+#
+# "before" هو الطريقة القديمة: تحويل كل صف بـ float()/isoformat() وبعدين json.dumps (زي jsonify)
+# "after" هو الصفوف زي ما هي و serialization.dumps، والحجم بعد gzip و brotli (لو متسطب)
+
+import argparse
+import datetime
+import http.client
+import json
+import time
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+import compression
+from repository import PRODUCT_COLUMNS, row_mapper
+from serialization import dumps, orjson
+
+DEFAULT_ROWS = [20, 100, 1000]
+DEFAULT_PATHS = ["/products?limit=20", "/products?limit=100", "/categories?include=counts,top"]
+NAMES = ["كنافة بالقشطة", "بسبوسة", "أم علي", "رز بلبن", "Cheesecake", "Basbousa"]
+
+
+# صفوف بنفس شكل اللي بيرجع من psycopg2 (Decimal للسعر و datetime للتواريخ)
+# القيم بالاسم وبعدين بترتيب PRODUCT_COLUMNS، فلو عمود اتضاف للجدول القيم متزحلقش
+def make_rows(count):
+    base = datetime.datetime(2024, 1, 1, 12, 0, 0, 123456)
+    rows = []
+    for i in range(1, count + 1):
+        created = base + datetime.timedelta(minutes=i)
+        values = {
+            "id": i,
+            "name": NAMES[i % len(NAMES)] + " " + str(i),
+            "description": "وصف المنتج رقم %d - طازة كل يوم" % i,
+            "price": Decimal("%d.%02d" % (10 + i % 90, i % 100)),
+            "image_url": "https://cdn.example.com/products/%d.jpg" % i,
+            "category_id": 1 + i % 8,
+            "stock": None if i % 3 else i % 50,
+            # نص الصفوف عندها نسخ مصغرة (images.py) والباقي لسه
+            "images": {
+                name: "/images/%032x.webp" % (i * 10 + n) for n, name in enumerate(("thumb", "detail", "retina"))
+            }
+            if i % 2
+            else None,
+            "created_at": created,
+            "updated_at": created + datetime.timedelta(days=1) if i % 2 else None,
+        }
+        rows.append(tuple(values[column] for column in PRODUCT_COLUMNS))
+    return rows
+
+
+# الطريقة القديمة (قبل serialization.py)
+_OLD_CONVERTERS = {
+    "price": float,
+    "created_at": lambda value: value.isoformat(),
+    "updated_at": lambda value: value.isoformat(),
+}
+
+
+def old_encode(rows):
+    result = []
+    for row in rows:
+        item = {}
+        for column, value in zip(PRODUCT_COLUMNS, row):
+            converter = _OLD_CONVERTERS.get(column)
+            item[column] = converter(value) if converter and value is not None else value
+        result.append(item)
+    return (json.dumps(result, separators=(",", ":"), sort_keys=True) + "\n").encode()
+
+
+def new_encode(rows):
+    to_dict = row_mapper(PRODUCT_COLUMNS)
+    return dumps([to_dict(row) for row in rows])
+
+
+# متوسط وقت الـ CPU لكل مرة بالميكروثانية
+def cpu_time(function, argument, repeat):
+    function(argument)  # warm up
+    start = time.process_time()
+    for _ in range(repeat):
+        function(argument)
+    return (time.process_time() - start) / repeat * 1e6
+
+
+def sizes(data):
+    result = {"identity": len(data)}
+    for encoding in compression.ENCODINGS:
+        result[encoding] = len(compression.compress(data, encoding))
+    return result
+
+
+def bench_encoding(counts, repeat):
+    reports = []
+    for count in counts:
+        rows = make_rows(count)
+        times = max(1, repeat * 100 // count)
+        before = old_encode(rows)
+        after = new_encode(rows)
+        if json.loads(before) != json.loads(after):
+            raise SystemExit("Encoders disagree for %d rows" % count)
+        before_us = cpu_time(old_encode, rows, times)
+        after_us = cpu_time(new_encode, rows, times)
+        reports.append(
+            {
+                "rows": count,
+                "before": {"cpu_us": round(before_us, 1), "bytes": len(before)},
+                "after": {"cpu_us": round(after_us, 1), "bytes": sizes(after)},
+                "speedup": round(before_us / after_us, 2),
+            }
+        )
+    return reports
+
+
+def fetch_size(base, path, encoding):
+    parts = urlsplit(base)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    try:
+        conn.request("GET", path, headers={"Accept-Encoding": encoding})
+        response = conn.getresponse()
+        body = response.read()  # http.client مش بيفك الضغط، فده الحجم اللي اتبعت فعلاً
+        return {
+            "status": response.status,
+            "content_encoding": response.getheader("Content-Encoding"),
+            "bytes": len(body),
+        }
+    finally:
+        conn.close()
+
+
+def bench_server(base, paths):
+    reports = []
+    for path in paths:
+        reports.append(
+            {
+                "url": base + path,
+                "wire": {
+                    encoding: fetch_size(base, path, encoding)
+                    for encoding in ("identity", "gzip", "br")
+                },
+            }
+        )
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure JSON encoding CPU and response bytes")
+    parser.add_argument("--rows", type=int, action="append", help="Products per response (repeatable)")
+    parser.add_argument("--repeat", type=int, default=200, help="Encodings per measurement (scaled down for big responses)")
+    parser.add_argument("--url", help="Also measure bytes on the wire from a running server")
+    parser.add_argument("--path", action="append", help="Path for --url (repeatable)")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    report = {
+        "encoder": "orjson" if orjson is not None else "json",
+        "encodings": list(compression.ENCODINGS),
+        "encoding": bench_encoding(args.rows or DEFAULT_ROWS, args.repeat),
+    }
+    print("encoder=%(encoder)s  compression=%(encodings)s" % report)
+    for item in report["encoding"]:
+        compressed = "  ".join(
+            "%s=%d" % (encoding, size) for encoding, size in item["after"]["bytes"].items()
+        )
+        print(
+            "%5d rows  before: %8.1fus %8d B   after: %8.1fus (x%s)  %s"
+            % (
+                item["rows"],
+                item["before"]["cpu_us"],
+                item["before"]["bytes"],
+                item["after"]["cpu_us"],
+                item["speedup"],
+                compressed,
+            )
+        )
+
+    if args.url:
+        report["server"] = bench_server(args.url, args.path or DEFAULT_PATHS)
+        for item in report["server"]:
+            print(
+                item["url"]
+                + "  "
+                + "  ".join(
+                    "%s=%d B" % (encoding, result["bytes"])
+                    for encoding, result in item["wire"].items()
+                )
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,744 @@
+# Benchmark قابل للتكرار للـ backend: قاعدة بيانات لوحدها بعدد منتجات محدد، وسيرفر بيتشغل من الكود الحالي،
+# وأحمال قراية/كتابة على كل routes المنتجات والتصنيفات، والنتيجة ملف JSON تقارنه بين commit والتاني
+#
+#   python benchmark.py --products 10000 --json before.json
+#   git checkout <commit تاني> && python benchmark.py --products 10000 --json after.json --compare before.json
+#   python benchmark.py --products 1000000 --mix read --server asgi --concurrency 64 --duration 60
+#   python benchmark.py --embedded /tmp/bench-pg ...    -> PostgreSQL مؤقت من غير سيرفر متسطب (pip install pgserver)
+#
+# - قاعدة البيانات (--database، الافتراضي labanita_bench) بتتعمل على نفس سيرفر DB_HOST لو مش موجودة وبيتعملها migrate
+#   وبتتملى بـ COPY. لو فيها نفس عدد المنتجات والتصنيفات من قبل كده مش بتتملى تاني (--reseed يفضيها ويملاها من الأول)
+#   الأحمال اللي فيها كتابة بتغير البيانات شوية، فللمقارنة الدقيقة استخدم --reseed
+# - السيرفر: gunicorn بنفس gunicorn.conf.py (wsgi = app:app، asgi = asgi:app على uvicorn) بـ RATE_LIMIT=0
+#   لأن كل الطلبات جاية من نفس الـ IP، أو --url لسيرفر شغال أصلاً (لازم يكون على نفس قاعدة البيانات)
+# - كل client عنده اتصال keep-alive وبيختار العملية الجاية عشوائي بالأوزان بتاعة الـ mix (بـ seed ثابت)
+
+import argparse
+import datetime
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zlib
+from urllib.parse import quote, urlsplit
+
+import psycopg2
+
+import migrate
+from db import DB_CONFIG
+from loadtest import percentile
+
+try:
+    import pgserver
+except ImportError:
+    pgserver = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+WORDS = [
+    "كنافة", "بسبوسة", "قطايف", "أم علي", "رز بلبن", "بقلاوة", "جلاش", "مهلبية",
+    "Cheesecake", "Brownie", "Tiramisu", "Cupcake", "Donut", "Croissant", "Basbousa", "Konafa",
+]
+ADJECTIVES = ["بالقشطة", "بالمكسرات", "بالشوكولاتة", "بالفستق", "Classic", "Mini", "Family size", "Sugar free"]
+# كلمات البحث، ومعاها كلمات فيها أخطاء إملائية عشان البحث الـ fuzzy (pg_trgm) يتقاس برضه
+SEARCH_TERMS = WORDS + ["كنافه", "بسبوسه", "cheescake", "tiramisou", "بالشكولاته"]
+
+# أوزان العمليات في كل mix
+MIXES = {
+    "read": {
+        "list_products": 20,
+        "list_products_page": 15,
+        "filter_products": 10,
+        "stream_products": 2,
+        "search_products": 10,
+        "get_product": 25,
+        "batch_products": 5,
+        "list_categories": 5,
+        "list_categories_embedded": 5,
+        "get_category": 3,
+        "sync_changes": 3,
+    },
+    "mixed": {
+        "list_products": 18,
+        "list_products_page": 13,
+        "filter_products": 9,
+        "stream_products": 2,
+        "search_products": 9,
+        "get_product": 22,
+        "batch_products": 5,
+        "list_categories": 4,
+        "list_categories_embedded": 4,
+        "get_category": 3,
+        "sync_changes": 3,
+        "create_product": 3,
+        "update_product": 4,
+        "delete_product": 1,
+        "bulk_import": 0.2,
+        "create_category": 0.3,
+        "update_category": 0.5,
+        "delete_category": 0.2,
+        "place_order": 1.8,
+    },
+    "write": {
+        "get_product": 20,
+        "list_products": 10,
+        "list_categories": 5,
+        "create_product": 15,
+        "update_product": 20,
+        "delete_product": 8,
+        "bulk_import": 2,
+        "create_category": 3,
+        "update_category": 5,
+        "delete_category": 2,
+        "place_order": 10,
+    },
+}
+# asgi.py فيه routes المنتجات والتصنيفات بس
+ASGI_MISSING = {"bulk_import", "place_order"}
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# قاعدة البيانات
+
+
+def start_embedded(directory):
+    if pgserver is None:
+        raise SystemExit("--embedded needs pgserver (pip install pgserver)")
+    server = pgserver.get_server(directory, cleanup_mode="stop")  # البيانات بتفضل في الفولدر للمرة الجاية
+    print("embedded PostgreSQL in %s" % directory)
+    return server
+
+
+def ensure_database(config):
+    conn = psycopg2.connect(**dict(config, database="postgres"))
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (config["database"],))
+        if cur.fetchone() is None:
+            print("creating database %s" % config["database"])
+            cur.execute('CREATE DATABASE "%s";' % config["database"].replace('"', '""'))
+        cur.close()
+    finally:
+        conn.close()
+
+
+def _copy(cur, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join("\\N" if value is None else str(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cur.copy_expert("COPY %s (%s) FROM STDIN" % (table, ", ".join(columns)), buffer)
+
+
+def _images(rng):
+    return json.dumps(
+        {name: "/images/%032x.webp" % rng.getrandbits(128) for name in ("thumb", "detail", "retina")}
+    )
+
+
+def _product_rows(rng, start, count, categories, base):
+    for i in range(start, start + count):
+        word = rng.choice(WORDS)
+        adjective = rng.choice(ADJECTIVES)
+        created = base + datetime.timedelta(seconds=i)
+        yield (
+            "%s %s %d" % (word, adjective, i),
+            "%s %s طازة كل يوم - fresh %s" % (word, adjective, word),
+            "%d.%02d" % (rng.randint(5, 500), rng.randint(0, 99)),
+            "https://cdn.example.com/products/%d.jpg" % i,
+            rng.randint(1, categories),
+            None if rng.random() < 0.1 else rng.randint(1000, 100000),
+            # النسخ المصغرة جاهزة (زي بعد images.py --backfill) عشان القراية متشغلش شغل الصور في الخلفية
+            _images(rng),
+            created.isoformat(),
+            (created + datetime.timedelta(days=1)).isoformat() if rng.random() < 0.3 else None,
+        )
+
+
+# بيرجع True لو ملاها، و False لو كانت متملية بنفس الحجم
+def seed(config, products, categories, seed_value, reseed=False, batch=50000):
+    conn = psycopg2.connect(**config)
+    try:
+        migrate.migrate(conn)
+        cur = conn.cursor()
+        cur.execute("SELECT (SELECT count(*) FROM products), (SELECT count(*) FROM categories);")
+        if not reseed and cur.fetchone() == (products, categories):
+            conn.rollback()
+            return False
+
+        started = time.monotonic()
+        print("seeding %d products in %d categories ..." % (products, categories))
+        cur.execute("TRUNCATE order_items, orders, products, categories, deleted_rows RESTART IDENTITY CASCADE;")
+        rng = random.Random(seed_value)
+        base = datetime.datetime(2024, 1, 1)
+        _copy(
+            cur,
+            "categories",
+            ("name", "description", "image_url", "images", "created_at"),
+            (
+                (
+                    "%s %d" % (rng.choice(WORDS), i),
+                    "تصنيف رقم %d" % i,
+                    "https://cdn.example.com/categories/%d.jpg" % i,
+                    _images(rng),
+                    base.isoformat(),
+                )
+                for i in range(1, categories + 1)
+            ),
+        )
+        columns = (
+            "name", "description", "price", "image_url", "category_id",
+            "stock", "images", "created_at", "updated_at",
+        )
+        for start in range(1, products + 1, batch):
+            _copy(cur, "products", columns, _product_rows(rng, start, min(batch, products - start + 1), categories, base))
+        conn.commit()
+
+        conn.autocommit = True
+        cur.execute("VACUUM ANALYZE products;")
+        cur.execute("VACUUM ANALYZE categories;")
+        cur.close()
+        print("seeded in %.1fs" % (time.monotonic() - started))
+        return True
+    finally:
+        conn.close()
+
+
+def server_version(config):
+    conn = psycopg2.connect(**config)
+    try:
+        cur = conn.cursor()
+        cur.execute("SHOW server_version;")
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# السيرفر
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, config, workers, threads, log_path):
+    port = free_port()
+    env = dict(
+        os.environ,
+        DB_HOST=str(config["host"]),
+        DB_PORT=str(config["port"]),
+        DB_NAME=config["database"],
+        DB_USER=config["user"],
+        DB_PASSWORD=config["password"],
+        BIND="127.0.0.1:%d" % port,
+        WEB_CONCURRENCY=str(workers),
+        THREADS=str(threads),
+        RATE_LIMIT="0",
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+    )
+    env.pop("DB_POOL_MAX", None)  # gunicorn.conf.py بيظبطه على عدد الـ threads
+    env.pop("DB_POOL_MIN", None)
+    if kind == "asgi":
+        env["WORKER_CLASS"] = "uvicorn.workers.UvicornWorker"
+    target = "asgi:app" if kind == "asgi" else "app:app"
+    log_file = open(log_path, "ab")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", target],
+        cwd=HERE,
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+    log_file.close()
+    base = "http://127.0.0.1:%d" % port
+    wait_ready(base, process, log_path)
+    return process, base
+
+
+def connect(base, timeout=60):
+    parts = urlsplit(base)
+    return http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+
+
+def wait_ready(base, process=None, log_path=None, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit("Server exited with code %s, see %s" % (process.returncode, log_path))
+        conn = connect(base, timeout=5)
+        try:
+            if request(conn, "GET", "/")[0] == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.2)
+    raise SystemExit("Server at %s did not become ready in %ds" % (base, timeout))
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)  # gunicorn بيقفل الـ workers بهدوء
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# العمليات
+# كل عملية بترجع (method, path, body, headers, callback). الـ callback (لو موجود) بيتنادى بالـ status والـ JSON بتاع الرد
+# و None لو مينفعش تتعمل دلوقتي (مسح من غير حاجة اتعملت قبلها مثلاً)، والـ client بيختار عملية تانية
+
+
+def request(conn, method, path, body=None, headers=None, accept_encoding="identity"):
+    data = json.dumps(body).encode() if body is not None else None
+    all_headers = {"Accept-Encoding": accept_encoding}
+    if data is not None:
+        all_headers["Content-Type"] = "application/json"
+    all_headers.update(headers or {})
+    conn.request(method, path, body=data, headers=all_headers)
+    response = conn.getresponse()
+    payload = response.read()
+    return response.status, response, payload
+
+
+# الـ JSON بتاع الرد (None لو مش JSON أو مضغوط بحاجة غير gzip)
+def decode(response, payload):
+    encoding = response.getheader("Content-Encoding")
+    try:
+        if encoding == "gzip":
+            payload = zlib.decompress(payload, 31)
+        elif encoding is not None:
+            return None
+        return json.loads(payload)
+    except (ValueError, zlib.error):
+        return None
+
+
+class Client:
+    def __init__(self, index, products, categories, seed_value):
+        self.rng = random.Random(seed_value * 1000 + index)
+        self.products = products
+        self.categories = categories
+        self.created_products = []
+        self.created_categories = []
+        self.changes_cursor = None
+
+    def product_id(self):
+        return self.rng.randint(1, self.products)
+
+    def category_id(self):
+        return self.rng.randint(1, self.categories)
+
+    def product_body(self):
+        word = self.rng.choice(WORDS)
+        return {
+            "name": "%s %s bench" % (word, self.rng.choice(ADJECTIVES)),
+            "description": "benchmark %s" % word,
+            "price": "%d.%02d" % (self.rng.randint(5, 500), self.rng.randint(0, 99)),
+            "image_url": None,  # من غير صورة عشان images.py ميشتغلش في الخلفية وسط القياس
+            "category_id": self.category_id(),
+        }
+
+
+def _remember(items, key):
+    def callback(status, data):
+        if status in (200, 201) and isinstance(data, dict) and key in data:
+            items.append(data[key])
+    return callback
+
+
+def op_list_products(client):
+    return "GET", "/products?limit=20", None, None, None
+
+
+def op_list_products_page(client):
+    return "GET", "/products?limit=20&cursor=%d" % client.product_id(), None, None, None
+
+
+def op_filter_products(client):
+    low = client.rng.randint(5, 400)
+    return (
+        "GET",
+        "/products?limit=20&category_id=%d&min_price=%d&max_price=%d" % (client.category_id(), low, low + 100),
+        None, None, None,
+    )
+
+
+def op_stream_products(client):
+    return "GET", "/products?stream=1&limit=1000&category_id=%d" % client.category_id(), None, None, None
+
+
+def op_search_products(client):
+    return "GET", "/products/search?limit=20&q=%s" % quote(client.rng.choice(SEARCH_TERMS)), None, None, None
+
+
+def op_get_product(client):
+    return "GET", "/products/%d" % client.product_id(), None, None, None
+
+
+def op_batch_products(client):
+    return "POST", "/products/batch", {"ids": [client.product_id() for _ in range(50)]}, None, None
+
+
+def op_list_categories(client):
+    return "GET", "/categories", None, None, None
+
+
+def op_list_categories_embedded(client):
+    return "GET", "/categories?include=counts,top", None, None, None
+
+
+def op_get_category(client):
+    return "GET", "/categories/%d" % client.category_id(), None, None, None
+
+
+# sync الموبايل: كل مرة من الـ cursor اللي رجع في المرة اللي فاتت
+def op_sync_changes(client):
+    def callback(status, data):
+        if status == 200 and isinstance(data, dict):
+            client.changes_cursor = data.get("cursor")
+
+    path = "/changes"
+    if client.changes_cursor:
+        path += "?since=" + quote(client.changes_cursor)
+    return "GET", path, None, None, callback
+
+
+def op_create_product(client):
+    return "POST", "/products", client.product_body(), None, _remember(client.created_products, "product_id")
+
+
+def op_update_product(client):
+    return "PUT", "/products/%d" % client.product_id(), client.product_body(), None, None
+
+
+# بيمسح المنتجات اللي الـ client ده عملها بس
+def op_delete_product(client):
+    if not client.created_products:
+        return None
+    return "DELETE", "/products/%d" % client.created_products.pop(), None, None, None
+
+
+def op_bulk_import(client):
+    return "POST", "/products/bulk", [client.product_body() for _ in range(50)], None, None
+
+
+def op_create_category(client):
+    body = {"name": "bench %d" % client.rng.randint(1, 10**6), "description": "benchmark", "image_url": None}
+    return "POST", "/categories", body, None, _remember(client.created_categories, "category_id")
+
+
+def op_update_category(client):
+    # التصنيفات الأصلية مش بنغيرها عشان أسماءها تفضل زي ما هي بين الـ runs
+    if not client.created_categories:
+        return None
+    body = {"name": "bench %d" % client.rng.randint(1, 10**6), "description": "benchmark", "image_url": None}
+    return "PUT", "/categories/%d" % client.rng.choice(client.created_categories), body, None, None
+
+
+def op_delete_category(client):
+    if not client.created_categories:
+        return None
+    return "DELETE", "/categories/%d" % client.created_categories.pop(), None, None, None
+
+
+def op_place_order(client):
+    body = {
+        "items": [
+            {"product_id": client.product_id(), "quantity": client.rng.randint(1, 3)}
+            for _ in range(client.rng.randint(1, 4))
+        ],
+        "delivery_address": "benchmark",
+        "payment_method": "cash",
+    }
+    return "POST", "/orders", body, {"Idempotency-Key": str(uuid.uuid4())}, None
+
+
+OPERATIONS = {
+    "list_products": op_list_products,
+    "list_products_page": op_list_products_page,
+    "filter_products": op_filter_products,
+    "stream_products": op_stream_products,
+    "search_products": op_search_products,
+    "get_product": op_get_product,
+    "batch_products": op_batch_products,
+    "list_categories": op_list_categories,
+    "list_categories_embedded": op_list_categories_embedded,
+    "get_category": op_get_category,
+    "sync_changes": op_sync_changes,
+    "create_product": op_create_product,
+    "update_product": op_update_product,
+    "delete_product": op_delete_product,
+    "bulk_import": op_bulk_import,
+    "create_category": op_create_category,
+    "update_category": op_update_category,
+    "delete_category": op_delete_category,
+    "place_order": op_place_order,
+}
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# التشغيل
+
+
+def run_client(client, base, mix, deadline, accept_encoding, results, lock):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    conn = None
+    local = {}  # اسم العملية -> {"latencies": [], "statuses": {}, "errors": 0}
+    while time.monotonic() < deadline:
+        name = client.rng.choices(names, weights)[0]
+        operation = OPERATIONS[name](client)
+        if operation is None:
+            continue
+        method, path, body, headers, callback = operation
+        stats = local.setdefault(name, {"latencies": [], "statuses": {}, "errors": 0})
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = connect(base)
+            status, response, payload = request(conn, method, path, body, headers, accept_encoding)
+            stats["latencies"].append(time.perf_counter() - start)
+            stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+            if callback is not None:
+                callback(status, decode(response, payload))
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            stats["errors"] += 1
+            if conn is not None:
+                conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+    with lock:
+        for name, stats in local.items():
+            total = results.setdefault(name, {"latencies": [], "statuses": {}, "errors": 0})
+            total["latencies"].extend(stats["latencies"])
+            total["errors"] += stats["errors"]
+            for status, count in stats["statuses"].items():
+                total["statuses"][status] = total["statuses"].get(status, 0) + count
+
+
+def summarize(latencies, statuses, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def run_workload(base, mix_name, mix, clients, duration, accept_encoding):
+    results = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(client, base, mix, deadline, accept_encoding, results, lock),
+            daemon=True,
+        )
+        for client in clients
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    all_latencies, all_statuses, all_errors = [], {}, 0
+    operations = {}
+    for name, stats in sorted(results.items()):
+        operations[name] = summarize(stats["latencies"], stats["statuses"], stats["errors"], elapsed)
+        all_latencies.extend(stats["latencies"])
+        all_errors += stats["errors"]
+        for status, count in stats["statuses"].items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+    report = {
+        "mix": mix_name,
+        "skipped": sorted(set(MIXES[mix_name]) - set(mix)),
+        "duration_s": round(elapsed, 2),
+    }
+    report.update(summarize(all_latencies, all_statuses, all_errors, elapsed))
+    report["operations"] = operations
+    return report
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--", "."], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return commit, bool(dirty)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def _change(old, new):
+    if not old or new is None:
+        return ""
+    return " (%+.1f%%)" % ((new - old) * 100.0 / old)
+
+
+# مقارنة بتقرير قديم: الـ req/s والـ p99 لكل workload ولكل عملية
+def print_comparison(base_report, report):
+    old_workloads = {item["mix"]: item for item in base_report.get("workloads", [])}
+    print("\ncompared with %s" % (base_report["meta"].get("git_commit") or "baseline"))
+    for workload in report["workloads"]:
+        old = old_workloads.get(workload["mix"])
+        if old is None:
+            continue
+        rows = [("TOTAL", old, workload)] + [
+            (name, old["operations"].get(name), stats) for name, stats in workload["operations"].items()
+        ]
+        print("[%s]" % workload["mix"])
+        for name, before, after in rows:
+            if before is None:
+                continue
+            print(
+                "  %-26s rps %8s -> %8s%-10s p99 %8s -> %8sms%s"
+                % (
+                    name,
+                    before["rps"],
+                    after["rps"],
+                    _change(before["rps"], after["rps"]),
+                    before["p99_ms"],
+                    after["p99_ms"],
+                    _change(before["p99_ms"], after["p99_ms"]),
+                )
+            )
+
+
+def print_workload(workload):
+    print(
+        "[%(mix)s] %(requests)d req  %(rps)s req/s  p50=%(p50_ms)sms p95=%(p95_ms)sms "
+        "p99=%(p99_ms)sms max=%(max_ms)sms  errors=%(errors)d  %(statuses)s" % workload
+    )
+    for name, stats in workload["operations"].items():
+        print(
+            "  %-26s %7d req  %8s req/s  p50=%8sms  p99=%8sms  %s"
+            % (name, stats["requests"], stats["rps"], stats["p50_ms"], stats["p99_ms"], stats["statuses"])
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a benchmark database and measure the API under mixed workloads")
+    parser.add_argument("--products", type=int, default=10000, help="Products to seed (1k-1M)")
+    parser.add_argument("--categories", type=int, default=50, help="Categories to seed")
+    parser.add_argument("--database", default="labanita_bench", help="Benchmark database (created if missing)")
+    parser.add_argument("--reseed", action="store_true", help="Empty and seed the database even if it has the same size")
+    parser.add_argument("--embedded", metavar="DIR", help="Run a throwaway PostgreSQL in DIR with pgserver")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi", help="Server to start with gunicorn")
+    parser.add_argument("--url", help="Use a running server on the benchmark database instead of starting one")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per worker (wsgi)")
+    parser.add_argument("--mix", action="append", choices=sorted(MIXES), help="Workload (repeatable, default read and mixed)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent keep-alive clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per workload")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of unmeasured load before each workload")
+    parser.add_argument("--accept-encoding", default="gzip", help="Accept-Encoding sent by the clients (like the app)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the data and the request sequence")
+    parser.add_argument("--json", default="benchmark.json", help="Report file")
+    parser.add_argument("--compare", help="Previous report to compare with")
+    args = parser.parse_args()
+
+    config = dict(DB_CONFIG, database=args.database)
+    embedded = None
+    if args.embedded:
+        embedded = start_embedded(args.embedded)
+        config["host"] = os.path.abspath(args.embedded)
+
+    process = None
+    try:
+        ensure_database(config)
+        seeded = seed(config, args.products, args.categories, args.seed, args.reseed)
+        if args.url:
+            base = args.url.rstrip("/")
+            wait_ready(base)
+        else:
+            process, base = start_server(
+                args.server, config, args.workers, args.threads, os.path.join(HERE, "benchmark-server.log")
+            )
+
+        commit, dirty = git_revision()
+        report = {
+            "meta": {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "git_commit": commit,
+                "git_dirty": dirty,
+                "python": platform.python_version(),
+                "postgres": server_version(config),
+                "products": args.products,
+                "categories": args.categories,
+                "reseeded": seeded,
+                "server": "external" if args.url else args.server,
+                "workers": None if args.url else args.workers,
+                "threads": None if args.url or args.server == "asgi" else args.threads,
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+                "accept_encoding": args.accept_encoding,
+                "seed": args.seed,
+            },
+            "workloads": [],
+        }
+
+        for mix_name in args.mix or ["read", "mixed"]:
+            mix = MIXES[mix_name]
+            if not args.url and args.server == "asgi":
+                mix = {name: weight for name, weight in mix.items() if name not in ASGI_MISSING}
+            clients = [Client(i, args.products, args.categories, args.seed) for i in range(args.concurrency)]
+            if args.warmup:
+                run_workload(base, mix_name, mix, clients, args.warmup, args.accept_encoding)
+            workload = run_workload(base, mix_name, mix, clients, args.duration, args.accept_encoding)
+            report["workloads"].append(workload)
+            print_workload(workload)
+    finally:
+        if process is not None:
+            stop_server(process)
+        if embedded is not None:
+            embedded.cleanup()
+
+    with open(args.json, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print("report written to %s" % args.json)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import csv
+import io
+import os
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from psycopg2.extras import execute_values
+
+BULK_MAX_ROWS = int(
+    os.environ.get("BULK_IMPORT_MAX_ROWS", "50000")
+)  # أقصى عدد صفوف في الطلب الواحد
+BULK_PAGE_SIZE = 1000  # عدد الصفوف في كل INSERT (execute_values بيقسم الدفعة الكبيرة عليها)
+
+# حدود أعمدة products (migrations/0001): القيمة اللي أكبر منها بتوقع الـ INSERT كله مش الصف بس
+NAME_MAX_LENGTH = 255  # VARCHAR(255)
+PRICE_MAX = Decimal("100000000")  # NUMERIC(10, 2): أقل من 10^8
+PRICE_STEP = Decimal("0.01")
+INTEGER_MAX = 2**31 - 1  # INTEGER بتاع id و category_id
+
+
+# قراءة ملف CSV (أول سطر فيه أسماء الأعمدة: id,name,description,price,image_url,category_id)
+def parse_csv_rows(data):
+    text = data.decode("utf-8-sig")  # utf-8-sig عشان الـ BOM اللي Excel بيحطه في الأول
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def _optional(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "":  # الخانة الفاضية في الـ CSV معناها مفيش قيمة
+            return None
+    return value
+
+
+# التحقق من صف واحد وتحويله لـ tuple جاهز للـ INSERT
+# بيرجع (row_id, values) أو بيرمي ValueError فيها سبب الخطأ
+def validate_row(row):
+    if not isinstance(row, dict):
+        raise ValueError("Row must be an object.")
+
+    name = _optional(row.get("name"))
+    if name is None:
+        raise ValueError("name is required.")
+    if not isinstance(name, str):
+        raise ValueError("name must be a string.")
+    if len(name) > NAME_MAX_LENGTH:
+        raise ValueError("name must be at most %d characters." % NAME_MAX_LENGTH)
+
+    price = _optional(row.get("price"))
+    if price is None:
+        raise ValueError("price is required.")
+    try:
+        price = Decimal(str(price))
+    except InvalidOperation:
+        raise ValueError("price must be a number.")
+    if not price.is_finite() or price < 0:
+        raise ValueError("price must be a non-negative number.")
+    if price >= PRICE_MAX or price.quantize(PRICE_STEP, ROUND_HALF_UP) >= PRICE_MAX:
+        raise ValueError("price must be less than %s." % PRICE_MAX)
+    price = price.quantize(PRICE_STEP, ROUND_HALF_UP)  # نفس التقريب اللي Postgres بيعمله للعمود
+
+    category_id = _optional(row.get("category_id"))
+    if category_id is None:
+        raise ValueError("category_id is required.")
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        raise ValueError("category_id must be an integer.")
+    if abs(category_id) > INTEGER_MAX:
+        raise ValueError("category_id is out of range.")
+
+    row_id = _optional(row.get("id"))
+    if row_id is not None:
+        try:
+            row_id = int(row_id)
+        except (TypeError, ValueError):
+            raise ValueError("id must be an integer.")
+        if abs(row_id) > INTEGER_MAX:
+            raise ValueError("id is out of range.")
+
+    values = (
+        name,
+        _optional(row.get("description")),
+        price,
+        _optional(row.get("image_url")),
+        category_id,
+    )
+    return row_id, values
+
+
+# إضافة/تعديل المنتجات كلها في transaction واحدة
+# الصف اللي فيه id بيتعمله upsert (لو موجود يتعدل، لو مش موجود يتضاف بنفس الـ id)، واللي من غير id بيتضاف جديد
+# بيرجع dict فيه عدد اللي اتضاف واللي اتعدل والأخطاء لكل صف (رقم الصف بيبدأ من 1)
+# الـ commit/rollback مسؤولية اللي بينادي
+def import_products(conn, rows):
+    errors = []
+    valid = []  # (رقم الصف, id, values)
+    seen_ids = set()
+    for index, row in enumerate(rows, start=1):
+        try:
+            row_id, values = validate_row(row)
+        except ValueError as error:
+            errors.append({"row": index, "error": str(error)})
+            continue
+        if row_id is not None:
+            if row_id in seen_ids:
+                errors.append({"row": index, "error": "Duplicate id in batch."})
+                continue
+            seen_ids.add(row_id)
+        valid.append((index, row_id, values))
+
+    cur = conn.cursor()
+
+    # التحقق من كل الـ category_ids في query واحدة بدل query لكل صف
+    category_ids = list({values[4] for _, _, values in valid})
+    existing = set()
+    if category_ids:
+        cur.execute("SELECT id FROM categories WHERE id = ANY(%s);", (category_ids,))
+        existing = {category_id for (category_id,) in cur.fetchall()}
+
+    new_rows = []
+    upsert_rows = []
+    for index, row_id, values in valid:
+        if values[4] not in existing:
+            errors.append(
+                {"row": index, "error": "Invalid category_id. Category does not exist."}
+            )
+        elif row_id is None:
+            new_rows.append(values)
+        else:
+            upsert_rows.append((row_id,) + values)
+
+    inserted = 0
+    updated = 0
+
+    if new_rows:
+        result = execute_values(
+            cur,
+            "INSERT INTO products (name, description, price, image_url, category_id) VALUES %s RETURNING id;",
+            new_rows,
+            page_size=BULK_PAGE_SIZE,
+            fetch=True,
+        )
+        inserted += len(result)
+
+    if upsert_rows:
+        # xmax = 0 معناها الصف اتضاف دلوقتي، غير كده يبقى كان موجود واتعدل
+        result = execute_values(
+            cur,
+            """INSERT INTO products (id, name, description, price, image_url, category_id) VALUES %s
+            ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, description = EXCLUDED.description,
+            price = EXCLUDED.price, image_url = EXCLUDED.image_url, category_id = EXCLUDED.category_id,
+            updated_at = CURRENT_TIMESTAMP
+            RETURNING id, (xmax = 0);""",
+            upsert_rows,
+            page_size=BULK_PAGE_SIZE,
+            fetch=True,
+        )
+        for _, was_inserted in result:
+            if was_inserted:
+                inserted += 1
+            else:
+                updated += 1
+
+        # الـ ids اللي اتضافت بإيدينا مبتحركش الـ sequence، فبنقدمه عشان الـ INSERT الجاي ميخبطش فيها
+        cur.execute(
+            """SELECT setval(pg_get_serial_sequence('products', 'id'),
+            GREATEST((SELECT max(id) FROM products),
+                     COALESCE(pg_sequence_last_value(pg_get_serial_sequence('products', 'id')::regclass), 1)));"""
+        )
+
+    cur.close()
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "failed": len(errors),
+        "errors": errors,
+    }
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAX_SIZE = int(os.environ.get("CACHE_MAX_SIZE", "1024"))  # أقصى عدد عناصر في الكاش
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "300"))  # عمر العنصر في الكاش بالثواني
+
+MISSING = object()  # بنرجعها لو المفتاح مش في الكاش (عشان None ممكن تبقى قيمة عادية)
+
+
+# كاش في الذاكرة بيشيل آخر المفاتيح المستخدمة (LRU) ولكل عنصر عمر محدد (TTL)
+# المفاتيح tuples أولها اسم النوع، زي ("product", 5) أو ("categories", "stream=0")
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (وقت الانتهاء, القيمة)
+        self._lock = threading.Lock()
+        # بيزيد مع كل invalidate، عشان قراءة بدأت قبل التعديل متحطش قيمة قديمة في الكاش بعده
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # عناصر اتشالت عشان الكاش اتملى
+        self.expirations = 0  # عناصر اتشالت عشان عمرها خلص
+        self.invalidations = 0  # عناصر اتشالت عشان البيانات اتعدلت
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)  # آخر واحد اتقري يبقى آخر واحد يتشال
+            self.hits += 1
+            return value
+
+    # generation: قيمة self.generation قبل ما نقرا من قاعدة البيانات
+    # لو حصل invalidate بعدها مش بنخزن القيمة لأنها ممكن تكون قديمة
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    # بيمسح مفتاح معين
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    # بيمسح كل المفاتيح من نوع معين، زي كل صفحات ("categories", ...)
+    def invalidate_kind(self, kind):
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._data if key[0] == kind]:
+                del self._data[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+# الكاش بتاع المنتجات والتصنيفات (واحد لكل process)
+catalogue_cache = TTLCache(CACHE_MAX_SIZE, CACHE_TTL)
@@ -0,0 +1,214 @@
+import os
+import zlib
+
+from flask import request
+from werkzeug.http import parse_accept_header
+
+# ضغط الردود (gzip أو brotli حسب الـ Accept-Encoding) عشان الموبايل على شبكة الموبايل يستلم بايتات أقل
+# الردود الصغيرة مش بتتضغط لأن الـ headers بتاعة الضغط والوقت مش بيستاهلوا
+# brotli بيشتغل لو المكتبة متسطبة (pip install brotli)، ولو لأ بنستخدم gzip بس
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION = os.environ.get("COMPRESSION", "1") not in ("0", "false")
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))  # بالبايت
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))  # الردود بتتعمل كل مرة، فجودة متوسطة أسرع
+
+# الترتيب ده هو الأفضلية لما الـ client يقبل الاتنين بنفس الـ quality
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson"}
+
+# ردود مفيهاش body
+_NO_BODY_STATUSES = {204, 304}
+
+
+def is_compressible(mimetype):
+    return mimetype in COMPRESSIBLE_MIMETYPES or mimetype.startswith("text/")
+
+
+# أحسن encoding الـ client قابله (None يعني من غير ضغط)
+def choose_encoding(accept_encoding):
+    if not COMPRESSION or not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = صيغة gzip
+    return compressor.compress(data) + compressor.flush()
+
+
+# ضغط رد متقسم (streaming): كل جزء بيتبعت مضغوط على طول (flush) عشان الـ client ميستناش آخر الرد
+class StreamCompressor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+# الرد المضغوط بايتاته مختلفة عن اللي مش مضغوط، فالـ ETag بيبقى weak (زي ما nginx بيعمل)
+def weak_etag(etag):
+    return etag if etag.startswith("W/") else "W/" + etag
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# Flask
+
+
+def _compress_chunks(body, compressor):
+    try:
+        for chunk in body:
+            data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+
+# لازم يتنادى بعد metrics.init_app عشان المقاييس تعد البايتات المضغوطة (اللي بتتبعت فعلاً)
+def init_app(app):
+    @app.after_request
+    def _compress(response):
+        if not is_compressible(response.mimetype):
+            return response
+        response.vary.add("Accept-Encoding")
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+        if (
+            encoding is None
+            or request.method == "HEAD"
+            or response.status_code < 200
+            or response.status_code in _NO_BODY_STATUSES
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+
+        if response.is_streamed:
+            # حجم الرد مش معروف من الأول، والردود المتقسمة أصلاً كبيرة
+            response.response = _compress_chunks(response.response, StreamCompressor(encoding))
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < COMPRESS_MIN_SIZE:
+                return response
+            response.set_data(compress(data, encoding))
+
+        response.headers["Content-Encoding"] = encoding
+        if "ETag" in response.headers:
+            response.headers["ETag"] = weak_etag(response.headers["ETag"])
+        return response
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# ASGI (Starlette): نفس الكلام كـ middleware. بيستنى أول جزء من الـ body عشان يقرر (زي GZipMiddleware بتاع Starlette)
+
+
+def _get_header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _set_header(headers, name, value):
+    headers[:] = [(key, old) for key, old in headers if key.lower() != name]
+    if value is not None:
+        headers.append((name, value.encode("latin-1")))
+
+
+class ASGICompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(_get_header(scope["headers"], b"accept-encoding"))
+        if scope["method"] == "HEAD":
+            encoding = None
+        state = {"start": None, "compressor": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message  # بيتبعت مع أول جزء من الـ body
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            start = state["start"]
+            if start is None:  # بعد أول جزء
+                compressor = state["compressor"]
+                if compressor is not None:
+                    data = compressor.compress(body)
+                    if not more_body:
+                        data += compressor.finish()
+                    message = {"type": "http.response.body", "body": data, "more_body": more_body}
+                await send(message)
+                return
+
+            state["start"] = None
+            headers = list(start.get("headers", []))
+            content_type = _get_header(headers, b"content-type") or ""
+            if is_compressible(content_type.split(";")[0].strip()):
+                vary = _get_header(headers, b"vary")
+                if not vary:
+                    _set_header(headers, b"vary", "Accept-Encoding")
+                elif "accept-encoding" not in vary.lower():
+                    _set_header(headers, b"vary", vary + ", Accept-Encoding")
+
+                compress_it = (
+                    encoding is not None
+                    and start["status"] >= 200
+                    and start["status"] not in _NO_BODY_STATUSES
+                    and _get_header(headers, b"content-encoding") is None
+                    and (more_body or len(body) >= COMPRESS_MIN_SIZE)
+                )
+                if compress_it:
+                    _set_header(headers, b"content-encoding", encoding)
+                    etag = _get_header(headers, b"etag")
+                    if etag:
+                        _set_header(headers, b"etag", weak_etag(etag))
+                    if more_body:
+                        state["compressor"] = StreamCompressor(encoding)
+                        _set_header(headers, b"content-length", None)
+                        body = state["compressor"].compress(body)
+                    else:
+                        body = compress(body, encoding)
+                        _set_header(headers, b"content-length", str(len(body)))
+                    message = {"type": "http.response.body", "body": body, "more_body": more_body}
+
+            await send(dict(start, headers=headers))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
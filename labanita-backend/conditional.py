@@ -0,0 +1,95 @@
+import hashlib
+from datetime import timezone
+
+from flask import Response
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+import repository
+
+
+# نسخة الجدول (أو جزء منه حسب الفلاتر) من غير ما نجيب الصفوف نفسها:
+# عدد الصفوف وأكبر id وآخر وقت تعديل. أي إضافة أو تعديل أو مسح بيغير واحد منهم على الأقل
+def table_version_query(table, conditions=()):
+    query = (
+        "SELECT count(*), max(id), max(coalesce(updated_at, created_at)) FROM " + table
+    )
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + ";"
+
+
+def table_version(cur, table, conditions=(), params=()):
+    repository.execute(cur, table_version_query(table, conditions), list(params))
+    return cur.fetchone()
+
+
+# نسخة رد بيعتمد على أكتر من جدول: كل القيم مع بعض، وآخر وقت تعديل في أي جدول فيهم
+def combine_versions(*versions):
+    parts = ()
+    last_modified = None
+    for version in versions:
+        parts += tuple(version)
+        if version[2] is not None and (last_modified is None or version[2] > last_modified):
+            last_modified = version[2]
+    return parts, last_modified
+
+
+# ETag قوي (strong) من أي قيم بتحدد شكل الرد
+def make_etag(*parts):
+    return hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+
+
+# الـ ETag والـ Last-Modified لصف واحد (منتج أو تصنيف) من الديكشنري بتاعه
+def row_validators(kind, row):
+    last_modified = row["updated_at"] or row["created_at"]
+    modified = last_modified.isoformat() if last_modified else None
+    return make_etag(kind, row["id"], modified), last_modified
+
+
+# التواريخ في قاعدة البيانات من غير timezone فبنعتبرها UTC
+def _as_utc(value):
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+# هل النسخة اللي عند الـ client هي نفس اللي عندنا؟ (If-None-Match ليه الأولوية على If-Modified-Since)
+# بتاخد الـ headers كـ strings عشان تشتغل مع Flask ومع الـ ASGI app
+def headers_not_modified(if_none_match, if_modified_since, etag, last_modified):
+    if if_none_match:
+        # مقارنة weak: الـ ETag بيبقى W/ لما الرد يتضغط (compression.py) وده لسه نفس المحتوى
+        return parse_etags(if_none_match).contains_weak(etag)
+    since = parse_date(if_modified_since) if if_modified_since else None
+    if last_modified is not None and since is not None:
+        # الـ HTTP date دقته ثانية بس
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def is_not_modified(request, etag, last_modified):
+    return headers_not_modified(
+        request.headers.get("If-None-Match"),
+        request.headers.get("If-Modified-Since"),
+        etag,
+        last_modified,
+    )
+
+
+def validator_headers(etag, last_modified):
+    headers = {
+        "ETag": quote_etag(etag),
+        "Cache-Control": "no-cache",  # الـ client يخزن الرد بس يسألنا قبل ما يستخدمه
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(_as_utc(last_modified))
+    return headers
+
+
+def add_validators(response, etag, last_modified):
+    response.headers.update(validator_headers(etag, last_modified))
+    return response
+
+
+# رد 304 فاضي (Not Modified)
+def not_modified_response(etag, last_modified):
+    return add_validators(Response(status=304), etag, last_modified)
@@ -0,0 +1,524 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+from flask import g, request
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+# إعدادات الاتصال بقاعدة البيانات (تقدر تغيرها من متغيرات البيئة من غير ما تعدل الكود)
+DB_CONFIG = {
+    "host": os.environ.get("DB_HOST", "localhost"),  # السيرفر بتاع قاعدة البيانات (جهازك)
+    "port": int(os.environ.get("DB_PORT", "5432")),
+    "database": os.environ.get("DB_NAME", "labanita_db"),  # اسم قاعدة البيانات اللي أنشأناها
+    "user": os.environ.get("DB_USER", "postgres"),  # اسم المستخدم بتاع قاعدة البيانات
+    "password": os.environ.get("DB_PASSWORD", "123456"),  # كلمة سر المستخدم
+}
+
+# نسخة قراية بس (replica) لقراية الكتالوج (GET /products و /categories). من غير DB_REPLICA_HOST كل حاجة على الـ primary
+# باقي الإعدادات لو مش متحددة بتبقى زي الـ primary
+REPLICA_CONFIG = (
+    {
+        "host": os.environ["DB_REPLICA_HOST"],
+        "port": int(os.environ.get("DB_REPLICA_PORT", DB_CONFIG["port"])),
+        "database": os.environ.get("DB_REPLICA_NAME", DB_CONFIG["database"]),
+        "user": os.environ.get("DB_REPLICA_USER", DB_CONFIG["user"]),
+        "password": os.environ.get("DB_REPLICA_PASSWORD", DB_CONFIG["password"]),
+    }
+    if os.environ.get("DB_REPLICA_HOST")
+    else None
+)
+REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", "2"))  # لو الـ replica متأخرة أكتر من كده (ثواني) بنقرا من الـ primary
+REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", "1"))  # كل قد إيه بنقيس التأخير
+REPLICA_CONNECT_TIMEOUT = 2  # عشان الـ replica الواقعة متعطلش الطلبات
+# بعد أي تعديل الـ client (والـ worker نفسه) بيقرا من الـ primary المدة دي عشان يشوف اللي كتبه
+# لازم تبقى أكبر من DB_REPLICA_MAX_LAG
+STICKY_SECONDS = float(os.environ.get("DB_STICKY_SECONDS", "5"))
+STICKY_COOKIE = "db_primary_until"
+
+# إعدادات الـ Pool
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN", "2"))  # عدد الاتصالات اللي بنفتحها من الأول
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX", "10"))  # أقصى عدد اتصالات مفتوحة في نفس الوقت
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))  # أقصى وقت (بالثواني) نستنى فيه اتصال فاضي
+POOL_CHECK_IDLE = float(
+    os.environ.get("DB_POOL_CHECK_IDLE", "30")
+)  # لو الاتصال قاعد فاضي أكتر من كده بنعمله SELECT 1 قبل ما نديه للـ request
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# الـ queries البطيئة بنسجلها مع الـ plan، بس اللي EXPLAIN يفهمها (مش PREPARE/DECLARE)
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "EXECUTE")
+
+
+# cursor بيقيس وقت كل execute و fetch وعدد الصفوف (metrics.py)، وبيكتب الـ queries البطيئة في اللوج
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception:
+            metrics.observe_query("execute", time.perf_counter() - start)
+            raise
+        elapsed = time.perf_counter() - start
+        metrics.observe_query("execute", elapsed)
+        if metrics.is_slow(elapsed):
+            self._log_slow(elapsed)
+        return result
+
+    def _log_slow(self, elapsed):
+        sql = self.query.decode(errors="replace")
+        plan = None
+        # الـ named cursor بيعمل DECLARE ومينفعش نعمله EXPLAIN
+        if self.name is None and sql.lstrip().upper().startswith(EXPLAINABLE):
+            plan = explain(self.connection, sql)
+        metrics.log_slow_query(sql, elapsed, plan)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        rows = method(*args)
+        if isinstance(rows, list):
+            count = len(rows)
+        else:
+            count = 0 if rows is None else 1
+        metrics.observe_query("fetch", time.perf_counter() - start, count)
+        return rows
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._fetch(super().fetchmany)
+        return self._fetch(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+# الـ plan بتاع query (من غير ما تتنفذ تاني). جوه savepoint عشان لو فشل ميبوظش الـ transaction بتاعة الطلب
+def explain(conn, sql):
+    cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)  # cursor عادي عشان ميتقاسش هو كمان
+    savepoint = (
+        conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    )
+    try:
+        if savepoint:
+            cur.execute("SAVEPOINT slow_query_plan;")
+        cur.execute("EXPLAIN " + sql.rstrip().rstrip(";"))
+        plan = "\n".join(row[0] for row in cur.fetchall())
+        if savepoint:
+            cur.execute("RELEASE SAVEPOINT slow_query_plan;")
+        return plan
+    except psycopg2.Error as error:
+        if savepoint:
+            try:
+                cur.execute("ROLLBACK TO SAVEPOINT slow_query_plan;")
+            except psycopg2.Error:
+                pass
+        return "EXPLAIN failed: %s" % error
+    finally:
+        cur.close()
+
+
+# اتصال psycopg2 فاكر الـ statements اللي اتعملها PREPARE عليه (repository.execute بيستخدمها)
+# الـ PREPARE بيعيش طول عمر الاتصال حتى لو حصل rollback، فالـ set دي بتفضل صح
+# وكل الـ cursors اللي بتتفتح عليه (حتى الـ named) بتتقاس
+class PreparingConnection(psycopg2.extensions.connection):
+    pool = None  # الـ ConnectionPool اللي فتحه (عشان يرجعله)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.cursor_factory = InstrumentedCursor
+
+
+class ConnectionPool:
+    def __init__(self, minconn, maxconn, timeout, check_idle, **dsn):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: min=%s max=%s" % (minconn, maxconn))
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.dsn = dsn
+
+        self._idle = deque()  # اتصالات فاضية: (conn, آخر وقت اترجعت فيه)
+        self._in_use = set()  # id بتاع كل اتصال متاخد دلوقتي
+        self._opening = 0  # اتصالات بتتفتح دلوقتي (برا الـ lock)
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        start = time.perf_counter()
+        conn = psycopg2.connect(**self.dsn)
+        metrics.DB_CONNECT.observe(time.perf_counter() - start)
+        if isinstance(conn, PreparingConnection):
+            conn.pool = self
+        return conn
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        # لو الاتصال لسه راجع من شوية مش محتاجين نكلم السيرفر
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            if not conn.closed:
+                conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        start = time.perf_counter()
+        try:
+            return self._getconn()
+        finally:
+            metrics.observe_pool_wait(time.perf_counter() - start)
+
+    def _getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed.")
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()  # LIFO عشان الاتصالات السخنة تفضل شغالة
+                        self._in_use.add(id(conn))
+                        break
+                    if self._size() < self.maxconn:
+                        conn, idle_since = None, None
+                        self._opening += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            "Timed out after %.1fs waiting for a database connection."
+                            % self.timeout
+                        )
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                # بنفتح الاتصال الجديد برا الـ lock عشان باقي الـ threads متستناش الـ handshake
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._in_use.add(id(conn))
+                return conn
+
+            if self._is_healthy(conn, idle_since):
+                return conn
+
+            # الاتصال ميت (السيرفر اتعمله restart مثلاً)، نرميه ونجرب تاني
+            self._discard(conn)
+            with self._cond:
+                self._in_use.discard(id(conn))
+                self._cond.notify()
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                # لو فيه transaction مفتوحة (حتى لو SELECT بس) لازم نقفلها قبل ما الاتصال يرجع
+                if (
+                    conn.get_transaction_status()
+                    != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                ):
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            self._in_use.discard(id(conn))
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # بنعمل الـ Pool أول مرة نحتاجه بس
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    POOL_MIN_SIZE,
+                    POOL_MAX_SIZE,
+                    POOL_TIMEOUT,
+                    POOL_CHECK_IDLE,
+                    connection_factory=PreparingConnection,
+                    **DB_CONFIG,
+                )
+    return _pool
+
+
+def close_pool():
+    global _pool, _replica_pool, _replica_monitor
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+        if _replica_pool is not None:
+            _replica_pool.closeall()
+            _replica_pool = None
+        _replica_monitor = None  # الـ thread بتاعه مش بيعدي الـ fork، فبيتعمل من جديد
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# الـ replica
+
+
+# بيقيس تأخير الـ replica كل REPLICA_CHECK_INTERVAL في thread لوحده (باتصال خاص بيه مش من الـ pool)
+# عشان الطلبات متستناش القياس، ولو الـ replica وقعت أو اتأخرت الطلبات بترجع للـ primary لوحدها
+class ReplicaMonitor:
+    # التأخير بالثواني. لو الـ replica خلصت كل اللي وصلها (receive = replay) يبقى مفيش تأخير
+    # حتى لو آخر transaction قديمة (الـ primary ممكن يكون فاضي)، ولو دي مش replica أصلاً يبقى 0
+    LAG_QUERY = (
+        "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0"
+        " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+        " ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END;"
+    )
+
+    def __init__(self, config, max_lag, interval):
+        self.config = config
+        self.max_lag = max_lag
+        self.interval = interval
+        self.lag = None  # None = لسه متقاسش أو الـ replica مش شغالة
+        self.checked_at = 0.0
+        self._conn = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:  # بيتعمل بعد الـ fork بتاع gunicorn في كل worker
+                self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.interval)
+
+    def check(self):
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = psycopg2.connect(connect_timeout=REPLICA_CONNECT_TIMEOUT, **self.config)
+                self._conn.autocommit = True
+            cur = self._conn.cursor()
+            cur.execute(self.LAG_QUERY)
+            lag = float(cur.fetchone()[0])
+            cur.close()
+        except psycopg2.Error as error:
+            if self.lag is not None or not self.checked_at:  # أول مرة تقع بس، مش كل ثانية
+                log.warning("Replica is unreachable, reading from primary: %s", error)
+            lag = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        if lag is not None and lag > self.max_lag and (self.lag is None or self.lag <= self.max_lag):
+            log.warning("Replica lag %.1fs is over %.1fs, reading from primary.", lag, self.max_lag)
+        self.lag = lag
+        self.checked_at = time.monotonic()
+
+    # القياس لازم يكون جديد: لو الـ thread نفسه وقف منعتمدش على آخر قيمة
+    def usable(self):
+        self.start()
+        fresh = time.monotonic() - self.checked_at < 3 * self.interval + REPLICA_CONNECT_TIMEOUT
+        return fresh and self.lag is not None and self.lag <= self.max_lag
+
+    def stats(self):
+        return {"lag": self.lag, "usable": self.usable()}
+
+
+_replica_pool = None
+_replica_monitor = None
+_last_write = 0.0  # آخر مرة الـ worker ده كتب في قاعدة البيانات (time.monotonic)
+
+
+def get_replica_monitor():
+    global _replica_monitor
+    if REPLICA_CONFIG is None:
+        return None
+    if _replica_monitor is None:
+        with _pool_lock:
+            if _replica_monitor is None:
+                _replica_monitor = ReplicaMonitor(REPLICA_CONFIG, REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL)
+    return _replica_monitor
+
+
+def get_replica_pool():
+    global _replica_pool
+    if _replica_pool is None:
+        with _pool_lock:
+            if _replica_pool is None:
+                _replica_pool = ConnectionPool(
+                    0,  # من غير اتصالات من الأول عشان لو الـ replica واقعة الـ worker يشتغل عادي
+                    POOL_MAX_SIZE,
+                    POOL_TIMEOUT,
+                    POOL_CHECK_IDLE,
+                    connection_factory=PreparingConnection,
+                    connect_timeout=REPLICA_CONNECT_TIMEOUT,
+                    **REPLICA_CONFIG,
+                )
+    return _replica_pool
+
+
+# بعد أي تعديل: الـ worker ده بيقرا من الـ primary لمدة STICKY_SECONDS
+# (الكاش بتاعه اتمسح، فلو قرا من replica متأخرة هيحط فيه البيانات القديمة تاني)
+def mark_write():
+    global _last_write
+    _last_write = time.monotonic()
+
+
+# هل القراية دي تروح للـ replica؟ sticky_until: قيمة الـ cookie اللي الـ client رجعها بعد آخر تعديل عمله
+def prefer_replica(sticky_until=None):
+    monitor = get_replica_monitor()
+    if monitor is None or time.monotonic() - _last_write < STICKY_SECONDS:
+        return False
+    if sticky_until:
+        try:
+            if float(sticky_until) > time.time():
+                return False
+        except ValueError:
+            pass
+    return monitor.usable()
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# Flask
+
+
+# الاتصال بقاعدة البيانات: بناخد اتصال من الـ Pool ونربطه بالـ request الحالي
+# ده اتصال الـ primary، وأي تعديل لازم يستخدمه
+def get_db_connection():
+    if "db_conn" in g:
+        return g.db_conn
+    conn = None
+    try:
+        conn = get_pool().getconn()
+        g.db_conn = conn
+    except (Exception, psycopg2.Error) as error:
+        log.error("Error while connecting to PostgreSQL: %s", error)
+    return conn
+
+
+# اتصال للقراية بس (GET الكتالوج): من الـ replica لو ينفع، وإلا نفس اتصال الـ primary
+def get_read_connection():
+    if "db_conn" in g:  # الطلب ده شغال على الـ primary خلاص
+        return g.db_conn
+    if "db_read_conn" in g:
+        return g.db_read_conn
+    if prefer_replica(request.cookies.get(STICKY_COOKIE)):
+        try:
+            g.db_read_conn = get_replica_pool().getconn()
+            return g.db_read_conn
+        except (Exception, psycopg2.Error) as error:
+            log.warning("Replica connection failed, reading from primary: %s", error)
+    return get_db_connection()
+
+
+# بيرجع الاتصالات للـ Pool أوتوماتيك في آخر الـ request
+def release_db_connection(exception=None):
+    for key in ("db_conn", "db_read_conn"):
+        conn = g.pop(key, None)
+        if conn is not None:
+            return_db_connection(conn)
+
+
+# بيفصل الاتصال عن الـ request عشان الـ teardown ميرجعهوش للـ Pool
+# (بيستخدمه الـ streaming لأن الرد بيكمل بعد ما الـ view يخلص)، واللي فصله مسؤول يرجعه بـ return_db_connection
+def detach_db_connection(conn):
+    for key in ("db_conn", "db_read_conn"):
+        if g.get(key) is conn:
+            g.pop(key)
+    return conn
+
+
+def return_db_connection(conn):
+    (conn.pool or get_pool()).putconn(conn)
+
+
+# للـ routes اللي بتستخدم POST بس مش بتعدل حاجة (زي POST /products/batch) عشان متعملش sticky
+def read_only(view):
+    view.read_only = True
+    return view
+
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db_connection)
+
+    # بعد أي تعديل ناجح: الـ client ياخد cookie بيخليه يقرا من الـ primary لحد ما الـ replica تلحق
+    @app.after_request
+    def _sticky_after_write(response):
+        if request.method not in WRITE_METHODS or response.status_code >= 400:
+            return response
+        if getattr(app.view_functions.get(request.endpoint), "read_only", False):
+            return response
+        mark_write()
+        if REPLICA_CONFIG is not None:
+            response.set_cookie(
+                STICKY_COOKIE,
+                "%.3f" % (time.time() + STICKY_SECONDS),
+                max_age=int(STICKY_SECONDS) + 1,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
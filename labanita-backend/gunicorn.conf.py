@@ -0,0 +1,75 @@
+# إعدادات تشغيل الـ backend في الـ production بـ gunicorn (بدل app.run(debug=True) اللي للتطوير بس)
+#
+# قبل أول تشغيل (وبعد أي deploy فيه migrations جديدة): python migrate.py
+# WSGI (Flask):  gunicorn -c gunicorn.conf.py app:app
+# ASGI (asgi.py): WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+#
+# Graceful reload:
+#   kill -HUP <master pid>   -> workers جديدة بتبدأ والقديمة بتخلص الطلبات اللي معاها وبعدين تقفل
+#   بس مع preload_app الكود بيتحمل في الـ master، فعشان كود جديد يشتغل من غير downtime:
+#   kill -USR2 <master pid>  -> master جديد بالكود الجديد جنب القديم
+#   kill -WINCH <old pid>    -> الـ workers القديمة تقفل بهدوء
+#   kill -QUIT <old pid>     -> الـ master القديم يقفل
+
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+# عدد الـ workers حسب عدد الـ cores (القاعدة المعروفة 2 × cores + 1)
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get("WORKER_CLASS", "gthread")
+threads = int(os.environ.get("THREADS", "4"))  # threads لكل worker (للـ gthread بس)
+
+# كل worker عنده Pool خاص بيه، فمنفتحش اتصالات أكتر من الـ threads اللي ممكن تستخدمها
+# (إجمالي الاتصالات = workers × DB_POOL_MAX ولازم يفضل أقل من max_connections في PostgreSQL)
+os.environ.setdefault("DB_POOL_MAX", str(threads))
+os.environ.setdefault("DB_POOL_MIN", "1")
+
+# تحميل الـ app مرة واحدة في الـ master قبل الـ fork (الـ workers بتبدأ أسرع وبتشارك الذاكرة)
+preload_app = True
+
+timeout = int(os.environ.get("TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))  # وقت الـ worker يخلص فيه الطلبات وقت الـ reload
+keepalive = 5
+
+# إعادة تشغيل الـ worker بعد عدد معين من الطلبات (الـ jitter عشان ميعيدوش كلهم في نفس اللحظة)
+max_requests = int(os.environ.get("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", "1000"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def pre_fork(server, worker):
+    # اتصالات قاعدة البيانات مينفعش تتشارك بين processes: لو حاجة في الـ master فتحت الـ Pool نقفله قبل الـ fork
+    import db
+
+    db.close_pool()
+
+
+def post_fork(server, worker):
+    import db
+    import metrics
+    from workers import counters
+
+    # Pool جديد خاص بالـ worker ده (بيتفتح أول ما نحتاجه) وعدادات ومقاييس من الصفر
+    db.close_pool()
+    counters.reset()
+    metrics.reset()
+
+
+def post_worker_init(worker):
+    # بنفتح أول اتصالات الـ Pool قبل أول طلب (لو قاعدة البيانات مش شغالة الـ worker يكمل عادي)
+    import db
+
+    try:
+        db.get_pool()
+    except Exception as error:
+        worker.log.warning("Could not warm up the database pool: %s", error)
+
+
+def worker_exit(server, worker):
+    from workers import counters
+
+    server.log.info("Worker %s exiting: %s", worker.pid, counters.stats())
@@ -0,0 +1,430 @@
+# نسخ مصغرة من صور المنتجات والتصنيفات (WebP بكذا مقاس) بدل ما الموبايل ينزل الصورة الأصلية في كل شاشة
+#
+# - النسخ بتتعمل في الخلفية بعد إضافة أو تعديل منتج/تصنيف، أو أول ما صف من غيرها يطلع في رد (schedule_missing)
+# - كل نسخة بتتخزن في IMAGE_DIR باسم الـ hash بتاع محتواها، فالرابط عمره ما بيتغير محتواه
+#   وبيتبعت بـ Cache-Control: immutable (الموبايل والـ CDN يخزنوه سنة من غير ما يسألوا تاني)
+# - الروابط بتتحفظ في عمود images في الجدول وبتطلع في الـ JSON: {"thumb": ..., "detail": ..., "retina": ...}
+#   ولو اتغير image_url الـ trigger بيفضي images (migrations/0005) والنسخ بتتعمل من جديد
+#
+# محتاج Pillow (pip install Pillow). من غيره images بتفضل NULL والموبايل يستخدم image_url زي الأول
+#
+# image_url جاي من الـ client، فالسيرفر مش بينزل أي رابط: لازم الـ host يبقى في IMAGE_SOURCE_HOSTS
+# (ومن غيره الروابط الـ http(s) بترفض خالص)، وأي عنوان داخلي (localhost والشبكة الخاصة و 169.254.x.x)
+# بيترفض حتى لو الـ host مسموح، وده بيتشيك على الـ IP اللي بنتصل بيه فعلاً في كل redirect
+#
+#   python images.py --backfill   -> عمل النسخ لكل المنتجات والتصنيفات اللي لسه معندهاش
+
+import argparse
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import urllib.request
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.extras import Json
+
+import db
+from cache import catalogue_cache
+from repository import execute
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+log = logging.getLogger(__name__)
+
+IMAGE_DIR = os.environ.get(
+    "IMAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_cache")
+)
+IMAGE_URL_PREFIX = os.environ.get("IMAGE_URL_PREFIX", "/images/")  # ممكن يبقى رابط CDN قدام IMAGE_DIR
+# لو image_url مسار (مش http) بندور عليه هنا
+IMAGE_SOURCE_DIR = os.environ.get("IMAGE_SOURCE_DIR")
+# الأماكن اللي مسموح ننزل منها صور، مفصولة بـ ",": host بالظبط (cdn.example.com)، أو أي subdomain (.example.com)
+# أو بداية رابط (https://bucket.s3.amazonaws.com/products/). فاضي = مفيش تنزيل من برة خالص
+IMAGE_SOURCE_HOSTS = [host.strip().lower() for host in os.environ.get("IMAGE_SOURCE_HOSTS", "").split(",") if host.strip()]
+IMAGE_MAX_REDIRECTS = 3
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT = float(os.environ.get("IMAGE_FETCH_TIMEOUT", "10"))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))  # threads بتعمل النسخ في الخلفية (لكل worker)
+IMAGE_RETRY_AFTER = 300  # الصورة اللي فشلت مش بنحاول فيها تاني قبل كده (بالثواني)
+WEBP_QUALITY = int(os.environ.get("WEBP_QUALITY", "80"))
+
+# (الاسم, أقصى عرض بالـ pixel): thumb للقوايم (ProductCard و CategoryItem)، detail لصفحة المنتج، retina للشاشات 2x/3x
+# الصورة الأصغر من المقاس مش بتتكبر
+RENDITIONS = (("thumb", 240), ("detail", 800), ("retina", 1600))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_FILENAME = re.compile(r"^[0-9a-f]{32}\.webp$")
+
+# الجداول اللي عندها image_url و images، والاسم بتاعها في الكاش
+TABLES = {"products": "product", "categories": "category"}
+GET_SOURCE = {table: "SELECT image_url, images FROM " + table + " WHERE id = %s;" for table in TABLES}
+# الشرط على image_url عشان لو الصورة اتغيرت وإحنا شغالين منكتبش نسخ الصورة القديمة
+# و updated_at بيتغير عشان الـ ETag يتغير والموبايل ياخد الروابط الجديدة
+SET_IMAGES = {
+    table: "UPDATE " + table + " SET images = %s, updated_at = CURRENT_TIMESTAMP"
+    " WHERE id = %s AND image_url = %s;"
+    for table in TABLES
+}
+MISSING_IMAGES = {
+    table: "SELECT id FROM " + table + " WHERE images IS NULL AND image_url IS NOT NULL ORDER BY id;"
+    for table in TABLES
+}
+
+
+class ImageError(Exception):
+    pass
+
+
+def available():
+    return Image is not None
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# عمل النسخ
+
+
+def source_allowed(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname or parts.username or parts.password:
+        return False
+    host = parts.hostname.lower()
+    for allowed in IMAGE_SOURCE_HOSTS:
+        if "://" in allowed:
+            if url.lower().startswith(allowed):
+                return True
+        elif host == allowed.lstrip(".") or (allowed.startswith(".") and host.endswith(allowed)):
+            return True
+    return False
+
+
+# loopback والشبكة الخاصة و link-local (169.254.169.254 بتاع الـ cloud metadata) و multicast والمحجوز كله
+def _check_address(address):
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    if not ip.is_global or ip.is_multicast:
+        raise ImageError("Image host resolves to a non-public address: %s" % ip)
+
+
+# بنعمل resolve بنفسنا ونتصل بالـ IP اللي اتشيك بس (مش نشيك الـ DNS وبعدين urllib يعمل resolve تاني ويلاقي عنوان داخلي)
+def _create_public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    host, port = address
+    addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    for _, _, _, _, sockaddr in addresses:
+        _check_address(sockaddr[0])
+    error = None
+    for family, type_, proto, _, sockaddr in addresses:
+        sock = socket.socket(family, type_, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as exc:
+            error = exc
+            sock.close()
+    raise error or OSError("Could not resolve %s" % host)
+
+
+# HTTPSConnection بيتصل بـ _create_connection برضه وبعدين يعمل TLS باسم الـ host الأصلي
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_public_connection
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+# كل redirect لازم يروح لمكان مسموح برضه
+class _AllowedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    max_redirections = IMAGE_MAX_REDIRECTS
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not source_allowed(newurl):
+            raise ImageError("Image redirects to a host that is not in IMAGE_SOURCE_HOSTS: %s" % newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# من غير ProxyHandler: لو فيه proxy في الـ environment الـ IP اللي بنشيكه هيبقى بتاعه مش بتاع الصورة
+_opener = urllib.request.OpenerDirector()
+for _handler in (
+    urllib.request.ProxyHandler({}),
+    urllib.request.UnknownHandler(),
+    _PublicHTTPHandler(),
+    _PublicHTTPSHandler(),
+    _AllowedRedirectHandler(),
+    urllib.request.HTTPDefaultErrorHandler(),
+    urllib.request.HTTPErrorProcessor(),
+):
+    _opener.add_handler(_handler)
+
+
+# هل read_source ممكن تنزل الرابط ده أصلاً (من غير ما تتصل بحاجة)
+def fetchable(image_url):
+    if not image_url:
+        return False
+    if image_url.startswith(("http://", "https://")):
+        return source_allowed(image_url)
+    return bool(IMAGE_SOURCE_DIR)
+
+
+def read_source(image_url):
+    if image_url.startswith(("http://", "https://")):
+        if not IMAGE_SOURCE_HOSTS:
+            raise ImageError("Remote images are disabled (set IMAGE_SOURCE_HOSTS): %s" % image_url)
+        if not source_allowed(image_url):
+            raise ImageError("Image host is not in IMAGE_SOURCE_HOSTS: %s" % image_url)
+        with _opener.open(image_url, timeout=IMAGE_FETCH_TIMEOUT) as response:
+            data = response.read(IMAGE_MAX_BYTES + 1)
+    elif IMAGE_SOURCE_DIR:
+        root = os.path.realpath(IMAGE_SOURCE_DIR)
+        path = os.path.realpath(os.path.join(root, image_url.lstrip("/")))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            raise ImageError("Image not found: %s" % image_url)
+        with open(path, "rb") as f:
+            data = f.read(IMAGE_MAX_BYTES + 1)
+    else:
+        raise ImageError("Unsupported image_url: %s" % image_url)
+    if len(data) > IMAGE_MAX_BYTES:
+        raise ImageError("Image is larger than %d bytes: %s" % (IMAGE_MAX_BYTES, image_url))
+    return data
+
+
+# بترجع [(الاسم, بايتات الـ WebP)] بنفس ترتيب RENDITIONS
+def render(data):
+    try:
+        source = Image.open(io.BytesIO(data))
+        source.load()
+    except (OSError, Image.DecompressionBombError) as error:
+        raise ImageError("Not a valid image: %s" % error)
+    with source:
+        image = ImageOps.exif_transpose(source)  # صور الموبايل بتبقى ملفوفة في الـ EXIF
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    renditions = []
+    for name, width in RENDITIONS:
+        resized = image
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        output = io.BytesIO()
+        resized.save(output, "WEBP", quality=WEBP_QUALITY, method=4)
+        renditions.append((name, output.getvalue()))
+    return renditions
+
+
+# بيحفظ الملف باسم الـ hash بتاعه (لو موجود خلاص) وبيرجع الاسم
+def store(data):
+    filename = hashlib.sha256(data).hexdigest()[:32] + ".webp"
+    path = os.path.join(IMAGE_DIR, filename)
+    if not os.path.exists(path):
+        os.makedirs(IMAGE_DIR, exist_ok=True)
+        temporary = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)  # اللي بيقرا الملف يا يلاقيه كامل يا ميلاقيهوش
+    return filename
+
+
+def generate(image_url):
+    return {
+        name: IMAGE_URL_PREFIX + store(data) for name, data in render(read_source(image_url))
+    }
+
+
+# مسار الملف لـ GET /images/<filename> (None لو الاسم مش بتاعنا أو الملف مش موجود)
+def image_path(filename):
+    if not _FILENAME.match(filename):
+        return None
+    path = os.path.join(IMAGE_DIR, filename)
+    return path if os.path.isfile(path) else None
+
+
+# بيعمل النسخ لصف واحد لو معندوش، وبيرجع images (أو None لو الصف مش موجود أو مفيش صورة)
+# الاتصال بيرجع للـ pool وإحنا بننزل الصورة ونحولها (ممكن تاخد لحد IMAGE_FETCH_TIMEOUT وأكتر)
+# وبناخد واحد جديد للـ UPDATE بس. لو الصورة اتغيرت في النص الشرط على image_url في SET_IMAGES بيمنع الكتابة
+def ensure(pool, table, id):
+    row = _read_source_row(pool, table, id)
+    if row is None or row[1] is not None or not row[0]:
+        return row[1] if row else None
+
+    image_url = row[0]
+    images = generate(image_url)  # من غير اتصال
+
+    conn = pool.getconn()
+    try:
+        cur = conn.cursor()
+        try:
+            execute(cur, SET_IMAGES[table], (Json(images), id, image_url))
+            conn.commit()
+        finally:
+            cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+    # من غير db.mark_write(): ده بيخلي الـ worker كله يقرا من الـ primary، وده للـ client اللي عدل مش لشغل الخلفية
+    # لو replica متأخرة رجعت الصف من غير images الكاش هيفضل كده لحد ما الـ replica تلحق أو الـ TTL يخلص
+    catalogue_cache.invalidate((TABLES[table], id))
+    catalogue_cache.invalidate_kind("categories")  # top_products فيها صور المنتجات
+    return images
+
+
+def _read_source_row(pool, table, id):
+    conn = pool.getconn()
+    try:
+        cur = conn.cursor()
+        try:
+            execute(cur, GET_SOURCE[table], (id,))
+            return cur.fetchone()
+        finally:
+            cur.close()
+            conn.rollback()
+    finally:
+        pool.putconn(conn)
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# الخلفية
+
+
+_executor = None
+_pending = set()  # (table, id) اللي في الطابور أو شغالين عليها دلوقتي
+_failed = {}  # (table, id) -> وقت المحاولة الجاية
+_lock = threading.Lock()
+
+
+# بعد إضافة أو تعديل صف: بيحطه في طابور الخلفية (الصورة ممكن تكون اتغيرت، فالفشل اللي فات ملوش لازمة)
+def schedule(table, id, image_url):
+    with _lock:
+        _failed.pop((table, id), None)
+    _submit(table, id, image_url)
+
+
+# للصفوف اللي طالعة في رد: أي صف فيه صورة ومعندوش نسخ بيتحط في الطابور
+def schedule_missing(table, rows):
+    if Image is None:
+        return
+    for row in rows:
+        if row.get("image_url") and row.get("images", False) is None and "id" in row:
+            _submit(table, row["id"], row["image_url"])
+
+
+# لصف معندوش نسخ لسه (GET /products/<id>/images/<rendition>). عكس schedule مش بيلغي الانتظار بعد الفشل
+def queue(table, id, image_url):
+    _submit(table, id, image_url)
+
+
+# الصف بيدخل الطابور مرة واحدة بس حتى لو اتطلب كتير
+# ولو مفيش مكان نقدر ننزل منه الصورة أصلاً (IMAGE_SOURCE_HOSTS أو IMAGE_SOURCE_DIR) مش بيدخل خالص:
+# كان كل رد فيه قايمة بيحط job لكل صف تاخد اتصال من الـ pool وتفشل، وتتكرر كل IMAGE_RETRY_AFTER
+def _submit(table, id, image_url):
+    global _executor
+    if Image is None or not fetchable(image_url):
+        return
+    key = (table, id)
+    with _lock:
+        if key in _pending or time.monotonic() < _failed.get(key, 0):
+            return
+        _pending.add(key)
+        if _executor is None:  # بيتعمل بعد الـ fork بتاع gunicorn في كل worker
+            _executor = ThreadPoolExecutor(IMAGE_WORKERS, thread_name_prefix="images")
+    _executor.submit(_run, table, id)
+
+
+def _run(table, id):
+    key = (table, id)
+    try:
+        ensure(db.get_pool(), table, id)
+    except ImageError as error:
+        log.info("Skipping images for %s %s: %s", table, id, error)
+        _retry_later(key)
+    except OSError as error:  # الصورة منزلتش (الـ timeout أو 404 مثلاً)
+        log.warning("Failed to fetch image for %s %s: %s", table, id, error)
+        _retry_later(key)
+    except Exception:
+        log.warning("Failed to generate images for %s %s", table, id, exc_info=True)
+        _retry_later(key)
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def _retry_later(key):
+    with _lock:
+        if len(_failed) > 10000:
+            _failed.clear()
+        _failed[key] = time.monotonic() + IMAGE_RETRY_AFTER
+
+
+def backfill(pool):
+    done = failed = 0
+    for table in TABLES:
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            execute(cur, MISSING_IMAGES[table])
+            ids = [row[0] for row in cur.fetchall()]
+            cur.close()
+            conn.rollback()
+        finally:
+            pool.putconn(conn)
+        for id in ids:
+            try:
+                ensure(pool, table, id)
+                done += 1
+            except (ImageError, OSError, psycopg2.Error) as error:
+                log.warning("Failed to generate images for %s %s: %s", table, id, error)
+                failed += 1
+    return done, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate product and category image renditions")
+    parser.add_argument("--backfill", action="store_true", help="Generate renditions for every row without them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if Image is None:
+        raise SystemExit("Pillow is not installed (pip install Pillow)")
+    if not args.backfill:
+        parser.print_help()
+        return
+    try:
+        done, failed = backfill(db.get_pool())
+    finally:
+        db.close_pool()
+    log.info("Generated images for %d row(s), %d failed.", done, failed)
+
+
+if __name__ == "__main__":
+    main()
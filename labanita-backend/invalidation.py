@@ -0,0 +1,188 @@
+# مسح كاش الكتالوج في كل الـ workers مش في الـ worker اللي عمل التعديل بس
+#
+# catalogue_cache (cache.py) في الذاكرة لكل process، ومع gunicorn (workers = 2 × cores + 1) التعديل كان بيمسح
+# كاش worker واحد والباقيين يفضلوا يرجعوا البيانات القديمة (والـ ETag القديم) لحد CACHE_TTL
+#
+# - migrations/0007 بيعمل trigger على products و categories بيبعت NOTIFY catalogue_changes "<الجدول>:<id>" مع كل تعديل
+# - كل worker عنده thread بيعمل LISTEN باتصال خاص بيه (مش من الـ pool) وبيمسح المفاتيح اللي اتغيرت أول ما توصل
+# - لو الاتصال ده وقع الـ notifications اللي فاتت بتضيع: بنمسح الكاش كله ونخزن لمدة CACHE_UNSYNCED_TTL بس
+#   لحد ما يرجع (وبنمسحه تاني أول ما يرجع)
+# - مع replica: worker تاني ممكن يقرا الصف القديم من الـ replica بعد الـ NOTIFY ويخزنه، فبنمسح نفس المفاتيح
+#   تاني بعد DB_REPLICA_MAX_LAG (أكتر من كده القراية بتروح للـ primary أصلاً)
+#
+# LISTEN مش بيشتغل ورا pgbouncer في transaction mode: الاتصال ده لازم يروح للـ primary على طول
+
+import logging
+import os
+import select
+import threading
+import time
+
+import psycopg2
+
+import db
+from cache import CACHE_TTL, catalogue_cache
+
+log = logging.getLogger(__name__)
+
+CACHE_SYNC = os.environ.get("CACHE_SYNC", "1") not in ("0", "false")
+CHANNEL = "catalogue_changes"
+CACHE_UNSYNCED_TTL = float(os.environ.get("CACHE_UNSYNCED_TTL", "5"))  # عمر الكاش لما الـ LISTEN واقع
+RECONNECT_INTERVAL = 2  # بالثواني
+KEEPALIVE_INTERVAL = 30  # SELECT 1 لو مفيش حاجة وصلت، عشان نعرف إن الاتصال مات
+BULK_THRESHOLD = 100  # أكتر من كده id من نفس الجدول في دفعة واحدة (bulk import): بنمسح النوع كله
+
+# الجدول -> اسم النوع في مفاتيح الكاش
+KINDS = {"products": "product", "categories": "category"}
+
+
+class CacheInvalidator:
+    def __init__(self, cache, config, ttl=CACHE_TTL):
+        self.cache = cache
+        self.config = config
+        self.ttl = ttl
+        self.connected = False
+        self.notifications = 0
+        self.reconnects = 0
+        self._failed_once = False
+        self._delayed = []  # [(وقت المسح التاني, ids, tables)] للـ replica
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:  # بيتعمل بعد الـ fork بتاع gunicorn في كل worker
+                self.cache.ttl = min(self.ttl, CACHE_UNSYNCED_TTL)  # لحد ما الـ LISTEN يشتغل
+                self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except (psycopg2.Error, OSError) as error:
+                if self.connected or not self._failed_once:  # أول مرة يقع بس، مش كل محاولة
+                    log.warning(
+                        "Cache invalidation listener is down, caching for %gs only: %s", CACHE_UNSYNCED_TTL, error
+                    )
+                self._failed_once = True
+                self._set_connected(False)
+            time.sleep(RECONNECT_INTERVAL)
+
+    def _listen(self):
+        conn = psycopg2.connect(connect_timeout=db.REPLICA_CONNECT_TIMEOUT, **self.config)
+        try:
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute("LISTEN %s;" % CHANNEL)
+            self._set_connected(True)
+            idle_since = time.monotonic()
+            while True:
+                now = time.monotonic()
+                timeout = KEEPALIVE_INTERVAL - (now - idle_since)
+                if self._delayed:
+                    timeout = min(timeout, self._delayed[0][0] - now)
+                if select.select([conn], [], [], max(0, timeout)) == ([], [], []):
+                    if time.monotonic() - idle_since >= KEEPALIVE_INTERVAL:
+                        cur.execute("SELECT 1;")
+                        idle_since = time.monotonic()
+                else:
+                    conn.poll()
+                    idle_since = time.monotonic()
+                if conn.notifies:
+                    payloads = [notify.payload for notify in conn.notifies]
+                    del conn.notifies[:]
+                    self.apply(payloads)
+                self._run_delayed()
+        finally:
+            conn.close()
+
+    # الـ notifications اللي فاتت وإحنا مش متصلين ضاعت، فاللي في الكاش ممكن يكون قديم
+    def _set_connected(self, connected):
+        self.cache.clear()
+        self.cache.ttl = self.ttl if connected else min(self.ttl, CACHE_UNSYNCED_TTL)
+        if connected and self._failed_once:
+            self.reconnects += 1
+            log.info("Cache invalidation listener reconnected.")
+        self.connected = connected
+
+    # payloads زي "products:5" أو "categories:*"
+    def apply(self, payloads):
+        ids = {table: set() for table in KINDS}
+        tables = set()
+        for payload in payloads:
+            table, _, id = payload.partition(":")
+            if table not in KINDS:
+                continue
+            if id == "*":
+                tables.add(table)
+            elif id.isdigit():
+                ids[table].add(int(id))
+        self.notifications += len(payloads)
+        self._invalidate(ids, tables)
+        if db.REPLICA_CONFIG is not None:
+            self._delayed.append((time.monotonic() + db.REPLICA_MAX_LAG + 1, ids, tables))
+
+    def _invalidate(self, ids, tables):
+        changed = False
+        for table, kind in KINDS.items():
+            if table in tables or len(ids[table]) > BULK_THRESHOLD:
+                self.cache.invalidate_kind(kind)
+                changed = True
+                continue
+            for id in ids[table]:
+                self.cache.invalidate((kind, id))
+                changed = True
+        if changed:
+            self.cache.invalidate_kind("categories")  # product_count و top_products
+
+    def _run_delayed(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, ids, tables = self._delayed.pop(0)
+            self._invalidate(ids, tables)
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "connected": self.connected,
+            "notifications": self.notifications,
+            "reconnects": self.reconnects,
+        }
+
+
+invalidator = CacheInvalidator(catalogue_cache, db.DB_CONFIG)
+
+
+def start():
+    if CACHE_SYNC:
+        invalidator.start()
+
+
+def stats():
+    if not CACHE_SYNC:
+        return {"enabled": False}
+    return invalidator.stats()
+
+
+# للـ /metrics في app.py و asgi.py
+def gauges():
+    if not CACHE_SYNC:
+        return []
+    return [("cache_sync_connected", "1 if cache invalidations from other workers are received.", int(invalidator.connected))]
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# Flask
+
+
+# الـ thread بيبدأ مع أول طلب في الـ worker (مش في الـ master قبل الـ fork مع preload_app)
+def init_app(app):
+    if not CACHE_SYNC:
+        return
+
+    @app.before_request
+    def _start_invalidator():
+        invalidator.start()
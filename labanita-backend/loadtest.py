@@ -0,0 +1,127 @@
+# اختبار حمل بسيط بيضرب نفس الـ routes على أكتر من سيرفر ويقارن بينهم (مثلاً WSGI على 5000 و ASGI على 8000)
+# python loadtest.py --url http://127.0.0.1:5000 --url http://127.0.0.1:8000 --concurrency 200 --duration 20
+# كل client عنده اتصال keep-alive خاص بيه وبيبعت طلب ورا التاني، والنتيجة: عدد الطلبات في الثانية والـ latency percentiles
+# كل الطلبات من نفس الـ IP، فشغل السيرفر بـ RATE_LIMIT=0 (ratelimit.py) وإلا أغلبها هيرجع 429
+
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = ["/products?limit=20", "/products/1", "/categories", "/categories/1"]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_client(base, paths, deadline, think_time, results, lock):
+    parts = urlsplit(base)
+    conn = None
+    latencies = []
+    errors = 0
+    statuses = {}
+    i = 0
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            if conn is not None:
+                conn.close()
+            conn = None
+        if think_time:
+            time.sleep(think_time)
+    if conn is not None:
+        conn.close()
+    with lock:
+        results["latencies"].extend(latencies)
+        results["errors"] += errors
+        for status, count in statuses.items():
+            results["statuses"][status] = results["statuses"].get(status, 0) + count
+
+
+def run(base, paths, concurrency, duration, think_time):
+    results = {"latencies": [], "errors": 0, "statuses": {}}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(base, paths, deadline, think_time, results, lock),
+            daemon=True,
+        )
+        for _ in range(concurrency)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(results["latencies"])
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "url": base,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": results["errors"],
+        "statuses": {str(k): v for k, v in sorted(results["statuses"].items())},
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare throughput/latency of backend servers")
+    parser.add_argument("--url", action="append", required=True, help="Base URL (repeat to compare)")
+    parser.add_argument("--path", action="append", help="Path to request (repeatable, used round-robin)")
+    parser.add_argument("--concurrency", type=int, default=100, help="Concurrent keep-alive clients")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per server")
+    parser.add_argument("--think-time", type=float, default=0, help="Seconds each client waits between requests")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    paths = args.path or DEFAULT_PATHS
+    reports = []
+    for base in args.url:
+        report = run(base, paths, args.concurrency, args.duration, args.think_time)
+        reports.append(report)
+        print(
+            "%(url)s  c=%(concurrency)d  %(requests)d req  %(rps)s req/s  "
+            "p50=%(p50_ms)sms p95=%(p95_ms)sms p99=%(p99_ms)sms max=%(max_ms)sms  errors=%(errors)d  %(statuses)s"
+            % report
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+import bisect
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+import traceback
+
+from flask import g, request
+
+# مقاييس الأداء (Prometheus text format على GET /metrics) واللوجز المنظمة (JSON سطر لكل حدث)
+# من غير مكتبات زيادة. كل worker تحت gunicorn عنده مقاييسه لوحده (زي /worker/stats)، و Prometheus بيجمعهم
+
+# حدود الـ buckets (بالثواني / بالبايت / بعدد الصفوف)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+ROWS_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 10000, 100000)
+
+# أي query أبطأ من كده بتتكتب في اللوج مع الـ plan بتاعها (0 يقفلها)
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # json أو text
+
+log = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labels -> [عدد كل bucket..., العدد الكلي, المجموع]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    # تقدير الـ percentile من الـ buckets (نفس طريقة histogram_quantile في Prometheus)
+    def quantile(self, q, series):
+        total = series[-2]
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, series):
+            if cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.buckets[-1]  # في الـ +Inf bucket، أحسن حاجة نقولها هي آخر حد
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        for labels, series in sorted(self.snapshot().items()):
+            pairs = ['%s="%s"' % (k, _escape(v)) for k, v in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(
+                    "%s_bucket{%s} %d"
+                    % (self.name, ",".join(pairs + ['le="%s"' % _number(bound)]), cumulative)
+                )
+            lines.append(
+                "%s_bucket{%s} %d" % (self.name, ",".join(pairs + ['le="+Inf"']), series[-2])
+            )
+            label_text = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append("%s_count%s %d" % (self.name, label_text, series[-2]))
+            lines.append("%s_sum%s %s" % (self.name, label_text, _number(series[-1])))
+        return lines
+
+    # p50/p95/p99 لكل series (للـ JSON ولقراية سريعة من غير Prometheus)
+    def summary(self):
+        result = []
+        for labels, series in sorted(self.snapshot().items()):
+            item = dict(zip(self.labelnames, labels))
+            item["count"] = series[-2]
+            item["sum"] = round(series[-1], 6)
+            for q in (0.5, 0.95, 0.99):
+                value = self.quantile(q, series)
+                item["p%d" % round(q * 100)] = round(value, 6) if value is not None else None
+            result.append(item)
+        return result
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request.",
+    LATENCY_BUCKETS,
+    ("method", "route", "status"),
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size.", SIZE_BUCKETS, ("method", "route")
+)
+DB_CONNECT = Histogram(
+    "db_connect_seconds", "Time to open a new database connection.", LATENCY_BUCKETS
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection.", LATENCY_BUCKETS
+)
+DB_QUERY = Histogram(
+    "db_query_seconds",
+    "Time spent in database calls (execute = running the statement, fetch = reading rows).",
+    LATENCY_BUCKETS,
+    ("phase",),
+)
+DB_ROWS = Histogram("db_rows_returned", "Rows fetched per fetch call.", ROWS_BUCKETS)
+
+HISTOGRAMS = (REQUEST_DURATION, RESPONSE_SIZE, DB_CONNECT, DB_POOL_WAIT, DB_QUERY, DB_ROWS)
+
+
+# متوسط الحاجة في آخر كام ثانية (الـ histograms بتجمع من أول ما الـ worker اشتغل، فمش بتبين الزحمة اللي حاصلة دلوقتي)
+# القيمة بتقل لوحدها مع الوقت لو مفيش قياسات جديدة (half_life بالثواني)
+class RecentAverage:
+    def __init__(self, half_life=1.0, weight=0.2):
+        self.half_life = half_life
+        self.weight = weight  # وزن كل قياس جديد
+        self._value = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decayed(self, now):
+        return self._value * math.pow(0.5, (now - self._updated) / self.half_life)
+
+    def observe(self, value):
+        now = time.monotonic()
+        with self._lock:
+            current = self._decayed(now)
+            self._value = current + self.weight * (value - current)
+            self._updated = now
+
+    def value(self):
+        with self._lock:
+            return self._decayed(time.monotonic())
+
+    def reset(self):
+        with self._lock:
+            self._value = 0.0
+            self._updated = time.monotonic()
+
+
+# وقت انتظار اتصال من الـ pool مؤخراً (ratelimit.py بيستخدمه عشان يعرف إن قاعدة البيانات مزحومة)
+RECENT_POOL_WAIT = RecentAverage()
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+    RECENT_POOL_WAIT.reset()
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# إحصائيات الطلب الحالي (وقت قاعدة البيانات وعدد الـ queries والصفوف) عشان تطلع في سطر اللوج بتاعه
+# contextvar عشان تشتغل مع الـ threads بتاعة Flask ومع الـ tasks بتاعة asyncio
+
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def start_request():
+    stats = {"db_ms": 0.0, "queries": 0, "rows": 0, "pool_wait_ms": 0.0}
+    _request_stats.set(stats)
+    return stats
+
+
+def finish_request():
+    stats = _request_stats.get()
+    _request_stats.set(None)
+    return stats
+
+
+def observe_pool_wait(seconds):
+    DB_POOL_WAIT.observe(seconds)
+    RECENT_POOL_WAIT.observe(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats["pool_wait_ms"] += seconds * 1000
+
+
+def observe_query(phase, seconds, rows=None):
+    DB_QUERY.observe(seconds, phase)
+    if rows is not None:
+        DB_ROWS.observe(rows)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats["db_ms"] += seconds * 1000
+        if phase == "execute":
+            stats["queries"] += 1
+        if rows is not None:
+            stats["rows"] += rows
+
+
+def is_slow(seconds):
+    return SLOW_QUERY_MS > 0 and seconds * 1000 >= SLOW_QUERY_MS
+
+
+def log_slow_query(query, seconds, plan=None):
+    log.warning(
+        "slow query",
+        extra={
+            "fields": {
+                "event": "slow_query",
+                "duration_ms": round(seconds * 1000, 2),
+                "query": query,
+                "plan": plan,
+            }
+        },
+    )
+
+
+def log_request(method, path, route, status, seconds, size, stats):
+    fields = {
+        "event": "request",
+        "method": method,
+        "path": path,
+        "route": route,
+        "status": status,
+        "duration_ms": round(seconds * 1000, 2),
+        "bytes": size,
+    }
+    if stats:
+        fields.update({key: round(value, 2) for key, value in stats.items()})
+    log.info("%s %s %s", method, path, status, extra={"fields": fields})
+
+
+def observe_request(method, path, route, status, seconds, size):
+    REQUEST_DURATION.observe(seconds, method, route, str(status))
+    if size is not None:
+        RESPONSE_SIZE.observe(size, method, route)
+    log_request(method, path, route, status, seconds, size, finish_request())
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# العرض
+
+# gauges: list من (الاسم, الوصف, القيمة) للحاجات اللي بتتقرا وقت الطلب (الـ pool والكاش)
+def render(gauges=()):
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for name, help, value in gauges:
+        lines.append("# HELP %s %s" % (name, help))
+        lines.append("# TYPE %s gauge" % name)
+        lines.append("%s %s" % (name, _number(value)))
+    return "\n".join(lines) + "\n"
+
+
+def summary(gauges=()):
+    result = {histogram.name: histogram.summary() for histogram in HISTOGRAMS}
+    result.update({name: value for name, _, value in gauges})
+    return result
+
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# اللوجز
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = "".join(traceback.format_exception(*record.exc_info)).strip()
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+# بتتنادي مرة واحدة من app.py و asgi.py. لو حد ظبط الـ logging قبل كده (gunicorn --log-config مثلاً) مش بنلمسه
+def configure_logging():
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# Flask
+
+
+def _flask_route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+
+def init_app(app):
+    @app.before_request
+    def _metrics_start():
+        g.metrics_start = time.perf_counter()
+        start_request()
+
+    @app.after_request
+    def _metrics_finish(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        method, path, route = request.method, request.path, _flask_route()
+        status = response.status_code
+
+        if not response.is_streamed:
+            observe_request(
+                method, path, route, status, time.perf_counter() - start, response.content_length
+            )
+            return response
+
+        # الرد المتقسم (streaming) بيكمل بعد ما الـ view يخلص، فبنعد البايتات وبنسجل لما الرد يتقفل
+        size = [0]
+        body = response.response
+
+        def counting():
+            try:
+                for chunk in body:
+                    size[0] += len(chunk.encode() if isinstance(chunk, str) else chunk)
+                    yield chunk
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+
+        response.response = counting()
+        response.call_on_close(
+            lambda: observe_request(
+                method, path, route, status, time.perf_counter() - start, size[0]
+            )
+        )
+        return response
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# ASGI (Starlette): middleware بسيط بيقيس الطلب لحد آخر بايت في الرد
+
+
+class ASGIMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        start_request()
+        state = {"status": 500, "size": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["size"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            observe_request(
+                scope["method"],
+                scope["path"],
+                getattr(route, "path", "unmatched"),
+                state["status"],
+                time.perf_counter() - start,
+                state["size"],
+            )
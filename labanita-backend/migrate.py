@@ -0,0 +1,160 @@
+# الـ migrations بتاعة قاعدة البيانات: ملفات SQL في migrations/ اسمها <رقم>_<وصف>.sql
+# وبتتنفذ بالترتيب مرة واحدة بس، وكل ملف في transaction لوحده، واللي اتنفذ بيتسجل في جدول schema_migrations
+#
+#   python migrate.py            -> تنفيذ اللي لسه متنفذش
+#   python migrate.py --status   -> عرض كل migration واتنفذ ولا لأ
+#
+# app.py و asgi.py بيرفضوا يشتغلوا لو فيه migrations لسه متنفذتش (SCHEMA_CHECK=0 يقفل الفحص ده)
+
+import argparse
+import logging
+import os
+import re
+
+import psycopg2
+
+from db import DB_CONFIG
+
+log = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+SCHEMA_CHECK = os.environ.get("SCHEMA_CHECK", "1") not in ("0", "false")
+
+# رقم ثابت للـ advisory lock عشان لو أكتر من process عملوا migrate في نفس الوقت واحد بس اللي ينفذ
+MIGRATION_LOCK_ID = 7245113
+
+_FILENAME = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+
+# كل الـ migrations الموجودة كـ [(الرقم, الاسم, المسار)] مترتبة بالرقم
+def available(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append(
+                (int(match.group(1)), match.group(2), os.path.join(directory, filename))
+            )
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Duplicate migration numbers in %s" % directory)
+    return migrations
+
+
+def _ensure_table(cur):
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version INTEGER PRIMARY KEY,"
+        " name TEXT NOT NULL,"
+        " applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP);"
+    )
+
+
+# أرقام الـ migrations اللي اتنفذت (set فاضية لو الجدول نفسه مش موجود)
+def applied(cur):
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return set()
+    cur.execute("SELECT version FROM schema_migrations;")
+    return {row[0] for row in cur.fetchall()}
+
+
+def pending(conn, directory=MIGRATIONS_DIR):
+    cur = conn.cursor()
+    done = applied(cur)
+    cur.close()
+    conn.rollback()
+    return [migration for migration in available(directory) if migration[0] not in done]
+
+
+# تنفيذ الـ migrations اللي لسه متنفذتش. بترجع الأرقام اللي اتنفذت
+def migrate(conn, directory=MIGRATIONS_DIR):
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+    try:
+        _ensure_table(cur)
+        conn.commit()
+        done = applied(cur)
+        ran = []
+        for version, name, path in available(directory):
+            if version in done:
+                continue
+            with open(path, encoding="utf-8") as f:
+                sql = f.read()
+            log.info("Applying migration %04d_%s", version, name)
+            try:
+                cur.execute(sql)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                    (version, name),
+                )
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                raise
+            finally:
+                # الـ RAISE WARNING اللي جوه ملفات الـ SQL
+                for notice in conn.notices:
+                    level = logging.WARNING if notice.startswith("WARNING") else logging.INFO
+                    log.log(level, notice.strip())
+                del conn.notices[:]
+            ran.append(version)
+        return ran
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+        conn.commit()
+        cur.close()
+
+
+# بيتنادى لما السيرفر يبدأ: بيرمي SchemaOutdated لو قاعدة البيانات محتاجة migrations
+# لو قاعدة البيانات نفسها مش شغالة بنكمل عادي (زي ما الـ app كان بيعمل قبل كده)، والفحص يبان أول ما تشتغل
+def check_schema():
+    if not SCHEMA_CHECK:
+        return
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+    except psycopg2.OperationalError as error:
+        log.warning("Skipping the schema check, database is not reachable: %s", error)
+        return
+    try:
+        missing = pending(conn)
+    finally:
+        conn.close()
+    if missing:
+        raise SchemaOutdated(
+            "Database schema is behind, run `python migrate.py` to apply: "
+            + ", ".join("%04d_%s" % (version, name) for version, name, _ in missing)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--status", action="store_true", help="List migrations without applying them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.status:
+            cur = conn.cursor()
+            done = applied(cur)
+            cur.close()
+            for version, name, _ in available():
+                log.info("%04d_%s  %s", version, name, "applied" if version in done else "pending")
+            return
+        ran = migrate(conn)
+        if ran:
+            log.info("Applied %d migration(s).", len(ran))
+        else:
+            log.info("Schema is up to date.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
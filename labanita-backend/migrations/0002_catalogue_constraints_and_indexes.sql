@@ -0,0 +1,33 @@
+-- الـ foreign key من products.category_id والـ indexes اللي الـ endpoints بتعتمد عليها
+
+-- الـ FK بيتضاف بس لو مفيش واحد قبل كده (ممكن يكون معمول بإيد باسم تاني)
+-- NOT VALID عشان الصفوف القديمة متوقفش الـ migration، وبعدين بنحاول نعمل VALIDATE
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'products'::regclass AND contype = 'f'
+          AND confrelid = 'categories'::regclass
+    ) THEN
+        ALTER TABLE products
+            ADD CONSTRAINT products_category_id_fkey
+            FOREIGN KEY (category_id) REFERENCES categories (id) NOT VALID;
+        BEGIN
+            ALTER TABLE products VALIDATE CONSTRAINT products_category_id_fkey;
+        EXCEPTION WHEN foreign_key_violation THEN
+            RAISE WARNING 'products has rows with a missing category_id; the foreign key only applies to new rows until they are fixed';
+        END;
+    END IF;
+END
+$$;
+
+-- GET /products?category_id=..&cursor=.. (WHERE category_id = ? AND id > ? ORDER BY id)
+-- وكمان بيخلي الـ FK check لما تصنيف يتمسح ميعملش scan على كل المنتجات
+CREATE INDEX IF NOT EXISTS products_category_id_id_idx ON products (category_id, id);
+
+-- فلاتر min_price / max_price
+CREATE INDEX IF NOT EXISTS products_price_idx ON products (price);
+
+-- آخر تعديل (الـ ETag / Last-Modified وأي حاجة بتدور على اللي اتغير بعد وقت معين)
+CREATE INDEX IF NOT EXISTS products_updated_at_idx ON products (updated_at);
+CREATE INDEX IF NOT EXISTS categories_updated_at_idx ON categories (updated_at);
@@ -0,0 +1,31 @@
+-- البحث في المنتجات (GET /products/search):
+-- search_vector بيتحسب لوحده من الاسم (وزن A) والوصف (وزن B) بالعربي والإنجليزي، وعليه GIN index
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('arabic', coalesce(name, '')), 'A')
+    || setweight(to_tsvector('english', coalesce(name, '')), 'A')
+    || setweight(to_tsvector('arabic', coalesce(description, '')), 'B')
+    || setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS products_search_idx ON products USING gin (search_vector);
+
+-- pg_trgm عشان البحث يلاقي الاسم حتى لو فيه غلطة إملائية. جزء من contrib وممكن ميكونش متسطب
+-- (أو المستخدم معندوش صلاحية)، وساعتها البحث بيشتغل full-text بس
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN OTHERS THEN
+    RAISE WARNING 'pg_trgm is not available, search will not be typo tolerant: %', SQLERRM;
+END
+$$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS products_name_trgm_idx ON products USING gin (name gin_trgm_ops);
+    END IF;
+END
+$$;
+
+ANALYZE products;
@@ -0,0 +1,42 @@
+-- الطلبات (POST /orders)
+-- stock: المخزون المتاح، و NULL معناه إن المنتج مش بنتابع مخزونه (يتطلب بأي كمية)
+ALTER TABLE products ADD COLUMN IF NOT EXISTS stock INTEGER;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'products_stock_check'
+    ) THEN
+        ALTER TABLE products ADD CONSTRAINT products_stock_check CHECK (stock IS NULL OR stock >= 0);
+    END IF;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS orders (
+    id SERIAL PRIMARY KEY,
+    -- الـ Idempotency-Key اللي الموبايل بيبعته، عشان إعادة نفس الطلب ترجع نفس الأوردر
+    idempotency_key VARCHAR(255) UNIQUE,
+    request_hash CHAR(40),  -- sha1 للـ body عشان نرفض نفس المفتاح مع طلب مختلف
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    delivery_address TEXT NOT NULL,
+    payment_method VARCHAR(20) NOT NULL,
+    subtotal NUMERIC(12, 2) NOT NULL,
+    delivery_fee NUMERIC(10, 2) NOT NULL,
+    total NUMERIC(12, 2) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS order_items (
+    id SERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL REFERENCES orders (id) ON DELETE CASCADE,
+    -- لو المنتج اتمسح بعدين الأوردر بيفضل بالاسم والسعر وقت الطلب
+    product_id INTEGER REFERENCES products (id) ON DELETE SET NULL,
+    name VARCHAR(255) NOT NULL,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    unit_price NUMERIC(10, 2) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS order_items_order_id_idx ON order_items (order_id);
+-- عشان مسح منتج (ON DELETE SET NULL) ميعملش scan على كل الطلبات
+CREATE INDEX IF NOT EXISTS order_items_product_id_idx ON order_items (product_id);
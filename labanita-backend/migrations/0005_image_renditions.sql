@@ -0,0 +1,22 @@
+-- نسخ الصور المصغرة (images.py): {"thumb": "/images/<hash>.webp", "detail": ..., "retina": ...}
+-- NULL معناه إنها لسه متعملتش (الموبايل يستخدم image_url لحد ما تتعمل)
+ALTER TABLE products ADD COLUMN IF NOT EXISTS images JSONB;
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS images JSONB;
+
+-- لو الصورة الأصلية اتغيرت (PUT أو الـ bulk import أو SQL بإيد) النسخ القديمة متبقاش صح
+CREATE OR REPLACE FUNCTION reset_images() RETURNS trigger AS $$
+BEGIN
+    IF NEW.image_url IS DISTINCT FROM OLD.image_url THEN
+        NEW.images := NULL;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_reset_images ON products;
+CREATE TRIGGER products_reset_images BEFORE UPDATE OF image_url ON products
+    FOR EACH ROW EXECUTE FUNCTION reset_images();
+
+DROP TRIGGER IF EXISTS categories_reset_images ON categories;
+CREATE TRIGGER categories_reset_images BEFORE UPDATE OF image_url ON categories
+    FOR EACH ROW EXECUTE FUNCTION reset_images();
@@ -0,0 +1,46 @@
+-- GET /changes: التغييرات في الكتالوج من آخر مرة الموبايل عمل sync
+-- الصفوف اللي اتضافت أو اتعدلت بتتعرف من coalesce(updated_at, created_at)، واللي اتمسحت بتتسجل هنا (tombstones)
+
+CREATE TABLE IF NOT EXISTS deleted_rows (
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, row_id)
+);
+CREATE INDEX IF NOT EXISTS deleted_rows_deleted_at_idx ON deleted_rows (deleted_at);
+
+-- trigger عشان أي مسح يتسجل (DELETE /products و /categories أو SQL بإيد)
+CREATE OR REPLACE FUNCTION record_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO deleted_rows (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.id)
+    ON CONFLICT (table_name, row_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+
+-- الـ tombstones الأقدم من 30 يوم بتتمسح مع كل DELETE (لازم نفس CHANGES_RETENTION في repository.py)
+-- والـ client اللي الـ cursor بتاعه أقدم من كده بيعمل sync كامل
+CREATE OR REPLACE FUNCTION prune_deletions() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM deleted_rows WHERE deleted_at < CURRENT_TIMESTAMP - interval '30 days';
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_record_deletion ON products;
+CREATE TRIGGER products_record_deletion AFTER DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION record_deletion();
+DROP TRIGGER IF EXISTS products_prune_deletions ON products;
+CREATE TRIGGER products_prune_deletions AFTER DELETE ON products
+    FOR EACH STATEMENT EXECUTE FUNCTION prune_deletions();
+
+DROP TRIGGER IF EXISTS categories_record_deletion ON categories;
+CREATE TRIGGER categories_record_deletion AFTER DELETE ON categories
+    FOR EACH ROW EXECUTE FUNCTION record_deletion();
+DROP TRIGGER IF EXISTS categories_prune_deletions ON categories;
+CREATE TRIGGER categories_prune_deletions AFTER DELETE ON categories
+    FOR EACH STATEMENT EXECUTE FUNCTION prune_deletions();
+
+-- "اللي اتغير من وقت كذا" من غير ما نقرا الجدول كله
+CREATE INDEX IF NOT EXISTS products_changed_at_idx ON products ((coalesce(updated_at, created_at)), id);
+CREATE INDEX IF NOT EXISTS categories_changed_at_idx ON categories ((coalesce(updated_at, created_at)), id);
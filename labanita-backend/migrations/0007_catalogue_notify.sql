@@ -0,0 +1,36 @@
+-- كاش الكتالوج (cache.py) في كل worker لوحده، فأي تعديل في products أو categories لازم يوصل لكل الـ workers
+-- الـ trigger بيبعت NOTIFY بـ "<الجدول>:<id>" بعد الـ commit، و invalidation.py في كل worker بيمسح المفاتيح دي
+-- (أي كتابة: الـ API أو bulk import أو الأوردرات أو SQL بإيد). الـ payloads المتكررة في نفس الـ transaction بتتبعت مرة واحدة
+
+CREATE OR REPLACE FUNCTION notify_catalogue_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('catalogue_changes', TG_TABLE_NAME || ':' || OLD.id);
+    ELSE
+        PERFORM pg_notify('catalogue_changes', TG_TABLE_NAME || ':' || NEW.id);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- TRUNCATE مالوش صفوف: "<الجدول>:*" يعني امسح كل النوع ده
+CREATE OR REPLACE FUNCTION notify_catalogue_truncate() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('catalogue_changes', TG_TABLE_NAME || ':*');
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_notify_change ON products;
+CREATE TRIGGER products_notify_change AFTER INSERT OR UPDATE OR DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION notify_catalogue_change();
+DROP TRIGGER IF EXISTS products_notify_truncate ON products;
+CREATE TRIGGER products_notify_truncate AFTER TRUNCATE ON products
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_catalogue_truncate();
+
+DROP TRIGGER IF EXISTS categories_notify_change ON categories;
+CREATE TRIGGER categories_notify_change AFTER INSERT OR UPDATE OR DELETE ON categories
+    FOR EACH ROW EXECUTE FUNCTION notify_catalogue_change();
+DROP TRIGGER IF EXISTS categories_notify_truncate ON categories;
+CREATE TRIGGER categories_notify_truncate AFTER TRUNCATE ON categories
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_catalogue_truncate();
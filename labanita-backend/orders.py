@@ -0,0 +1,263 @@
+import hashlib
+import json
+import os
+import time
+from decimal import Decimal
+
+import psycopg2
+import psycopg2.errors
+from psycopg2.extras import execute_values
+
+from repository import execute, row_mapper
+
+DELIVERY_FEE = Decimal(os.environ.get("DELIVERY_FEE", "8"))  # نفس رسوم التوصيل اللي في شاشة الـ checkout
+PAYMENT_METHODS = ("apple_pay", "card", "cash")
+ORDER_MAX_ITEMS = 100  # أقصى عدد منتجات مختلفة في الأوردر
+ORDER_MAX_QUANTITY = 1000  # أقصى كمية من المنتج الواحد
+RESERVE_ATTEMPTS = 3  # كام مرة نحاول نحجز المنتجات اللي طلبات تانية ماسكاها في نفس اللحظة
+RESERVE_RETRY_DELAY = 0.05  # بالثواني، وبيزيد مع كل محاولة
+
+
+# خطأ في الطلب نفسه بيرجع للـ client بالـ status بتاعه (مش 500)
+class OrderError(Exception):
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.details = details
+
+    def to_dict(self):
+        return dict(self.details, message=self.message)
+
+
+# التحقق من الـ body وتحويله لشكل ثابت (نفس المنتج لو اتكرر بتتجمع كميته)
+# بيرمي OrderError(400) فيها سبب الخطأ
+def parse_order(data):
+    if not isinstance(data, dict):
+        raise OrderError(400, "Order must be a JSON object.")
+
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        raise OrderError(400, "items must be a non-empty list.")
+    quantities = {}
+    for index, item in enumerate(items, start=1):
+        try:
+            product_id = int(item["product_id"])
+            quantity = int(item["quantity"])
+        except (KeyError, TypeError, ValueError):
+            raise OrderError(
+                400, "Item %d needs an integer product_id and quantity." % index
+            )
+        if quantity < 1:
+            raise OrderError(400, "Item %d quantity must be at least 1." % index)
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+        if quantities[product_id] > ORDER_MAX_QUANTITY:
+            raise OrderError(
+                400, "Quantity of product %d is over %d." % (product_id, ORDER_MAX_QUANTITY)
+            )
+    if len(quantities) > ORDER_MAX_ITEMS:
+        raise OrderError(400, "Too many items (max %d)." % ORDER_MAX_ITEMS)
+
+    address = data.get("delivery_address")
+    if not isinstance(address, str) or not address.strip():
+        raise OrderError(400, "delivery_address is required.")
+    payment_method = data.get("payment_method")
+    if payment_method not in PAYMENT_METHODS:
+        raise OrderError(
+            400, "payment_method must be one of: " + ", ".join(PAYMENT_METHODS)
+        )
+
+    return {
+        "items": sorted(quantities.items()),  # مترتبة بالـ id (نفس ترتيب الـ locks في كل الطلبات)
+        "delivery_address": address.strip(),
+        "payment_method": payment_method,
+    }
+
+
+# بصمة الطلب بعد ما اتظبط، عشان نعرف لو نفس الـ Idempotency-Key جه مع طلب مختلف
+def request_hash(order):
+    return hashlib.sha1(
+        json.dumps(order, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# SQL
+
+ORDER_COLUMNS = (
+    "id",
+    "status",
+    "delivery_address",
+    "payment_method",
+    "subtotal",
+    "delivery_fee",
+    "total",
+    "created_at",
+    "updated_at",
+)
+ORDER_ITEM_COLUMNS = ("product_id", "name", "quantity", "unit_price")
+
+GET_ORDER = "SELECT " + ", ".join(ORDER_COLUMNS) + " FROM orders WHERE id = %s;"
+GET_ORDER_ITEMS = (
+    "SELECT " + ", ".join(ORDER_ITEM_COLUMNS) + " FROM order_items WHERE order_id = %s ORDER BY id;"
+)
+FIND_BY_KEY = "SELECT id, request_hash FROM orders WHERE idempotency_key = %s;"
+
+# أسعار كل المنتجات اللي في السلة في query واحدة
+PRICE_ITEMS = "SELECT id, name, price, stock FROM products WHERE id = ANY(%s);"
+
+INSERT_ORDER = (
+    "INSERT INTO orders (idempotency_key, request_hash, delivery_address, payment_method,"
+    " subtotal, delivery_fee, total) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;"
+)
+
+# حجز المخزون لكل المنتجات في UPDATE واحد. الصفوف اللي طلب تاني ماسكها بنعديها (SKIP LOCKED)
+# بدل ما نستناه، والمنتج اللي مخزونه مش مكفي مش بيتعدل، فاللي مرجعش في RETURNING محجزش
+RESERVE_STOCK = (
+    "WITH wanted AS (SELECT * FROM unnest(%s::int[], %s::int[]) AS w (product_id, quantity)),"
+    " locked AS (SELECT p.id FROM products AS p JOIN wanted AS w ON w.product_id = p.id"
+    " WHERE p.stock IS NOT NULL ORDER BY p.id FOR UPDATE OF p SKIP LOCKED)"
+    " UPDATE products AS p SET stock = p.stock - w.quantity, updated_at = CURRENT_TIMESTAMP"
+    " FROM wanted AS w, locked AS l"
+    " WHERE p.id = w.product_id AND p.id = l.id AND p.stock >= w.quantity"
+    " RETURNING p.id;"
+)
+CURRENT_STOCK = "SELECT id, stock FROM products WHERE id = ANY(%s);"
+
+INSERT_ORDER_ITEMS = (
+    "INSERT INTO order_items (order_id, product_id, name, quantity, unit_price) VALUES %s"
+)
+
+
+def get_order(cur, id):
+    execute(cur, GET_ORDER, (id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    order = row_mapper(ORDER_COLUMNS)(row)
+    execute(cur, GET_ORDER_ITEMS, (id,))
+    order["items"] = [row_mapper(ORDER_ITEM_COLUMNS)(item) for item in cur.fetchall()]
+    return order
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# تنفيذ الطلب
+
+
+# لو المفتاح اتستخدم قبل كده: بيرجع الأوردر القديم، أو بيرمي OrderError(422) لو الطلب مختلف
+def _replay(cur, idempotency_key, fingerprint):
+    execute(cur, FIND_BY_KEY, (idempotency_key,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    order_id, stored_hash = row
+    if stored_hash != fingerprint:
+        raise OrderError(
+            422, "Idempotency-Key was already used for a different order."
+        )
+    return get_order(cur, order_id)
+
+
+# حجز المخزون. المنتجات اللي مخزونها مش مكفي بترمي OrderError(409)،
+# واللي فضلت ماسكاها طلبات تانية بعد كل المحاولات بترمي OrderError(409) مع retry_after
+def _reserve(cur, lines):
+    pending = {product_id: quantity for product_id, quantity, _, stock in lines if stock is not None}
+    for attempt in range(RESERVE_ATTEMPTS):
+        if not pending:
+            return
+        ids = sorted(pending)
+        execute(cur, RESERVE_STOCK, (ids, [pending[id] for id in ids]))
+        for (product_id,) in cur.fetchall():
+            del pending[product_id]
+        if not pending:
+            return
+
+        # اللي محجزش: يا إما المخزون مش مكفي، يا إما صفه متقفل من طلب تاني لسه شغال
+        execute(cur, CURRENT_STOCK, (sorted(pending),))
+        short = [
+            {"product_id": product_id, "requested": pending[product_id], "available": stock}
+            for product_id, stock in cur.fetchall()
+            if stock is not None and stock < pending[product_id]
+        ]
+        if short:
+            raise OrderError(409, "Not enough stock.", out_of_stock=short)
+        time.sleep(RESERVE_RETRY_DELAY * (attempt + 1))
+
+    raise OrderError(
+        409,
+        "Some products are being ordered by other customers, please retry.",
+        busy=sorted(pending),
+        retry_after=1,
+    )
+
+
+# بيعمل الأوردر كله في transaction واحدة ويعمل commit (أو rollback لو حصل أي خطأ)
+# بيرجع (الأوردر, created) و created بـ False لو ده إعادة لطلب اتعمل قبل كده بنفس الـ Idempotency-Key
+def place_order(conn, order, idempotency_key=None):
+    fingerprint = request_hash(order)
+    cur = conn.cursor()
+    try:
+        if idempotency_key:
+            existing = _replay(cur, idempotency_key, fingerprint)
+            if existing is not None:
+                conn.rollback()
+                return existing, False
+
+        # التحقق من المنتجات وأسعارها في query واحدة
+        quantities = dict(order["items"])
+        execute(cur, PRICE_ITEMS, (sorted(quantities),))
+        products = {row[0]: row[1:] for row in cur.fetchall()}
+        missing = [product_id for product_id in quantities if product_id not in products]
+        if missing:
+            raise OrderError(422, "Some products do not exist.", missing=missing)
+
+        lines = [
+            (product_id, quantity, products[product_id][1], products[product_id][2])
+            for product_id, quantity in order["items"]
+        ]  # (id, الكمية, السعر, المخزون)
+        subtotal = sum(price * quantity for _, quantity, price, _ in lines)
+        total = subtotal + DELIVERY_FEE
+
+        # صف الأوردر الأول: لو طلب تاني بنفس المفتاح شغال دلوقتي، الـ UNIQUE هيخلينا نستناه
+        try:
+            execute(
+                cur,
+                INSERT_ORDER,
+                (
+                    idempotency_key,
+                    fingerprint,
+                    order["delivery_address"],
+                    order["payment_method"],
+                    subtotal,
+                    DELIVERY_FEE,
+                    total,
+                ),
+            )
+        except psycopg2.errors.UniqueViolation:
+            conn.rollback()
+            existing = _replay(cur, idempotency_key, fingerprint)
+            conn.rollback()
+            if existing is None:
+                raise OrderError(409, "Order is being processed, please retry.", retry_after=1)
+            return existing, False
+        order_id = cur.fetchone()[0]
+
+        _reserve(cur, lines)
+
+        execute_values(
+            cur,
+            INSERT_ORDER_ITEMS,
+            [
+                (order_id, product_id, products[product_id][0], quantity, price)
+                for product_id, quantity, price, _ in lines
+            ],
+        )
+
+        created = get_order(cur, order_id)
+        conn.commit()
+        return created, True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
@@ -0,0 +1,284 @@
+# حماية قاعدة البيانات من client واحد بيضرب الـ API (Rate Limiting) ومن الزحمة نفسها (Load Shedding)
+#
+# - Rate limiting: token bucket لكل client (الـ IP) ولكل budget. كل route ليها budget (البحث أغلى من القراية العادية)
+#   الـ client اللي خلص الـ tokens بتاعته بياخد 429 و Retry-After بالوقت اللي فاضل لحد ما يبقى عنده token
+# - Load shedding: لو وقت انتظار اتصال من الـ pool مؤخراً عدى SHED_MAX_POOL_WAIT أو الطلبات الشغالة عدت SHED_MAX_IN_FLIGHT
+#   بنرفض جزء من الطلبات الجديدة بـ 503 و Retry-After بدل ما كلهم يقفوا في طابور الـ pool (وكل الـ latency تبوظ)
+#   نسبة الرفض بتكبر كل ما الانتظار يزيد (من 0 عند الحد لـ 100% عند ضعفه)، والطلبات والتعديلات بتترفض بعد القراية
+#
+# الحدود دي لكل worker (process) زي الكاش والمقاييس: مع N workers الـ client يقدر ياخد لحد N مرة لو طلباته اتوزعت عليهم
+# /metrics و /worker/stats مش بيتحسبوا عشان المراقبة تفضل شغالة وقت الزحمة، ولا ملفات الصور في /images/
+
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from flask import jsonify, request
+
+import metrics
+import serialization
+import workers
+
+RATE_LIMIT = os.environ.get("RATE_LIMIT", "1") not in ("0", "false")
+
+# budget -> (tokens في الثانية, أقصى عدد tokens = أكبر دفعة طلبات ورا بعض)
+# تقدر تغير أي واحد منهم: RATE_LIMITS="read=50:100,search=10:20"
+BUDGETS = {
+    "read": (20, 40),
+    "search": (5, 10),  # LIKE / similarity أغلى بكتير من القراية بالـ id أو الـ cursor
+    "write": (5, 10),
+    "orders": (1, 5),
+    "bulk": (0.1, 2),  # الـ import بيكتب آلاف الصفوف في الطلب الواحد
+    # /products/<id>/images/<rendition>: query صغيرة بالـ id، وصفحة كتالوج واحدة فيها عشرات الصور
+    "images": (100, 200),
+}
+
+# الـ routes اللي مش بتاخد الـ budget العادي بتاعها (read للـ GET و write للباقي)
+ROUTE_BUDGETS = {
+    ("GET", "/products/search"): "search",
+    ("POST", "/products/batch"): "read",  # POST بس بيقرا
+    ("POST", "/products/bulk"): "bulk",
+    ("POST", "/orders"): "orders",
+}
+EXEMPT_PATHS = {"/metrics", "/worker/stats"}
+# ملفات النسخ المصغرة (images.py) مش بتلمس قاعدة البيانات خالص
+EXEMPT_PREFIXES = ("/images/",)
+RENDITION_PATH = re.compile(r"^/(products|categories)/\d+/images/[^/]+$")
+
+# ورا كام proxy (nginx / load balancer) السيرفر شغال. 0 = الـ IP بتاع الاتصال نفسه
+# لو فيه proxy لازم يتحدد، وإلا كل الطلبات هتبان جاية من الـ proxy
+TRUSTED_PROXIES = int(os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+MAX_CLIENTS = 10000  # عدد الـ buckets اللي بنفتكرها (الـ clients اللي بقالهم فترة مطلبوش حاجة بيتمسحوا)
+
+SHED_MAX_POOL_WAIT = float(os.environ.get("SHED_MAX_POOL_WAIT", "0.1"))  # بالثواني، 0 يقفله
+SHED_MAX_IN_FLIGHT = int(os.environ.get("SHED_MAX_IN_FLIGHT", "100"))  # لكل worker، 0 يقفله
+SHED_RETRY_AFTER = int(os.environ.get("SHED_RETRY_AFTER", "1"))
+# الـ budgets دي بتترفض لما الانتظار يوصل لضعف الحد بس (الأوردر أهم من إن الكتالوج يفتح أسرع)
+SHED_LATE_BUDGETS = {"orders", "write"}
+# ودي مش بتترفض خالص: رفض صورة مش هيخفف عن الـ pool حاجة تذكر والشاشة هتبان بايظة
+SHED_EXEMPT_BUDGETS = {"images"}
+
+
+def parse_budgets(text, budgets=BUDGETS):
+    result = dict(budgets)
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        rate, _, burst = value.partition(":")
+        result[name.strip()] = (float(rate), float(burst or rate))
+    return result
+
+
+def route_budget(method, path):
+    budget = ROUTE_BUDGETS.get((method, path))
+    if budget is not None:
+        return budget
+    if method in ("GET", "HEAD") and RENDITION_PATH.match(path):
+        return "images"
+    return "read" if method in ("GET", "HEAD") else "write"
+
+
+# الـ IP بتاع الـ client. ورا TRUSTED_PROXIES proxies بناخده من X-Forwarded-For
+# من اليمين (اللي حطه الـ proxy بتاعنا) مش من الشمال (اللي الـ client يقدر يكتب فيه أي حاجة)
+def client_key(remote_addr, forwarded_for=None):
+    if TRUSTED_PROXIES and forwarded_for:
+        addresses = [address.strip() for address in forwarded_for.split(",") if address.strip()]
+        if addresses:
+            return addresses[-min(TRUSTED_PROXIES, len(addresses))]
+    return remote_addr or "unknown"
+
+
+class TokenBucketLimiter:
+    def __init__(self, budgets, max_clients=MAX_CLIENTS):
+        self.budgets = budgets
+        self.max_clients = max_clients
+        self.rejected = 0
+        self._buckets = {}  # (budget, client) -> [tokens, آخر تحديث]
+        self._lock = threading.Lock()
+
+    # بيرجع 0 لو الطلب يعدي، أو عدد الثواني لحد ما الـ client يبقى عنده token
+    def acquire(self, client, budget):
+        rate, burst = self.budgets[budget]
+        if rate <= 0:  # budget مقفول
+            return 0
+        key = (budget, client)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._prune(now)
+                bucket = self._buckets[key] = [burst, now]
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            self.rejected += 1
+            return (1 - bucket[0]) / rate
+
+    # الـ bucket اللي اتملى تاني زيه زي اللي مش موجود، فمسحه مش بيغير حاجة
+    def _prune(self, now):
+        for key, (tokens, updated) in list(self._buckets.items()):
+            rate, burst = self.budgets[key[0]]
+            if tokens + (now - updated) * rate >= burst:
+                del self._buckets[key]
+        if len(self._buckets) >= self.max_clients:  # كلهم شغالين: مفيش غير إننا نبدأ من الأول
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"clients": len(self._buckets), "rejected": self.rejected}
+
+
+class LoadShedder:
+    def __init__(self, max_pool_wait, max_in_flight, retry_after):
+        self.max_pool_wait = max_pool_wait
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.shed = {"pool_wait": 0, "in_flight": 0}
+        self._lock = threading.Lock()
+
+    # بيرجع السبب لو الطلب لازم يترفض (None لو يعدي). in_flight شامل الطلب ده نفسه
+    def check(self, in_flight, budget):
+        reason = None
+        if self.max_in_flight and in_flight > self.max_in_flight:
+            reason = "in_flight"
+        elif self.max_pool_wait:
+            threshold = self.max_pool_wait * (2 if budget in SHED_LATE_BUDGETS else 1)
+            wait = metrics.RECENT_POOL_WAIT.value()
+            # الرفض بنسبة مش كله مرة واحدة: الطلبات اللي بتعدي بتقيس الانتظار تاني، فلما الزحمة تخف بنرجع نقبل
+            if wait > threshold and random.random() < (wait - threshold) / threshold:
+                reason = "pool_wait"
+        if reason is not None:
+            with self._lock:
+                self.shed[reason] += 1
+        return reason
+
+    # الـ clients كلهم ميرجعوش في نفس الثانية
+    def retry_after_seconds(self):
+        return random.randint(self.retry_after, 2 * self.retry_after)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.shed)
+
+
+limiter = TokenBucketLimiter(parse_budgets(os.environ.get("RATE_LIMITS")))
+shedder = LoadShedder(SHED_MAX_POOL_WAIT, SHED_MAX_IN_FLIGHT, SHED_RETRY_AFTER)
+
+
+# بيرجع None لو الطلب يعدي، أو (status, body, Retry-After) للرفض
+def check_request(method, path, client, in_flight):
+    if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return None
+    budget = route_budget(method, path)
+    if RATE_LIMIT:
+        wait = limiter.acquire(client, budget)
+        if wait:
+            rate, burst = limiter.budgets[budget]
+            return (
+                429,
+                {
+                    "message": "Too many requests.",
+                    "error": "Rate limit for %s requests is %g/s (burst %g)." % (budget, rate, burst),
+                },
+                max(1, math.ceil(wait)),
+            )
+    reason = shedder.check(in_flight, budget) if budget not in SHED_EXEMPT_BUDGETS else None
+    if reason is not None:
+        return (
+            503,
+            {"message": "Server is busy, try again later.", "error": "Load shedding (%s)." % reason},
+            shedder.retry_after_seconds(),
+        )
+    return None
+
+
+# للـ /metrics في app.py و asgi.py
+def gauges():
+    limited = limiter.stats()
+    shed = shedder.stats()
+    return [
+        ("ratelimit_rejected_requests", "Requests rejected with 429 by this worker.", limited["rejected"]),
+        ("ratelimit_clients", "Clients with an active rate limit bucket.", limited["clients"]),
+        ("shed_requests_pool_wait", "Requests rejected with 503 because the pool was slow.", shed["pool_wait"]),
+        ("shed_requests_in_flight", "Requests rejected with 503 because too many were in flight.", shed["in_flight"]),
+        ("db_pool_wait_recent_seconds", "Recent average wait for a pooled connection.", metrics.RECENT_POOL_WAIT.value()),
+    ]
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# Flask
+
+
+# لازم يتنادى بعد workers.init_app و metrics.init_app عشان الطلب المرفوض يتعد وياخد مقاييسه
+def init_app(app):
+    @app.before_request
+    def _limit():
+        rejected = check_request(
+            request.method,
+            request.path,
+            client_key(request.remote_addr, request.headers.get("X-Forwarded-For")),
+            workers.counters.in_flight,
+        )
+        if rejected is None:
+            return None
+        status, body, retry_after = rejected
+        return jsonify(body), status, {"Retry-After": str(retry_after)}
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# ASGI (Starlette)
+
+
+def _get_header(headers, name):
+    for key, value in headers:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class ASGIRateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0  # الـ event loop thread واحد، فمش محتاج lock
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            client = scope.get("client")
+            rejected = check_request(
+                scope["method"],
+                scope["path"],
+                client_key(client[0] if client else None, _get_header(scope["headers"], b"x-forwarded-for")),
+                self.in_flight,
+            )
+            if rejected is None:
+                await self.app(scope, receive, send)
+                return
+            status, body, retry_after = rejected
+            data = serialization.dumps(body)
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": status,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(data)).encode()),
+                        (b"retry-after", str(retry_after).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": data})
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,510 @@
+import datetime
+import hashlib
+import os
+from functools import lru_cache
+
+# طبقة الوصول للبيانات: كل الـ SQL بتاع المنتجات والتصنيفات في مكان واحد بأسماء أعمدة صريحة
+# (مش SELECT *)، وتحويل الصفوف لديكشنري بيتعمل بـ mapper جاهز لكل مجموعة أعمدة
+
+# أعمدة جدول products بالترتيب (ودي برضه الأعمدة المسموح للـ client يطلبها في ?fields=)
+PRODUCT_COLUMNS = (
+    "id",
+    "name",
+    "description",
+    "price",
+    "image_url",
+    "category_id",
+    "stock",
+    "images",
+    "created_at",
+    "updated_at",
+)
+# أعمدة جدول categories بالترتيب
+CATEGORY_COLUMNS = (
+    "id",
+    "name",
+    "description",
+    "image_url",
+    "images",
+    "created_at",
+    "updated_at",
+)
+
+PRODUCTS_DEFAULT_LIMIT = 50  # عدد المنتجات في الصفحة لو الـ client مبعتش limit
+PRODUCTS_MAX_LIMIT = 200  # أقصى عدد منتجات في الصفحة الواحدة
+
+# الـ prepared statements بتتعمل مرة واحدة لكل اتصال وبعدها PostgreSQL مش بيعمل parse/plan تاني
+# اقفلها (DB_PREPARED_STATEMENTS=0) لو قدام قاعدة البيانات pgbouncer في وضع transaction pooling
+USE_PREPARED = os.environ.get("DB_PREPARED_STATEMENTS", "1") not in ("0", "false")
+MAX_PREPARED_PER_CONNECTION = 100  # عشان الـ queries اللي شكلها بيتغير (فلاتر/أعمدة) متملاش ذاكرة السيرفر
+
+
+def numbered(query):
+    # PREPARE (و asyncpg) بيستخدموا $1, $2 بدل %s بتاعة psycopg2، و % عادية بدل %% (زي operator الـ pg_trgm)
+    parts = [part.replace("%%", "%") for part in query.split("%s")]
+    result = parts[0]
+    for index, part in enumerate(parts[1:], start=1):
+        result += "$%d" % index + part
+    return result
+
+
+# تنفيذ query كـ prepared statement (اسمها من hash الـ SQL نفسه، فنفس الـ query بتستخدم نفس الـ plan)
+# الاتصالات اللي جاية من db.py بتفتكر هي اتعملها PREPARE على إيه في conn.prepared
+def execute(cur, query, params=()):
+    prepared = getattr(cur.connection, "prepared", None)
+    if (
+        not USE_PREPARED
+        or prepared is None
+        or (len(prepared) >= MAX_PREPARED_PER_CONNECTION and query not in prepared)
+    ):
+        cur.execute(query, params)
+        return
+    name = _statement_name(query)
+    if query not in prepared:
+        cur.execute("PREPARE " + name + " AS " + numbered(query.rstrip(";")))
+        prepared.add(query)
+    if params:
+        cur.execute(
+            "EXECUTE " + name + " (" + ", ".join(["%s"] * len(params)) + ");", params
+        )
+    else:
+        cur.execute("EXECUTE " + name + ";")
+
+
+@lru_cache(maxsize=1024)
+def _statement_name(query):
+    return "stmt_" + hashlib.sha1(query.encode()).hexdigest()[:16]
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# تحويل الصفوف لديكشنري
+
+
+# بيرجع function بتحول tuple (بنفس ترتيب columns) لديكشنري، ومتخزنة لكل مجموعة أعمدة
+# القيم بتفضل زي ما هي (Decimal و datetime) و serialization.dumps هو اللي بيحولها وقت كتابة الـ JSON
+# output: الأعمدة اللي تطلع في الديكشنري (لو الـ SELECT فيه عمود زيادة زي id عشان الـ cursor)
+@lru_cache(maxsize=512)
+def row_mapper(columns, output=None):
+    if output is None or set(output) >= set(columns):
+
+        def to_dict(row):
+            return dict(zip(columns, row))
+
+        return to_dict
+
+    output = set(output)
+    indexed = [(index, column) for index, column in enumerate(columns) if column in output]
+
+    def to_dict(row):
+        return {column: row[index] for index, column in indexed}
+
+    return to_dict
+
+
+def _select(columns, table):
+    return "SELECT " + ", ".join(columns) + " FROM " + table
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# المنتجات
+
+
+# قراءة الفلاتر من الـ query string وتحويلها لشروط SQL (WHERE) مع الـ parameters بتاعتها
+# بترمي ValueError لو فيه parameter غلط
+def parse_product_filters(args):
+    conditions = []
+    params = []
+
+    category_id = args.get("category_id")
+    if category_id is not None:
+        conditions.append("category_id = %s")
+        params.append(int(category_id))
+
+    min_price = args.get("min_price")
+    if min_price is not None:
+        conditions.append("price >= %s")
+        params.append(float(min_price))
+
+    max_price = args.get("max_price")
+    if max_price is not None:
+        conditions.append("price <= %s")
+        params.append(float(max_price))
+
+    return conditions, params
+
+
+# قراءة ?fields=id,name,price وإرجاع الأعمدة المطلوبة بنفس ترتيب الجدول
+def parse_product_fields(args):
+    fields = args.get("fields")
+    if not fields:
+        return list(PRODUCT_COLUMNS)
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(PRODUCT_COLUMNS)
+    if unknown:
+        raise ValueError("Unknown fields: " + ", ".join(sorted(unknown)))
+    return [column for column in PRODUCT_COLUMNS if column in requested]
+
+
+# SELECT المنتجات بالفلاتر مترتبة بالـ id (limit اختياري)
+def products_query(columns, conditions, limit=False):
+    query = _select(columns, "products")
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id"
+    if limit:
+        query += " LIMIT %s"
+    return query
+
+
+# صفحة منتجات بالـ keyset. بترجع (قائمة الديكشنريز, الـ cursor بتاع الصفحة الجاية أو None)
+def list_products(cur, columns, conditions, params, limit):
+    # الـ id لازم يكون موجود في الـ SELECT عشان نحسب الـ cursor حتى لو الـ client مطلبهوش
+    select_columns = tuple(columns) if "id" in columns else ("id",) + tuple(columns)
+    execute(
+        cur,
+        products_query(select_columns, conditions, limit=True) + ";",
+        list(params) + [limit + 1],  # بنجيب صف زيادة عشان نعرف فيه صفحة بعدها ولا لأ
+    )
+    rows = cur.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][select_columns.index("id")]
+
+    to_dict = row_mapper(select_columns, tuple(columns))
+    return [to_dict(row) for row in rows], next_cursor
+
+
+GET_PRODUCT = _select(PRODUCT_COLUMNS, "products") + " WHERE id = %s;"
+CATEGORY_EXISTS = "SELECT id FROM categories WHERE id = %s;"
+INSERT_PRODUCT = "INSERT INTO products (name, description, price, image_url, category_id) VALUES (%s, %s, %s, %s, %s) RETURNING id;"
+UPDATE_PRODUCT = "UPDATE products SET name = %s, description = %s, price = %s, image_url = %s, category_id = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s;"
+DELETE_PRODUCT = "DELETE FROM products WHERE id = %s;"
+
+
+def get_product(cur, id):
+    execute(cur, GET_PRODUCT, (id,))
+    row = cur.fetchone()
+    return row_mapper(PRODUCT_COLUMNS)(row) if row else None
+
+
+PRODUCTS_MAX_IDS = 1000  # أقصى عدد ids في طلب واحد (GET /products?ids= أو POST /products/batch)
+
+
+# قراءة ids من "1,2,3" (الـ query string) أو list (الـ JSON body). بترجع list من غير تكرار وبنفس الترتيب
+# بترمي ValueError لو فيه id غلط أو العدد أكتر من max_ids
+def parse_product_ids(value, max_ids=PRODUCTS_MAX_IDS):
+    if isinstance(value, str):
+        value = [item for item in value.split(",") if item.strip()]
+    if not isinstance(value, list) or not value:
+        raise ValueError("ids must be a non-empty list of product ids.")
+    ids = list(dict.fromkeys(int(item) for item in value))
+    if len(ids) > max_ids:
+        raise ValueError("Too many ids (max %d)." % max_ids)
+    return ids
+
+
+def products_by_ids_query(select_columns):
+    return _select(select_columns, "products") + " WHERE id = ANY(%s);"
+
+
+# كل المنتجات المطلوبة في query واحدة. بترجع {id: ديكشنري} للي لقيناه بس (الترتيب بيعمله الـ caller)
+def get_products_by_ids(cur, ids, columns=PRODUCT_COLUMNS):
+    select_columns = tuple(columns) if "id" in columns else ("id",) + tuple(columns)
+    execute(cur, products_by_ids_query(select_columns), (list(ids),))
+    to_dict = row_mapper(select_columns, tuple(columns))
+    index = select_columns.index("id")
+    return {row[index]: to_dict(row) for row in cur.fetchall()}
+
+
+def category_exists(cur, category_id):
+    execute(cur, CATEGORY_EXISTS, (category_id,))
+    return cur.fetchone() is not None
+
+
+# بترجع الـ id بتاع المنتج الجديد
+def insert_product(cur, name, description, price, image_url, category_id):
+    execute(cur, INSERT_PRODUCT, (name, description, price, image_url, category_id))
+    return cur.fetchone()[0]
+
+
+# بترجع عدد الصفوف اللي اتعدلت (0 لو المنتج مش موجود)
+def update_product(cur, id, name, description, price, image_url, category_id):
+    execute(cur, UPDATE_PRODUCT, (name, description, price, image_url, category_id, id))
+    return cur.rowcount
+
+
+def delete_product(cur, id):
+    execute(cur, DELETE_PRODUCT, (id,))
+    return cur.rowcount
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# التصنيفات
+
+LIST_CATEGORIES = _select(CATEGORY_COLUMNS, "categories") + " ORDER BY id"
+GET_CATEGORY = _select(CATEGORY_COLUMNS, "categories") + " WHERE id = %s;"
+INSERT_CATEGORY = "INSERT INTO categories (name, description, image_url) VALUES (%s, %s, %s) RETURNING id;"
+UPDATE_CATEGORY = "UPDATE categories SET name = %s, description = %s, image_url = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s;"
+DELETE_CATEGORY = "DELETE FROM categories WHERE id = %s;"
+
+
+CATEGORY_TOP_DEFAULT = 3  # عدد المنتجات في top_products لو الـ client كتب top من غير رقم
+CATEGORY_TOP_MAX = 20
+
+
+# قراءة ?include=counts,top=3 (أو ?include=counts&top=3). بترجع (counts, top)
+# بترمي ValueError لو فيه parameter غلط
+def parse_category_include(args):
+    counts = False
+    top = 0
+    for item in (args.get("include") or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.partition("=")
+        if name == "counts" and not value:
+            counts = True
+        elif name == "top":
+            top = int(value) if value else CATEGORY_TOP_DEFAULT
+        else:
+            raise ValueError("Unknown include: " + item)
+    if args.get("top") is not None:
+        top = int(args.get("top"))
+    if top < 0 or top > CATEGORY_TOP_MAX:
+        raise ValueError("top must be between 0 and %d." % CATEGORY_TOP_MAX)
+    return counts, top
+
+
+# الأعمدة اللي بترجع لكل تصنيف حسب الـ include
+def category_columns(counts, top):
+    columns = CATEGORY_COLUMNS
+    if counts:
+        columns += ("product_count",)
+    if top:
+        columns += ("top_products",)
+    return columns
+
+
+# كل التصنيفات في query واحدة، ومعاها (حسب الطلب) عدد المنتجات وأحدث top منتج في كل تصنيف
+# العدد بيتحسب بـ GROUP BY واحد على products، والـ top بـ LATERAL بيستخدم index الـ (category_id, id)
+# بترجع (query, params)
+def categories_query(counts=False, top=0):
+    if not counts and not top:
+        return LIST_CATEGORIES, ()
+    select = ["c." + column for column in CATEGORY_COLUMNS]
+    joins = []
+    params = []
+    if counts:
+        select.append("coalesce(counts.product_count, 0) AS product_count")
+        joins.append(
+            " LEFT JOIN (SELECT category_id, count(*) AS product_count FROM products"
+            " GROUP BY category_id) AS counts ON counts.category_id = c.id"
+        )
+    if top:
+        select.append("coalesce(top.products, '[]'::json) AS top_products")
+        joins.append(
+            " LEFT JOIN LATERAL (SELECT json_agg(json_build_object("
+            "'id', p.id, 'name', p.name, 'price', p.price, 'image_url', p.image_url,"
+            " 'images', p.images) ORDER BY p.id DESC) AS products"
+            " FROM (SELECT id, name, price, image_url, images"
+            " FROM products WHERE category_id = c.id ORDER BY id DESC LIMIT %s) AS p) AS top ON true"
+        )
+        params.append(top)
+    query = "SELECT " + ", ".join(select) + " FROM categories AS c" + "".join(joins)
+    return query + " ORDER BY c.id", tuple(params)
+
+
+def list_categories(cur, counts=False, top=0):
+    query, params = categories_query(counts, top)
+    execute(cur, query + ";", params)
+    to_dict = row_mapper(category_columns(counts, top))
+    return [to_dict(row) for row in cur.fetchall()]
+
+
+def get_category(cur, id):
+    execute(cur, GET_CATEGORY, (id,))
+    row = cur.fetchone()
+    return row_mapper(CATEGORY_COLUMNS)(row) if row else None
+
+
+def insert_category(cur, name, description, image_url):
+    execute(cur, INSERT_CATEGORY, (name, description, image_url))
+    return cur.fetchone()[0]
+
+
+def update_category(cur, id, name, description, image_url):
+    execute(cur, UPDATE_CATEGORY, (name, description, image_url, id))
+    return cur.rowcount
+
+
+def delete_category(cur, id):
+    execute(cur, DELETE_CATEGORY, (id,))
+    return cur.rowcount
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# البحث (search_vector و الـ indexes بتوعه في migrations/0003_product_search.sql)
+
+SEARCH_MAX_LENGTH = 200  # أقصى طول لكلام البحث
+SEARCH_MAX_OFFSET = 1000  # الترتيب بالـ rank محتاج كل النتايج، فمش بنسمح بصفحات أبعد من كده
+
+HAS_TRIGRAM = "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm');"
+_has_trigram = None
+
+
+# هل pg_trgm متسطب؟ (بنسأل مرة واحدة بس لكل process). من غيره البحث بيبقى full-text بس من غير تحمل الأخطاء
+def has_trigram(cur):
+    global _has_trigram
+    if _has_trigram is None:
+        execute(cur, HAS_TRIGRAM)
+        _has_trigram = cur.fetchone()[0]
+    return _has_trigram
+
+
+# SELECT المنتجات اللي بتطابق البحث مترتبة بالأقرب. الـ parameters بالترتيب:
+# كلام البحث مرتين (عربي وإنجليزي)، [مرة للـ trigram]، parameters الفلاتر، [مرة لترتيب الـ trigram]، limit، offset
+def search_query(columns, conditions, fuzzy):
+    match = "search_vector @@ search.query"
+    rank = "ts_rank_cd(search_vector, search.query)"
+    if fuzzy:
+        # word_similarity بتقارن الكلام بأقرب جزء في الاسم، فـ "كنافه" تلاقي "كنافة بالقشطة"
+        match = "(" + match + " OR %s <%% name)"
+        rank += " + word_similarity(%s, name)"
+    return (
+        _select(columns, "products")
+        + ", (SELECT websearch_to_tsquery('arabic', %s) || websearch_to_tsquery('english', %s) AS query) AS search"
+        + " WHERE "
+        + " AND ".join([match] + list(conditions))
+        + " ORDER BY "
+        + rank
+        + " DESC, id LIMIT %s OFFSET %s"
+    )
+
+
+def search_params(text, params, fuzzy, limit, offset):
+    if fuzzy:
+        return [text, text, text] + list(params) + [text, limit, offset]
+    return [text, text] + list(params) + [limit, offset]
+
+
+# قراءة ?q= و ?cursor= بتاعة البحث (الـ cursor هنا offset لأن الترتيب بالـ rank مش بالـ id)
+# بترمي ValueError لو فيه parameter غلط
+def parse_search_args(args):
+    text = (args.get("q") or "").strip()
+    if not text:
+        raise ValueError("q is required.")
+    if len(text) > SEARCH_MAX_LENGTH:
+        raise ValueError("q is too long (max %d characters)." % SEARCH_MAX_LENGTH)
+    offset = int(args.get("cursor", 0))
+    if offset < 0 or offset > SEARCH_MAX_OFFSET:
+        raise ValueError("cursor must be between 0 and %d." % SEARCH_MAX_OFFSET)
+    return text, offset
+
+
+# صفحة من نتايج البحث. بترجع (قائمة الديكشنريز, الـ offset بتاع الصفحة الجاية أو None)
+def search_products(cur, text, columns, conditions, params, limit, offset):
+    fuzzy = has_trigram(cur)
+    execute(
+        cur,
+        search_query(columns, conditions, fuzzy) + ";",
+        search_params(text, params, fuzzy, limit + 1, offset),
+    )
+    rows = cur.fetchall()
+
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+
+    to_dict = row_mapper(tuple(columns))
+    return [to_dict(row) for row in rows], next_offset
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------
+# GET /changes: التغييرات من آخر sync (الـ tombstones والـ indexes في migrations/0006_change_feed.sql)
+#
+# الـ cursor وقت (من غير timezone زي updated_at). الرد فيه كل اللي اتغير من الوقت ده لحد "وقت آمن"
+# هو الـ cursor الجاي: ثانية قبل دلوقتي وقبل بداية أي transaction لسه شغالة، لأن updated_at = CURRENT_TIMESTAMP
+# هو وقت بداية الـ transaction مش وقت الـ commit، فالصفوف بتاعتها ممكن تبان بعد ما الـ cursor يعدي وقتها
+# الصفوف اللي قريبة من الـ cursor ممكن تيجي مرتين، والـ client بيحطها بالـ id فمش مشكلة
+
+CHANGES_RETENTION = datetime.timedelta(days=30)  # نفس المدة اللي الـ tombstones بتتمسح بعدها (migrations/0006)
+CHANGES_MAX_ROWS = int(os.environ.get("CHANGES_MAX_ROWS", "500"))  # أكتر من كده في جدول: الـ client يحمل الجدول كله
+CHANGES_OVERLAP = 1  # بالثواني
+CHANGES_MAX_TRANSACTION = 300  # transaction مفتوحة أكتر من كده (idle in transaction مثلاً) مش بتأخر الـ cursor
+
+# (الوقت الآمن, دلوقتي). pg_stat_activity بيبين transactions الـ user بتاعنا بس، وده كفاية لأن الـ app كله بيستخدم نفس الـ user
+CHANGES_CURSOR = (
+    "SELECT least("
+    "now() - make_interval(secs => %s),"
+    " greatest("
+    "(SELECT min(xact_start) FROM pg_stat_activity"
+    " WHERE datname = current_database() AND backend_type = 'client backend'),"
+    " now() - make_interval(secs => %s))"
+    ")::timestamp, now()::timestamp;"
+)
+
+DELETED_ROWS = {
+    table: "SELECT d.row_id FROM deleted_rows d WHERE d.table_name = '" + table + "'"
+    " AND d.deleted_at >= %s AND NOT EXISTS (SELECT 1 FROM " + table + " t WHERE t.id = d.row_id)"
+    " ORDER BY d.row_id LIMIT %s;"
+    for table in ("products", "categories")
+}
+
+
+def changed_rows_query(table, columns):
+    return (
+        _select(columns, table)
+        + " WHERE coalesce(updated_at, created_at) >= %s"
+        " ORDER BY coalesce(updated_at, created_at), id LIMIT %s;"
+    )
+
+
+# ?since= (الـ cursor اللي رجع في آخر رد). None لو مش موجود
+# بترمي ValueError لو مش cursor بتاعنا
+def parse_changes_since(args):
+    since = args.get("since")
+    if not since:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(since)
+    except ValueError:
+        raise ValueError("since must be a cursor returned by GET /changes.")
+
+
+# الأعمدة بتاعة ?fields= والـ id دايماً أولهم (الـ client بيحدّث بيه)
+def changes_product_columns(args):
+    columns = parse_product_fields(args)
+    return ["id"] + [column for column in columns if column != "id"]
+
+
+# من غير since أو لو الـ cursor أقدم من الـ tombstones اللي عندنا: الـ client لازم يحمل كل حاجة من الأول
+def changes_expired(since, now):
+    return since is None or since < now - CHANGES_RETENTION
+
+
+# جزء جدول واحد في الرد: الصفوف arrays بترتيب columns (من غير ما أسماء الأعمدة تتكرر في كل صف)
+# أو {"reset": true} لو التغييرات كتير والأسهل يحمل الجدول كله
+def changes_section(columns, rows, deleted):
+    if len(rows) > CHANGES_MAX_ROWS or len(deleted) > CHANGES_MAX_ROWS:
+        return {"reset": True}
+    return {"columns": list(columns), "rows": [list(row) for row in rows], "deleted": deleted}
+
+
+def get_changes(cur, since, product_columns):
+    execute(cur, CHANGES_CURSOR, (CHANGES_OVERLAP, CHANGES_MAX_TRANSACTION))
+    cursor, now = cur.fetchone()
+    result = {"cursor": cursor.isoformat()}
+    expired = changes_expired(since, now)
+    for table, columns in (("products", product_columns), ("categories", CATEGORY_COLUMNS)):
+        if expired:
+            result[table] = {"reset": True}
+            continue
+        execute(cur, changed_rows_query(table, columns), (since, CHANGES_MAX_ROWS + 1))
+        rows = cur.fetchall()
+        execute(cur, DELETED_ROWS[table], (since, CHANGES_MAX_ROWS + 1))
+        deleted = [row[0] for row in cur.fetchall()]
+        result[table] = changes_section(columns, rows, deleted)
+    return result
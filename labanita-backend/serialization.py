@@ -0,0 +1,59 @@
+import datetime
+import json
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider
+
+# تحويل الردود لـ JSON بشكل واحد في app.py و asgi.py والـ streaming:
+# من غير مسافات والـ keys مترتبة، والـ Decimal (السعر) بيطلع رقم والتواريخ بصيغة ISO
+# الصفوف بتتحول لديكشنري زي ما جاية من قاعدة البيانات والتحويل بيحصل هنا وقت الكتابة بس
+#
+# لو orjson متسطب (pip install orjson) بنستخدمه لأنه أسرع بكتير من json العادي، ولو مش متسطب بنرجع لـ json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    # orjson بيكتب الـ datetime بنفسه (بنفس شكل isoformat) وبينادي _default للـ Decimal بس
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    loads = orjson.loads
+
+else:
+
+    def dumps(obj):
+        return json.dumps(
+            obj, default=_default, separators=(",", ":"), sort_keys=True, ensure_ascii=False
+        ).encode()
+
+    loads = json.loads
+
+
+# بيخلي jsonify و request.get_json في Flask يستخدموا نفس الـ encoder
+# (ومن غير الـ indent اللي Flask بيحطه في الـ debug mode)
+class FastJSONProvider(JSONProvider):
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
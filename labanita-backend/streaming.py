@@ -0,0 +1,69 @@
+import os
+
+from flask import Response, stream_with_context
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from db import detach_db_connection, return_db_connection
+from serialization import dumps  # نفس شكل jsonify عشان الرد يبقى زي الوضع العادي بالظبط
+
+JSON_MIMETYPE = "application/json"
+NDJSON_MIMETYPE = "application/x-ndjson"  # سطر JSON لكل صف
+
+STREAM_BATCH_SIZE = int(
+    os.environ.get("STREAM_BATCH_SIZE", "500")
+)  # عدد الصفوف اللي بنجيبها من قاعدة البيانات في المرة الواحدة
+
+
+# الـ client بيطلب الـ NDJSON عن طريق الـ Accept header
+def accepts_ndjson(accept_header):
+    accept = parse_accept_header(accept_header, MIMEAccept)
+    return accept.best_match([JSON_MIMETYPE, NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def wants_ndjson(request):
+    return accepts_ndjson(request.headers.get("Accept"))
+
+
+# الـ streaming بيشتغل لو الـ client بعت ?stream=1 أو طلب NDJSON
+def wants_stream(request):
+    return request.args.get("stream") in ("1", "true") or wants_ndjson(request)
+
+
+# بيرجع Response بيبعت الصفوف على دفعات من server-side (named) cursor
+# الذاكرة بتفضل ثابتة مهما كان حجم الجدول، والـ client بيبدأ يستلم من أول دفعة
+def stream_query(conn, name, query, params, row_to_dict, ndjson=False):
+    cur = conn.cursor(name=name)  # named cursor = الصفوف بتفضل على السيرفر لحد ما نطلبها
+    cur.itersize = STREAM_BATCH_SIZE
+    # بننفذ الـ query هنا (قبل ما الرد يبدأ) عشان لو فيه خطأ يرجع 500 عادي
+    cur.execute(query, params)
+
+    def generate():
+        try:
+            if not ndjson:
+                yield b"["
+            first = True
+            while True:
+                rows = cur.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                if ndjson:
+                    yield b"".join(dumps(row_to_dict(row)) + b"\n" for row in rows)
+                else:
+                    chunk = b",".join(dumps(row_to_dict(row)) for row in rows)
+                    yield chunk if first else b"," + chunk
+                first = False
+            if not ndjson:
+                yield b"]"
+        finally:
+            cur.close()
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype=NDJSON_MIMETYPE if ndjson else JSON_MIMETYPE,
+    )
+    # الـ teardown بيشتغل أول ما الـ view يرجع، قبل ما الدفعات تتبعت،
+    # فبناخد الاتصال من الـ request ونرجعه للـ Pool لما السيرفر يقفل الرد (حتى لو الـ client قطع)
+    detach_db_connection(conn)
+    response.call_on_close(lambda: return_db_connection(conn))
+    return response
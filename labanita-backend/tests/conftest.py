@@ -0,0 +1,5 @@
+import os
+import sys
+
+# الموديولات في labanita-backend نفسه (زي ما app.py بيعمل import db و images)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
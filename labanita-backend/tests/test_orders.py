@@ -0,0 +1,72 @@
+import pytest
+
+from orders import ORDER_MAX_ITEMS, ORDER_MAX_QUANTITY, OrderError, parse_order
+
+
+def _order(**fields):
+    order = {
+        "items": [{"product_id": 1, "quantity": 2}],
+        "delivery_address": "12 Tahrir St",
+        "payment_method": "card",
+    }
+    order.update(fields)
+    return order
+
+
+def test_parse_order():
+    assert parse_order(_order(delivery_address="  12 Tahrir St \n")) == {
+        "items": [(1, 2)],
+        "delivery_address": "12 Tahrir St",
+        "payment_method": "card",
+    }
+
+
+# نفس المنتج بيتجمع والـ items بتترتب بالـ id (ترتيب الـ locks)
+def test_parse_order_merges_and_sorts_items():
+    items = [
+        {"product_id": 7, "quantity": 1},
+        {"product_id": "3", "quantity": "2"},
+        {"product_id": 7, "quantity": 4},
+    ]
+    assert parse_order(_order(items=items))["items"] == [(3, 2), (7, 5)]
+
+
+@pytest.mark.parametrize(
+    "data, message",
+    [
+        ([], "JSON object"),
+        (None, "JSON object"),
+        (_order(items=[]), "non-empty list"),
+        (_order(items={"product_id": 1}), "non-empty list"),
+        (_order(items=None), "non-empty list"),
+        (_order(items=[{"product_id": 1}]), "Item 1 needs"),
+        (_order(items=[{"product_id": "x", "quantity": 1}]), "Item 1 needs"),
+        (_order(items=[{"product_id": 1, "quantity": 1}, 5]), "Item 2 needs"),
+        (_order(items=[{"product_id": 1, "quantity": 0}]), "at least 1"),
+        (_order(items=[{"product_id": 1, "quantity": -3}]), "at least 1"),
+        (_order(delivery_address="   "), "delivery_address"),
+        (_order(delivery_address=None), "delivery_address"),
+        (_order(delivery_address=["street"]), "delivery_address"),
+        (_order(payment_method="bitcoin"), "payment_method"),
+        (_order(payment_method=None), "payment_method"),
+    ],
+)
+def test_parse_order_rejects(data, message):
+    with pytest.raises(OrderError, match=message) as error:
+        parse_order(data)
+    assert error.value.status == 400
+
+
+def test_parse_order_limits_quantity():
+    parse_order(_order(items=[{"product_id": 1, "quantity": ORDER_MAX_QUANTITY}]))
+    items = [{"product_id": 1, "quantity": ORDER_MAX_QUANTITY}, {"product_id": 1, "quantity": 1}]
+    with pytest.raises(OrderError, match="over %d" % ORDER_MAX_QUANTITY):
+        parse_order(_order(items=items))
+
+
+def test_parse_order_limits_items():
+    items = [{"product_id": id, "quantity": 1} for id in range(1, ORDER_MAX_ITEMS + 1)]
+    parse_order(_order(items=items))
+    items.append({"product_id": ORDER_MAX_ITEMS + 1, "quantity": 1})
+    with pytest.raises(OrderError, match="Too many items"):
+        parse_order(_order(items=items))
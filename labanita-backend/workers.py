@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+from flask import g, jsonify
+
+
+# عدادات الطلبات للـ worker (process) الحالي. كل worker تحت gunicorn عنده نسخته،
+# والـ pid في الرد بيوضح أنهي worker اللي رد
+class RequestCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    # بتتنادي بعد الـ fork عشان كل worker يبدأ من الصفر
+    def reset(self):
+        with self._lock:
+            self.pid = os.getpid()
+            self.started_at = time.time()
+            self.requests = 0
+            self.in_flight = 0
+            self.by_status = {}  # "2xx" -> عدد
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, status_code):
+        key = "%dxx" % (status_code // 100)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.by_status[key] = self.by_status.get(key, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pid": self.pid,
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "by_status": dict(self.by_status),
+            }
+
+
+counters = RequestCounters()
+
+
+def init_app(app):
+    @app.before_request
+    def _count_start():
+        counters.started()
+        g.response_status = None
+
+    @app.after_request
+    def _count_status(response):
+        g.response_status = response.status_code
+        return response
+
+    # الـ teardown بيشتغل دايماً حتى لو حصل exception ومفيش after_request، فالـ in_flight مش هيفضل عالق
+    # (pop عشان الـ streaming بيعمل teardown تاني في آخر الرد ومش عايزين نعد الطلب مرتين)
+    @app.teardown_request
+    def _count_finish(exception=None):
+        if "response_status" in g:
+            counters.finished(g.pop("response_status") or 500)
+
+    # عدادات الـ worker اللي رد على الطلب ده
+    @app.route("/worker/stats", methods=["GET"])
+    def get_worker_stats():
+        return jsonify(counters.stats()), 200